@@ -1,14 +1,46 @@
-from flask import Flask, render_template, request, jsonify
-import requests
+import time
+_boot_started = time.perf_counter()
+
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, g
 import json
 import os
-from dotenv import load_dotenv
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import atexit
+import gc
+import importlib
+import itertools
 import re
+import socket
+import threading
+from inference import InferenceClient, CircuitBreaker, CircuitOpenError, UpstreamError
+from cache import GenerationCache, LRUCache, SQLiteCache, copy_content, make_cache_key
+from content import ContentResult, dumps_with_content
+from responses import COMPRESSIBLE_TYPES, StaticPage, encode_body, minify_html
+from mailer import DeliveryQueue
+from recipients import DigestSpool, RecipientRegistry, group_items, render_digest
+from local_inference import LocalBackend
+from batch import parse_topic_lines, run_batch
+from sections import SECTION_NAMES, parse_sections
+from fallback import render_fallback
+from singleflight import CoalesceTimeout, SingleFlight
+from ratelimit import AdaptiveRateLimiter, RateLimitedError, request_priority, PRIORITY_INTERACTIVE, PRIORITY_BATCH, PRIORITY_PREWARM
+from prewarm import Prewarmer
+from pipeline import StagedPipeline
+from routing import Router, parse_routes
+from semantic_cache import SemanticCache
+from validation import SectionRepairer, StreamValidator, validated_stream
+from prompts import PromptRegistry, TokenCounter, continuation
+from store import CONTENT_ID_RE, ContentStore
+from jobs import JobQueue, JobWorker
+import metrics
+from metrics import stage, FALLBACKS, GENERATIONS, OUTPUT_CHECKS, REQUEST_SECONDS
+
+startup = metrics.StartupTimer(_boot_started)
+startup.mark('imports')
 
-load_dotenv()
+# python-dotenv is only imported when there is a .env file to read
+if os.path.exists('.env') or os.path.exists(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')):
+    from dotenv import load_dotenv
+    load_dotenv()
 
 app = Flask(__name__)
 
@@ -17,224 +49,269 @@ GMAIL_USER = os.getenv('GMAIL_USER')
 GMAIL_PASSWORD = os.getenv('GMAIL_PASSWORD')
 RECIPIENT_EMAIL = os.getenv('RECIPIENT_EMAIL')
 
+# Subscribers with per-topic filters and immediate or digest delivery (see
+# recipients.py); without a file every email goes to RECIPIENT_EMAIL, which
+# may list several comma-separated addresses
+RECIPIENTS_FILE = os.getenv('RECIPIENTS_FILE')
+DIGEST_INTERVAL = float(os.getenv('DIGEST_INTERVAL', 3600))
+
+# SMTP server used by the background delivery queue (override for local testing)
+SMTP_HOST = os.getenv('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', 587))
+SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'true').lower() == 'true'
+EMAIL_SPOOL_DIR = os.getenv('EMAIL_SPOOL_DIR', 'spool/email')
+
 # Hugging Face API configuration
-HUGGINGFACE_API_URL = "https://api-inference.huggingface.co/models/"
+HUGGINGFACE_API_URL = os.getenv('HUGGINGFACE_API_URL', "https://api-inference.huggingface.co/models/")
 MODELS = {
     "text_generation": "gpt2",  # Free model for text generation
     "summarization": "facebook/bart-large-cnn"  # Free model for summarization
 }
 
-def generate_ai_content(topic, prompt_template):
-    """Generate content using Hugging Face free API"""
+# Sampling parameters sent with every text generation request
+GENERATION_PARAMETERS = {
+    "max_length": 1000,  # Increased for more detailed response
+    "temperature": 0.7,
+    "do_sample": True
+}
+
+# Prompts are compiled once and, when PROMPT_TOKEN_BUDGET is set, fitted into
+# that many tokens of the model's context by compacting and trimming
+# instructions (0, the default, sends templates unchanged). Counts use the
+# model's tokenizer when transformers is installed (PROMPT_TOKENIZER=estimate
+# skips it). Prompt/output token counts go to the ai_agent_tokens histogram,
+# and to the log with LOG_TOKEN_USAGE=true.
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', 0))
+PROMPT_TOKENIZER = os.getenv('PROMPT_TOKENIZER', 'model').lower()
+LOG_TOKEN_USAGE = os.getenv('LOG_TOKEN_USAGE', 'false').lower() == 'true'
+prompt_registry = PromptRegistry(
+    TokenCounter(MODELS['text_generation'], use_tokenizer=PROMPT_TOKENIZER == 'model'),
+    budget=PROMPT_TOKEN_BUDGET,
+    log_usage=LOG_TOKEN_USAGE,
+)
+
+# Upstream calls share a token bucket that slows down on 429s; callers queue
+# by priority (interactive, then batch, then prewarm) and fall back to the
+# template content when the wait would overrun their latency budget
+HF_RATE_LIMIT = float(os.getenv('HF_RATE_LIMIT', 2))
+rate_limiter = AdaptiveRateLimiter(
+    rate=HF_RATE_LIMIT,
+    burst=int(os.getenv('HF_RATE_BURST', 5)),
+    max_waiting=int(os.getenv('HF_QUEUE_SIZE', 100)),
+) if HF_RATE_LIMIT > 0 else None
+LATENCY_BUDGETS = {
+    PRIORITY_INTERACTIVE: float(os.getenv('INTERACTIVE_LATENCY_BUDGET', 15)),
+    PRIORITY_BATCH: float(os.getenv('BATCH_LATENCY_BUDGET', 120)),
+    PRIORITY_PREWARM: float(os.getenv('PREWARM_LATENCY_BUDGET', 0)),  # 0 = wait as long as needed
+}
+
+def build_inference_client(base_url):
+    """Keep-alive client for an HF-compatible API, with its own circuit breaker"""
+    return InferenceClient(
+        base_url,
+        token=os.getenv('HUGGINGFACE_TOKEN', ''),
+        pool_size=int(os.getenv('HF_POOL_SIZE', 10)),
+        connect_timeout=float(os.getenv('HF_CONNECT_TIMEOUT', 3.05)),
+        read_timeout=float(os.getenv('HF_READ_TIMEOUT', 30)),
+        max_retries=int(os.getenv('HF_MAX_RETRIES', 2)),
+        backoff_base=float(os.getenv('HF_BACKOFF_BASE', 0.5)),
+        backoff_max=float(os.getenv('HF_BACKOFF_MAX', 8)),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.getenv('HF_BREAKER_THRESHOLD', 5)),
+            reset_timeout=float(os.getenv('HF_BREAKER_RESET', 30)),
+        ),
+        limiter=rate_limiter,
+    )
+
+def build_local_backend():
+    return LocalBackend(
+        num_threads=int(os.getenv('LOCAL_NUM_THREADS', 0)) or None,
+        quantize=os.getenv('LOCAL_QUANTIZE', 'false').lower() == 'true',
+        max_batch_size=int(os.getenv('LOCAL_MAX_BATCH', 8)),
+        max_wait=float(os.getenv('LOCAL_BATCH_WAIT_MS', 20)) / 1000,
+    )
+
+# Shared keep-alive client so requests reuse pooled TCP/TLS connections
+inference_client = build_inference_client(HUGGINGFACE_API_URL)
+
+# Inference backend: "remote" calls the HF Inference API, "local" runs the
+# models on CPU in-process with transformers/torch
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'remote').lower()
+if INFERENCE_BACKEND == 'local':
+    inference_backend = build_local_backend()
+else:
+    inference_backend = inference_client
+
+# Multi-backend routing for text generation (see routing.py), e.g.
+# INFERENCE_ROUTES="gpt2*3, distilgpt2, local:distilgpt2". Replaces
+# INFERENCE_BACKEND: each call goes to the fastest healthy route and, with
+# HEDGE_REQUESTS, is duplicated to the runner-up once it takes longer than
+# the route's p95 (for at most HEDGE_MAX_RATIO of calls)
+INFERENCE_ROUTES = os.getenv('INFERENCE_ROUTES')
+inference_router = None
+if INFERENCE_ROUTES:
+    inference_router = Router(
+        parse_routes(INFERENCE_ROUTES, build_inference_client, build_local_backend, HUGGINGFACE_API_URL),
+        hedge=os.getenv('HEDGE_REQUESTS', 'true').lower() == 'true',
+        hedge_max_ratio=float(os.getenv('HEDGE_MAX_RATIO', 0.1)),
+        hedge_default_delay=float(os.getenv('HEDGE_DEFAULT_DELAY', 2)),
+        max_error_rate=float(os.getenv('ROUTE_MAX_ERROR_RATE', 0.5)),
+        cooldown=float(os.getenv('ROUTE_COOLDOWN', 30)),
+    )
+    inference_backend = inference_router
+
+# Generation cache: per-worker LRU, plus a SQLite tier shared by all
+# gunicorn workers when CACHE_DB_PATH is set
+CACHE_TTL = int(os.getenv('CACHE_TTL', 3600))
+CACHE_DB_PATH = os.getenv('CACHE_DB_PATH')
+generation_cache = GenerationCache(
+    LRUCache(
+        max_entries=int(os.getenv('CACHE_MAX_ENTRIES', 512)),
+        max_bytes=int(os.getenv('CACHE_MAX_BYTES', 16 * 1024 * 1024)),
+        ttl=CACHE_TTL,
+    ),
+    shared=SQLiteCache(CACHE_DB_PATH, ttl=CACHE_TTL) if CACHE_DB_PATH else None,
+)
+
+# Every generated result (fallbacks included) is kept in a SQLite store for
+# /history and /content/<id>. Stored results also survive restarts: a cache
+# miss reuses one up to STORE_REUSE_TTL seconds old before calling upstream.
+STORE_DB_PATH = os.getenv('STORE_DB_PATH', 'data/content.sqlite3')
+STORE_REUSE_TTL = int(os.getenv('STORE_REUSE_TTL', CACHE_TTL))
+content_store = None
+if STORE_DB_PATH:
+    content_store = ContentStore(
+        STORE_DB_PATH,
+        batch_size=int(os.getenv('STORE_BATCH_SIZE', 50)),
+        flush_interval=float(os.getenv('STORE_FLUSH_MS', 500)) / 1000,
+    )
+    atexit.register(content_store.stop)
+
+# Near-duplicate topics ("Black Hole", "black holes", "blackholes") share
+# cached content when their character n-gram vectors have a cosine similarity
+# of at least SEMANTIC_CACHE_THRESHOLD and the same words up to inflection or
+# spacing (needs numpy). Workers index each
+# other's results from the content store every SEMANTIC_SYNC_INTERVAL seconds.
+SEMANTIC_CACHE = os.getenv('SEMANTIC_CACHE', 'true').lower() == 'true'
+SEMANTIC_SYNC_INTERVAL = float(os.getenv('SEMANTIC_SYNC_INTERVAL', 30))
+semantic_cache = None
+if SEMANTIC_CACHE:
     try:
-        # Using a simple approach with Hugging Face's free inference API
-        headers = {"Authorization": f"Bearer {os.getenv('HUGGINGFACE_TOKEN', '')}"}
-        
-        # For free usage, we'll use a simple text generation approach
-        payload = {
-            "inputs": prompt_template.format(topic=topic),
-            "parameters": {
-                "max_length": 1000,  # Increased for more detailed response
-                "temperature": 0.7,
-                "do_sample": True
-            }
-        }
-        
-        response = requests.post(
-            f"{HUGGINGFACE_API_URL}{MODELS['text_generation']}",
-            headers=headers,
-            json=payload
+        semantic_cache = SemanticCache(
+            threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.9)),
+            capacity=int(os.getenv('SEMANTIC_CACHE_SIZE', 5000)),
         )
-        
-        if response.status_code == 200:
-            ai_response = response.json()[0]["generated_text"]
-            # Parse the AI response to extract different sections
-            return parse_ai_response(ai_response, topic)
-        else:
-            # Fallback to a simple template-based generation
-            return generate_fallback_content(topic)
-            
-    except Exception as e:
-        print(f"Error generating AI content: {e}")
-        return generate_fallback_content(topic)
+    except RuntimeError as e:
+        print(f"Semantic cache disabled: {e}")
+_semantic_sync = {'rowid': 0, 'synced_at': 0.0, 'lock': threading.Lock()}
 
-def parse_ai_response(ai_response, topic):
-    """Parse AI response to extract script, title, description, meta tags, and image prompts"""
-    try:
-        # Initialize content dictionary
-        content = {
-            'script': '',
-            'video_name': '',
-            'description': '',
-            'meta_tags': '',
-            'image_prompts': []
-        }
-        
-        # Split response into sections
-        sections = ai_response.split('---')
-        
-        for section in sections:
-            if '**1. Video Script' in section:
-                # Extract script
-                content['script'] = section.split('**1. Video Script')[1].strip()
-            elif '**3. YouTube Shorts Title' in section:
-                # Extract video name
-                content['video_name'] = section.split('**3. YouTube Shorts Title')[1].strip()
-            elif '**4. Video Description' in section:
-                # Extract description
-                content['description'] = section.split('**4. Video Description')[1].strip()
-            elif '**5. Meta Tags' in section:
-                # Extract meta tags
-                content['meta_tags'] = section.split('**5. Meta Tags')[1].strip()
-            elif '**2. AI Image Generation Prompts' in section:
-                # Extract image prompts
-                prompts_text = section.split('**2. AI Image Generation Prompts')[1].strip()
-                # Split into individual prompts (assuming they're separated by newlines)
-                prompts = [p.strip() for p in prompts_text.split('\n') if p.strip()]
-                content['image_prompts'] = prompts[:7]  # Take first 7 prompts
-        
-        # If any section is empty, use fallback content
-        if not all(content.values()):
-            return generate_fallback_content(topic)
-            
-        return content
-        
-    except Exception as e:
-        print(f"Error parsing AI response: {e}")
-        return generate_fallback_content(topic)
+# Concurrent requests for the same topic share one upstream call. With a
+# shared cache, workers also coordinate through lock files next to it.
+SINGLEFLIGHT_LOCK_DIR = os.getenv('SINGLEFLIGHT_LOCK_DIR') or (
+    os.path.join(os.path.dirname(CACHE_DB_PATH) or '.', 'locks') if CACHE_DB_PATH else None
+)
+singleflight = SingleFlight(
+    lock_dir=SINGLEFLIGHT_LOCK_DIR,
+    lock_timeout=float(os.getenv('SINGLEFLIGHT_LOCK_TIMEOUT', 60)),
+)
 
-def generate_fallback_content(topic):
-    """Fallback content generation when AI API fails"""
-    
-    # Video Script (2-3 minutes)
-    script = f"""
-🎬 **VIDEO SCRIPT: 5 Interesting and Unknown Facts About {topic}**
-
-[HOOK - First 10 seconds]
-Hey there! Did you know that {topic} has some secrets that will absolutely blow your mind? Stick around because you're about to discover 5 fascinating facts about {topic} that almost nobody knows!
-
-[FACT 1]
-Here's something incredible: {topic} has been around for much longer than you might think. Scientists have discovered evidence that suggests {topic} has been influencing our world for centuries, and the way it works is absolutely mind-bending. What's even more surprising is that most people use {topic} every single day without even realizing its true potential.
-
-[FACT 2]
-Get this: {topic} has some properties that scientists are still trying to fully understand. Recent research has revealed that {topic} behaves in ways that completely defy our expectations. It's like nature decided to play a trick on us, and the more we learn about {topic}, the more mysterious it becomes.
-
-[FACT 3]
-This next fact will change how you think about {topic} forever. Did you know that {topic} has played a crucial role in some of the most important discoveries in human history? Without {topic}, many of the things we take for granted today might never have been possible. It's literally been a game-changer throughout history.
-
-[FACT 4]
-Here's where it gets really interesting: {topic} has some hidden connections that most people never discover. The way it interacts with other elements in our world is absolutely fascinating, and once you understand these connections, you'll see {topic} in a completely new light.
-
-[FACT 5]
-And finally, the most mind-blowing fact of all: {topic} is still evolving and changing even today. Modern technology has given us new ways to understand and utilize {topic}, and what we're discovering now is just the beginning. The future of {topic} is going to be absolutely incredible!
-
-[OUTRO]
-If you found these facts about {topic} as fascinating as I do, make sure to hit that like button and follow for more amazing discoveries! There's always something new to learn, and I can't wait to share more incredible facts with you. Thanks for watching!
-"""
-    
-    # YouTube Shorts Title
-    video_name = f"5 Unknown Facts About {topic} That Will Shock You! 🤯"
-    
-    # Video Description
-    description = f"Discover 5 mind-blowing and lesser-known facts about {topic} that will completely change how you see the world! From ancient discoveries to modern breakthroughs, this video reveals secrets about {topic} that almost nobody knows. Follow for more amazing facts! 🔔"
-    
-    # Meta Tags / Hashtags
-    meta_tags = f"#shorts #{topic}facts #{topic}shorts #{topic}trivia #curiousfacts #didyouknow #amazingfacts #mindblowing #education #learning #viral #trending #youtubeshorts"
-    
-    # AI Image Generation Prompts (9:16 vertical aspect ratio)
-    # These will be generated by the AI based on the actual content
-    image_prompts = [
-        # INTRO IMAGE
-        f"Epic cinematic 9:16 vertical shot for YouTube Shorts intro: {topic} concept with dramatic golden hour lighting, mysterious fog swirling around, floating holographic text saying '5 Unknown Facts', scientific diagrams and formulas glowing in the background, professional photography style with shallow depth of field, high contrast, cinematic composition, trending on social media aesthetic, perfect for grabbing viewer attention in first 3 seconds",
-        
-        # FACT 1 IMAGE
-        f"Detailed 9:16 vertical illustration for fact 1: {topic} with ancient historical elements, vintage parchment texture background, detailed hand-drawn diagrams and maps, mystical atmosphere with glowing elements, historical accuracy, renaissance-style artwork, intricate details, warm sepia tones, professional illustration quality, perfect for educational content",
-        
-        # FACT 2 IMAGE
-        f"Modern laboratory setting 9:16 vertical shot: {topic} research equipment with clean white background, scientific instruments and microscopes, blue and white LED lighting, professional photography style, high-tech atmosphere, clean minimalist design, perfect for scientific content, trending aesthetic",
-        
-        # FACT 3 IMAGE
-        f"Timeline visualization 9:16 vertical format: {topic} development through history with chronological progression, modern infographic style, clean design, educational illustration, colorful timeline elements, professional graphic design, perfect for educational content, social media optimized",
-        
-        # FACT 4 IMAGE
-        f"Connection network visualization 9:16 vertical shot: {topic} with interconnected elements, neural network style graphics, flowing lines and connections, modern digital art style, vibrant colors, professional illustration, perfect for showing relationships and connections, trending design aesthetic",
-        
-        # FACT 5 IMAGE
-        f"Futuristic visualization 9:16 vertical shot: {topic} applications with sci-fi atmosphere, holographic displays floating in space, advanced technology elements, neon lighting effects, cutting-edge design, cyberpunk aesthetic, professional 3D rendering style, perfect for showing future possibilities",
-        
-        # OUTRO IMAGE
-        f"Engaging 9:16 vertical outro shot: {topic} concept with call-to-action elements, like and subscribe buttons floating, social media icons, vibrant colors, modern design, perfect for encouraging viewer engagement, trending YouTube Shorts aesthetic, professional graphic design, optimized for viewer retention"
-    ]
-    
-    return {
-        "script": script,
-        "video_name": video_name,
-        "description": description,
-        "meta_tags": meta_tags,
-        "image_prompts": image_prompts
-    }
-
-def send_email(content, topic):
-    """Send email with generated content"""
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = GMAIL_USER
-        msg['To'] = RECIPIENT_EMAIL
-        msg['Subject'] = f"AI Generated Content: {topic}"
-        
-        # Create email body
-        labels = ['INTRO', 'FACT 1', 'FACT 2', 'FACT 3', 'FACT 4', 'FACT 5', 'OUTRO']
-        body = f"""
-        Topic: {topic}
-        
-        🎬 VIDEO SCRIPT (2-3 minutes):
-        {content['script']}
-        
-        📺 YOUTUBE SHORTS CONTENT:
-        Video Title: {content['video_name']}
-        
-        Description:
-        {content['description']}
-        
-        Meta Tags: {content['meta_tags']}
-        
-        🖼️ AI IMAGE GENERATION PROMPTS (9:16 vertical):
-        {chr(10).join([f"{labels[i]}: {prompt}" for i, prompt in enumerate(content['image_prompts'])])}
-        
-        ---
-        Generated by AI Agent
-        """
-        
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Send email
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(GMAIL_USER, GMAIL_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(GMAIL_USER, RECIPIENT_EMAIL, text)
-        server.quit()
-        
-        return True
-    except Exception as e:
-        print(f"Error sending email: {e}")
-        return False
+# Generation mode: "single" asks the text-generation model for all five
+# sections at once; "staged" generates only the script and derives the rest
+# with the summarization model and extractive steps (see pipeline.py)
+GENERATION_MODE = os.getenv('GENERATION_MODE', 'single').lower()
+staged_pipeline = None
+if GENERATION_MODE == 'staged':
+    staged_pipeline = StagedPipeline(
+        inference_backend,
+        generation_cache,
+        MODELS,
+        GENERATION_PARAMETERS,
+        fallback=render_fallback,
+        prompts=prompt_registry,
+        max_workers=int(os.getenv('PIPELINE_WORKERS', 4)),
+    )
 
-@app.route('/')
-def index():
-    return render_template('index.html')
+# Output is checked while it streams in (see validation.py): generation stops
+# once all five sections are in, or as soon as the output is malformed (no
+# section headers, a section starting over, a looping line). Up to
+# REPAIR_MAX_SECTIONS missing sections are then regenerated alone with short
+# targeted prompts rather than replacing everything with the fallback.
+# Hedged requests need whole responses, so with HEDGE_REQUESTS routing (or
+# EARLY_ABORT=false) /generate checks the output after it has arrived.
+EARLY_ABORT = os.getenv('EARLY_ABORT', 'true').lower() == 'true'
+STREAM_GENERATION = EARLY_ABORT and not (inference_router is not None and inference_router.hedge)
+REPAIR_MAX_SECTIONS = int(os.getenv('REPAIR_MAX_SECTIONS', 3))
+section_repairer = None
+if REPAIR_MAX_SECTIONS:
+    section_repairer = SectionRepairer(
+        inference_backend,
+        MODELS['text_generation'],
+        GENERATION_PARAMETERS,
+        prompt_registry,
+        stream=STREAM_GENERATION,
+        max_workers=int(os.getenv('REPAIR_WORKERS', 4)),
+    )
 
-@app.route('/generate', methods=['POST'])
-def generate_content():
-    try:
-        data = request.get_json()
-        topic = data.get('topic', '').strip()
-        
-        if not topic:
-            return jsonify({'error': 'Topic is required'}), 400
-        
-        # Your predefined prompt template
-        prompt_template = """
+# Email is spooled to disk and sent by a background thread over one
+# persistent SMTP session instead of blocking the request
+delivery_queue = DeliveryQueue(
+    EMAIL_SPOOL_DIR,
+    SMTP_HOST,
+    SMTP_PORT,
+    username=GMAIL_USER,
+    password=GMAIL_PASSWORD,
+    use_starttls=SMTP_STARTTLS,
+    batch_size=int(os.getenv('EMAIL_BATCH_SIZE', 20)),
+    max_attempts=int(os.getenv('EMAIL_MAX_ATTEMPTS', 5)),
+    backoff_base=float(os.getenv('EMAIL_BACKOFF_BASE', 30)),
+)
+
+recipient_registry = RecipientRegistry.from_config(RECIPIENTS_FILE, RECIPIENT_EMAIL)
+digest_spool = DigestSpool(os.path.join(EMAIL_SPOOL_DIR, 'digest'), delivery_queue, interval=DIGEST_INTERVAL)
+
+startup.mark('services')
+
+# Bulk generation limits for /generate/batch and batch.py
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 4))
+BATCH_MAX_TOPICS = int(os.getenv('BATCH_MAX_TOPICS', 500))
+
+# Async jobs (POST /jobs) are rows in a SQLite queue shared by the web and
+# worker processes (see jobs.py). Workers run apart from the web server
+# ("python jobs.py", the Procfile's worker); JOB_WORKERS also runs that many
+# job threads inside each web process, for single-process deployments.
+JOBS_DB_PATH = os.getenv('JOBS_DB_PATH', 'data/jobs.sqlite3')
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 0))
+JOB_MAX_QUEUED = int(os.getenv('JOB_MAX_QUEUED', 1000))
+JOB_LONG_POLL_MAX = float(os.getenv('JOB_LONG_POLL_MAX', 30))
+job_queue = JobQueue(
+    JOBS_DB_PATH,
+    lease_seconds=float(os.getenv('JOB_LEASE_SECONDS', 300)),
+    max_attempts=int(os.getenv('JOB_MAX_ATTEMPTS', 3)),
+    backoff_base=float(os.getenv('JOB_BACKOFF_BASE', 10)),
+    retention=float(os.getenv('JOB_RETENTION', 7 * 86400)),
+)
+job_worker = None
+
+# Prewarming: generate a published topic feed (file or URL) during an
+# off-peak window so /generate serves it from the cache, and keep the
+# text-generation model loaded ahead of peak traffic
+PREWARM_FEED = os.getenv('PREWARM_FEED')
+PREWARM_WINDOW = os.getenv('PREWARM_WINDOW', '02:00-06:00')
+PREWARM_RATE = float(os.getenv('PREWARM_RATE', 6))
+PREWARM_TTL = int(os.getenv('PREWARM_TTL', 86400))
+PREWARM_FEED_INTERVAL = float(os.getenv('PREWARM_FEED_INTERVAL', 3600))
+PREWARM_WARMUP_INTERVAL = float(os.getenv('PREWARM_WARMUP_INTERVAL', 0))
+
+# HTTP: gzip/brotli for JSON and HTML bodies of at least COMPRESS_MIN_BYTES,
+# and how long browsers and proxies may reuse GET /content?topic= and the
+# index page (both also answer If-None-Match with 304)
+COMPRESS_RESPONSES = os.getenv('COMPRESS_RESPONSES', 'true').lower() == 'true'
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', 1024))
+CONTENT_MAX_AGE = int(os.getenv('CONTENT_MAX_AGE', min(300, CACHE_TTL)))
+INDEX_MAX_AGE = int(os.getenv('INDEX_MAX_AGE', 300))
+
+# Your predefined prompt template
+PROMPT_TEMPLATE = """
         You are a creative content producer making highly engaging YouTube Shorts with a duration of 2 to 3 minutes.
 
         Your goal is to create a script titled **"5 Interesting and Unknown Facts About {topic}"** that educates, surprises, and entertains the viewer.
@@ -295,26 +372,908 @@ def generate_content():
 
         🔁 Repeat the format above for **every new topic** I give you. Always keep the **script length appropriate for a 2–3 minute video** when read at a normal pace (approx. 250–400 words total).
         """
+
+def content_cache_key(topic, prompt_template):
+    """Cache key for a topic's assembled content in the current generation mode"""
+    if staged_pipeline is not None:
+        # Covers every stage's recipe; unchanged stages still hit their own cache
+        return make_cache_key(topic, 'staged', staged_pipeline.fingerprint(), GENERATION_PARAMETERS)
+    return make_cache_key(topic, MODELS['text_generation'], prompt_registry.fingerprint(prompt_template),
+                          GENERATION_PARAMETERS)
+
+def remember_topic(topic, cache_key):
+    """Make freshly cached content findable by near-duplicate topics"""
+    if semantic_cache is not None:
+        semantic_cache.add(topic, cache_key)
+
+def sync_semantic_cache():
+    """Index results other workers have stored since the last sync"""
+    if content_store is None or time.monotonic() - _semantic_sync['synced_at'] < SEMANTIC_SYNC_INTERVAL:
+        return
+    if not _semantic_sync['lock'].acquire(blocking=False):
+        return  # another thread is syncing
+    try:
+        for rowid, topic, cache_key in content_store.cached_topics(_semantic_sync['rowid'], CACHE_TTL):
+            semantic_cache.add(topic, cache_key)
+            _semantic_sync['rowid'] = rowid
+        _semantic_sync['synced_at'] = time.monotonic()
+    except Exception as e:
+        print(f"Error syncing semantic cache: {e}")
+    finally:
+        _semantic_sync['lock'].release()
+
+def find_similar_content(topic, prompt_template, cache_key, cache_ttl=None):
+    """Cached content of a near-duplicate topic (re-cached under this topic's key), or None"""
+    if semantic_cache is None:
+        return None
+    with stage('semantic_lookup'):
+        sync_semantic_cache()
+        for similarity, key, similar_topic in semantic_cache.lookup(topic):
+            # Keys from an older prompt, model or mode are stale, not similar
+            if key == cache_key or key != content_cache_key(similar_topic, prompt_template):
+                semantic_cache.discard(key)
+                continue
+            cached = generation_cache.get(key)
+            if cached is None:
+                semantic_cache.discard(key)
+                continue
+            generation_cache.set(cache_key, cached, cache_ttl)
+            return cached
+    return None
+
+def generate_ai_content(topic, prompt_template, bypass_cache=False, cache_ttl=None,
+                        priority=PRIORITY_INTERACTIVE):
+    """Generate content, serving repeat topics from the generation cache"""
+    cache_key = content_cache_key(topic, prompt_template)
+
+    if not bypass_cache:
+        with stage('cache_lookup'):
+            cached = generation_cache.get(cache_key)
+        if cached is not None:
+            GENERATIONS.inc('cache')
+            return cached
+        similar = find_similar_content(topic, prompt_template, cache_key, cache_ttl)
+        if similar is not None:
+            GENERATIONS.inc('semantic')
+            return similar
+
+    def generate():
+        """Returns (content or None, source); runs once per key across callers"""
+        if content_store is not None and not bypass_cache:
+            stored = content_store.find_reusable(cache_key, STORE_REUSE_TTL)
+            if stored is not None:
+                generation_cache.set(cache_key, stored, cache_ttl)
+                remember_topic(topic, cache_key)
+                return stored, 'store'
+
+        with request_priority(priority, LATENCY_BUDGETS[priority]):
+            if staged_pipeline is not None:
+                content, complete = request_staged_content(topic, bypass_cache, cache_ttl)
+            else:
+                content, complete = request_ai_content(topic, prompt_template)
+        if complete:
+            generation_cache.set(cache_key, content, cache_ttl)
+            remember_topic(topic, cache_key)
+        record_result(topic, content or generate_fallback_content(topic), cache_key, is_fallback=not complete)
+        return content, 'upstream'
+
+    def recheck():
+        # Another worker may have produced this key while we waited for its lock
+        cached = generation_cache.get(cache_key)
+        return (cached, 'cache') if cached is not None else None
+
+    if bypass_cache:
+        # A forced regeneration neither joins cached callers nor hands them its result
+        content, source = generate()
+    else:
+        try:
+            # The leader may run at a lower priority; don't wait past this caller's own budget
+            content, source = singleflight.do(cache_key, generate, recheck=recheck,
+                                              timeout=LATENCY_BUDGETS[priority] or None)
+        except CoalesceTimeout as e:
+            FALLBACKS.inc('coalesce_timeout')
+            print(f"Using fallback: {e}")
+            content = None
+    if content is None:
+        # Fallback output is never cached so the next request retries the API
+        GENERATIONS.inc('fallback')
+        return generate_fallback_content(topic)
+
+    GENERATIONS.inc(source)
+    # Coalesced callers share the leader's result; give each its own copy
+    return copy_content(content)
+
+def record_result(topic, content, cache_key, is_fallback=False):
+    """Queue a result for the content store; returns its id, or None"""
+    if content_store is None:
+        return None
+    try:
+        return content_store.record(topic, content, MODELS['text_generation'], is_fallback, cache_key)
+    except Exception as e:
+        print(f"Error recording content: {e}")
+        return None
+
+def request_ai_content(topic, prompt_template):
+    """Generate content using Hugging Face free API; returns (content or None, complete)"""
+    try:
+        with stage('prompt'):
+            prompt = prompt_registry.build(prompt_template, topic)
+        validator = StreamValidator()
+        # Raises CircuitOpenError straight away while the upstream is down.
+        # Sections are parsed as the text arrives, and reading stops as soon
+        # as the output is complete or clearly malformed.
+        with stage('upstream'):
+            if STREAM_GENERATION:
+                chunks = inference_backend.stream_text(MODELS['text_generation'], prompt.text, GENERATION_PARAMETERS)
+            else:
+                chunks = [continuation(prompt, inference_backend.generate_text(
+                    MODELS['text_generation'],
+                    prompt.text,
+                    GENERATION_PARAMETERS
+                ))]
+            for _ in validated_stream(chunks, validator):
+                pass
+        prompt_registry.record(prompt, validator.text, topic)
+        return complete_sections(topic, validator)
+
+    except CircuitOpenError as e:
+        FALLBACKS.inc('circuit_open')
+        return None, False
+    except RateLimitedError as e:
+        FALLBACKS.inc('rate_limited')
+        print(f"Upstream queue too long, using fallback: {e}")
+        return None, False
+    except UpstreamError as e:
+        FALLBACKS.inc('upstream_error')
+        print(f"AI API unavailable, using fallback: {e}")
+        return None, False
+    except Exception as e:
+        FALLBACKS.inc('error')
+        print(f"Error generating AI content: {e}")
+        return None, False
+
+def complete_sections(topic, validator):
+    """Validated output with its missing sections regenerated; returns (content or None, complete)
+
+    Sections that still didn't come out are filled from the fallback
+    content, which makes the result incomplete: it is marked is_fallback,
+    recorded but not cached, and served with no-store. Output missing more
+    than REPAIR_MAX_SECTIONS sections is not patched up.
+    """
+    OUTPUT_CHECKS.inc(validator.verdict)
+    content = dict(validator.content)
+    missing = validator.missing()
+    if not missing:
+        return ContentResult.from_dict(content), True
+    if section_repairer is None or len(missing) > REPAIR_MAX_SECTIONS:
+        FALLBACKS.inc('incomplete')
+        return None, False
+
+    print(f"Output for {topic} was {validator.verdict}, regenerating {', '.join(missing)}")
+    with stage('repair'):
+        content.update(section_repairer.repair(topic, missing))
+    missing = [name for name in missing if not content[name]]
+    if not missing:
+        return ContentResult.from_dict(content), True
+    FALLBACKS.inc('partial')
+    fallback = generate_fallback_content(topic)
+    for name in missing:
+        content[name] = fallback[name]
+    return ContentResult.from_dict(content, is_fallback=True), False
+
+def request_staged_content(topic, bypass_cache=False, cache_ttl=None):
+    """Run the staged pipeline; returns (content or None, complete)"""
+    try:
+        content, complete = staged_pipeline.run(topic, bypass_cache=bypass_cache, ttl=cache_ttl)
+        if content is None:
+            FALLBACKS.inc('incomplete')
+        return content, complete
+
+    except CircuitOpenError as e:
+        FALLBACKS.inc('circuit_open')
+        return None, False
+    except RateLimitedError as e:
+        FALLBACKS.inc('rate_limited')
+        print(f"Upstream queue too long, using fallback: {e}")
+        return None, False
+    except UpstreamError as e:
+        FALLBACKS.inc('upstream_error')
+        print(f"AI API unavailable, using fallback: {e}")
+        return None, False
+    except Exception as e:
+        FALLBACKS.inc('error')
+        print(f"Error generating staged content: {e}")
+        return None, False
+
+def stream_ai_content(topic, prompt_template, bypass_cache=False):
+    """Yield ('token', text) and ('section', (name, value)) while generating,
+    then ('content', (content, is_fallback))"""
+    if staged_pipeline is not None:
+        # Stages finish as a whole, so there are no tokens to stream
+        content = generate_ai_content(topic, prompt_template, bypass_cache=bypass_cache)
+        yield 'content', (content, content.is_fallback)
+        return
+
+    cache_key = content_cache_key(topic, prompt_template)
+
+    if not bypass_cache:
+        cached = generation_cache.get(cache_key)
+        if cached is None:
+            cached = find_similar_content(topic, prompt_template, cache_key)
+            if cached is not None:
+                GENERATIONS.inc('semantic')
+        else:
+            GENERATIONS.inc('cache')
+        if cached is not None:
+            yield 'content', (cached, False)
+            return
+
+    with stage('prompt'):
+        prompt = prompt_registry.build(prompt_template, topic)
+    validator = StreamValidator()
+    budget = LATENCY_BUDGETS[PRIORITY_INTERACTIVE]
+    try:
+        with request_priority(PRIORITY_INTERACTIVE, budget):
+            events = validated_stream(
+                inference_backend.stream_text(MODELS['text_generation'], prompt.text, GENERATION_PARAMETERS),
+                validator)
+            # The generator runs lazily; start it (and its upstream call) under the budget
+            first = next(events, None)
+        # Stops, and drops the upstream stream, once the output is complete or malformed
+        yield from itertools.chain([first] if first is not None else [], events)
+        prompt_registry.record(prompt, validator.text, topic)
+
+        # Missing sections are regenerated; the route sends any that changed
+        with request_priority(PRIORITY_INTERACTIVE, budget):
+            content, complete = complete_sections(topic, validator)
+        if content is not None:
+            if complete:
+                generation_cache.set(cache_key, content)
+                remember_topic(topic, cache_key)
+            record_result(topic, content, cache_key, is_fallback=not complete)
+            GENERATIONS.inc('upstream')
+            yield 'content', (content, content.is_fallback)
+            return
+
+    except UpstreamError as e:
+        FALLBACKS.inc('circuit_open' if isinstance(e, CircuitOpenError)
+                      else 'rate_limited' if isinstance(e, RateLimitedError) else 'upstream_error')
+        print(f"AI API unavailable, using fallback: {e}")
+    except Exception as e:
+        FALLBACKS.inc('error')
+        print(f"Error streaming AI content: {e}")
+
+    GENERATIONS.inc('fallback')
+    content = generate_fallback_content(topic)
+    record_result(topic, content, cache_key, is_fallback=True)
+    yield 'content', (content, True)
+
+def parse_ai_response(ai_response, topic):
+    """Parse AI response to extract script, title, description, meta tags, and image prompts"""
+    try:
+        content = parse_sections(ai_response)
+
+        # If any section is empty, use fallback content
+        if not all(content.values()):
+            return generate_fallback_content(topic)
+
+        return ContentResult.from_dict(content)
+
+    except Exception as e:
+        print(f"Error parsing AI response: {e}")
+        return generate_fallback_content(topic)
+
+def generate_fallback_content(topic):
+    """Fallback content generation when AI API fails"""
+    with stage('fallback'):
+        return render_fallback(topic)
+
+def build_email_body(content, topic):
+    """Render the plain-text email body for generated content"""
+    return ContentResult.from_dict(content).email_body(topic)
+
+def send_digest_email(results):
+    """Queue the batch's digest emails, one per group of subscribers; returns the delivery ids"""
+    results = sorted((r for r in results if 'content' in r), key=lambda r: r['index'])
+    if not results:
+        return []
+    if not (GMAIL_USER and recipient_registry):
+        print("Email not configured, skipping delivery")
+        return []
+    # Each topic's section is rendered once, whoever it goes to
+    items = [{'topic': r['topic'], 'body': build_email_body(r['content'], r['topic'])} for r in results]
+    delivery_ids = []
+    try:
+        for group, emails in group_items(items, lambda item: [r.email for r in recipient_registry.match(item['topic'])]):
+            delivery_ids.append(delivery_queue.enqueue(
+                emails,
+                f"AI Generated Content: {len(group)} topics",
+                render_digest(group)
+            ))
+    except Exception as e:
+        print(f"Error queueing digest email: {e}")
+    return delivery_ids
+
+def send_email(content, topic, queue=None):
+    """Queue one email to the topic's subscribers; returns the delivery id or None
+
+    Digest subscribers get the topic in their next periodic digest instead.
+    """
+    if not (GMAIL_USER and recipient_registry):
+        print("Email not configured, skipping delivery")
+        return None
+    subscribers = recipient_registry.match(topic)
+    if not subscribers:
+        return None
+    try:
+        with stage('email_enqueue'):
+            # Rendered once however many recipients there are
+            body = build_email_body(content, topic)
+            digest = [r.email for r in subscribers if r.mode == 'digest']
+            if digest:
+                digest_spool.add(topic, body, digest)
+            immediate = [r.email for r in subscribers if r.mode == 'immediate']
+            if not immediate:
+                return None
+            return (queue or delivery_queue).enqueue(
+                immediate,
+                f"AI Generated Content: {topic}",
+                body
+            )
+    except Exception as e:
+        print(f"Error queueing email: {e}")
+        return None
+
+def run_job(job, progress):
+    """Generate and email one queued job; returns its result as JSON"""
+    topic, options = job['topic'], job['options']
+    progress('generating')
+    # Nobody is waiting on the request, so take the batch latency budget
+    content = generate_ai_content(topic, PROMPT_TEMPLATE, bypass_cache=bool(options.get('bypass_cache')),
+                                  priority=PRIORITY_BATCH)
+    if content.is_fallback and job['attempts'] < job_queue.max_attempts:
+        # Retried with backoff; the last attempt finishes with the (flagged) template content
+        raise UpstreamError(f"Only fallback content could be generated for {topic}")
+    delivery_id = None
+    if options.get('email', True):
+        progress('emailing')
+        delivery_id = send_email(content, topic)
+    return dumps_with_content({
+        'success': True,
+        'fallback': content.is_fallback,
+        'content': content,
+        'email_queued': delivery_id is not None,
+        'delivery_id': delivery_id
+    })
+
+def build_job_worker(threads):
+    """Job threads for this process (jobs.py worker processes, or JOB_WORKERS)"""
+    return JobWorker(job_queue, run_job, threads=threads,
+                     poll_interval=float(os.getenv('JOB_POLL_INTERVAL', 1)))
+
+def warm_models():
+    """Make sure the text-generation model is loaded before traffic needs it"""
+    inference_backend.warm(MODELS['text_generation'])
+
+def build_prewarmer(feed, rate=None, ttl=None, warm=True):
+    """Prewarmer that feeds topics through generate_ai_content into the cache"""
+    def is_cached(topic):
+        return generation_cache.get(content_cache_key(topic, PROMPT_TEMPLATE)) is not None
+
+    return Prewarmer(
+        feed,
+        generate=lambda topic: generate_ai_content(topic, PROMPT_TEMPLATE, cache_ttl=ttl or PREWARM_TTL,
+                                                   priority=PRIORITY_PREWARM),
+        is_cached=is_cached,
+        warm=warm_models if warm else None,
+        window=PREWARM_WINDOW or None,
+        rate=rate or PREWARM_RATE,
+        feed_interval=PREWARM_FEED_INTERVAL,
+        warm_interval=PREWARM_WARMUP_INTERVAL,
+        # Only one gunicorn worker prewarms at a time
+        lock_path=os.path.join(SINGLEFLIGHT_LOCK_DIR or os.path.dirname(os.path.abspath(EMAIL_SPOOL_DIR)), 'prewarm.lock'),
+        breaker=inference_client.breaker if INFERENCE_BACKEND == 'remote' and inference_router is None else None,
+    )
+
+prewarmer = None
+if PREWARM_FEED or PREWARM_WARMUP_INTERVAL:
+    prewarmer = build_prewarmer(PREWARM_FEED)
+
+# Modules that are imported on first use. A preloaded gunicorn master
+# imports them once so the workers inherit them instead.
+DEFERRED_IMPORTS = ('requests', 'smtplib', 'email.mime.multipart', 'email.mime.text')
+
+# Load the local models in the gunicorn master when preloading, so workers
+# share their weights copy-on-write instead of each loading its own copy
+PRELOAD_MODELS = os.getenv('PRELOAD_MODELS', 'true').lower() == 'true'
+
+_background_pid = None
+_preloaded = False
+
+def start_background(deliver=True):
+    """Start this process's background threads: email delivery, digests, prewarming and jobs
+
+    Threads don't survive a fork, so this runs in each worker (gunicorn's
+    post_fork hook, or the first request), never in a preloading master.
+    """
+    global _background_pid, job_worker
+    if _background_pid == os.getpid():
+        return
+    _background_pid = os.getpid()
+    if deliver:
+        # Picks up anything left in the spool by a previous run
+        delivery_queue.start()
+    digest_spool.start()
+    if prewarmer is not None:
+        prewarmer.start()
+    if JOB_WORKERS:
+        job_worker = job_worker or build_job_worker(JOB_WORKERS)
+        job_worker.start()
+
+def preload():
+    """Do the per-worker first-use work once, in the gunicorn master before it forks"""
+    global _preloaded
+    if _preloaded:
+        return
+    _preloaded = True
+    for name in DEFERRED_IMPORTS:
+        importlib.import_module(name)
+    startup.mark('deferred_imports')
+    if PRELOAD_MODELS and hasattr(inference_backend, 'preload'):
+        inference_backend.preload(MODELS)
+        startup.mark('models')
+    # Loads the tokenizer and measures the templates once for every worker;
+    # a process that skips preload() counts tokens with the estimate
+    prompt_registry.counter.load()
+    prompt_registry.get(PROMPT_TEMPLATE)
+    if staged_pipeline is not None:
+        prompt_registry.get(staged_pipeline.script_prompt)
+    startup.mark('prompts')
+    # Move everything loaded so far out of the collector's reach: its passes
+    # in the workers would otherwise write to, and un-share, those pages
+    gc.freeze()
+    print(f"Preloaded for workers: {startup.summary()}")
+
+def create_app():
+    """WSGI entry point for gunicorn ("app:create_app()")
+
+    Configuration, caches and routes are set up when this module is
+    imported; heavier dependencies load on first use, or in the master via
+    preload(). Background threads start per worker (start_background()).
+    """
+    print(f"Startup: {startup.summary()}")
+    return app
+
+# The page has no per-request state: render, minify and compress it once
+with app.app_context():
+    INDEX_PAGE = StaticPage(minify_html(render_template('index.html')))
+
+def add_vary(response, header):
+    vary = [v for v in (h.strip() for h in response.headers.get('Vary', '').split(',')) if v]
+    if header not in vary:
+        response.headers['Vary'] = ', '.join(vary + [header])
+
+startup.mark('index')
+
+@app.route('/')
+def index():
+    encoding, body = INDEX_PAGE.encoded(request.headers.get('Accept-Encoding') if COMPRESS_RESPONSES else None)
+    response = Response(body, mimetype='text/html')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    add_vary(response, 'Accept-Encoding')
+    response.set_etag(INDEX_PAGE.etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = INDEX_MAX_AGE
+    return response.make_conditional(request)
+
+@app.route('/generate', methods=['POST'])
+def generate_content():
+    try:
+        data = request.get_json()
+        topic = data.get('topic', '').strip()
+        bypass_cache = bool(data.get('bypass_cache', False))
+        
+        if not topic:
+            return jsonify({'error': 'Topic is required'}), 400
+        
         
         # Generate content
-        content = generate_ai_content(topic, prompt_template)
+        content = generate_ai_content(topic, PROMPT_TEMPLATE, bypass_cache=bypass_cache)
         
-        # Send email
-        email_sent = send_email(content, topic)
+        # Queue email; delivery happens in the background
+        delivery_id = send_email(content, topic)
         
-        return jsonify({
+        # The content's JSON is rendered once and reused, not re-encoded per response
+        return Response(dumps_with_content({
             'success': True,
             'content': content,
-            'email_sent': email_sent,
-            'message': 'Content generated and email sent successfully!'
-        })
+            'email_queued': delivery_id is not None,
+            'delivery_id': delivery_id,
+            'message': 'Content generated and email queued for delivery!'
+        }), mimetype='application/json')
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/content')
+def content_by_topic():
+    """Idempotent, cacheable generation: no email, and an ETag on the content hash"""
+    topic = request.args.get('topic', '').strip()
+    if not topic:
+        return jsonify({'error': 'Topic is required'}), 400
+
+    content = generate_ai_content(topic, PROMPT_TEMPLATE)
+    response = Response(dumps_with_content({
+        'success': True,
+        'fallback': content.is_fallback,
+        'content': content
+    }), mimetype='application/json')
+    if content.is_fallback:
+        # Fallbacks aren't cached here either; the next request retries the API
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    response.set_etag(content.etag())
+    response.cache_control.public = True
+    response.cache_control.max_age = CONTENT_MAX_AGE
+    return response.make_conditional(request)
+
+@app.route('/generate/batch', methods=['POST'])
+def generate_batch():
+    """Generate many topics with bounded concurrency, streaming NDJSON results"""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl', 'text/plain'):
+        topics = parse_topic_lines(request.get_data(as_text=True).splitlines())
+        options = request.args
+    else:
+        options = request.get_json(silent=True) or {}
+        topics = [t for t in options.get('topics', []) if isinstance(t, str)]
+
+    if not topics:
+        return jsonify({'error': 'At least one topic is required'}), 400
+    if len(topics) > BATCH_MAX_TOPICS:
+        return jsonify({'error': f'At most {BATCH_MAX_TOPICS} topics per batch'}), 400
+
+    bypass_cache = str(options.get('bypass_cache', '')).lower() in ('1', 'true')
+    send_digest = str(options.get('email', 'true')).lower() not in ('0', 'false')
+    concurrency = min(int(options.get('concurrency', BATCH_CONCURRENCY)), BATCH_CONCURRENCY)
+
+    def generate(topic):
+        return generate_ai_content(topic, PROMPT_TEMPLATE, bypass_cache=bypass_cache, priority=PRIORITY_BATCH)
+
+    def lines():
+        results = []
+        for result in run_batch(topics, generate, concurrency):
+            results.append(result)
+            yield dumps_with_content(result) + '\n'
+
+        # One digest email per batch instead of one SMTP session per topic
+        delivery_ids = send_digest_email(results) if send_digest else []
+        yield json.dumps({
+            'done': True,
+            'count': len(results),
+            'email_queued': bool(delivery_ids),
+            'delivery_id': delivery_ids[0] if delivery_ids else None,
+            'delivery_ids': delivery_ids
+        }) + '\n'
+
+    return Response(stream_with_context(lines()), mimetype='application/x-ndjson')
+
+def sse_event(event, data):
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def content_events(topic, bypass_cache=False, send=None):
+    """Server-sent events for /generate/stream: tokens, then each parsed section, then done
+
+    send spools the email (send_email by default).
+    """
+    try:
+        # Flush headers straight away so the client sees the first byte
+        yield ': stream open\n\n'
+
+        content, is_fallback = None, False
+        sent = {}
+        for kind, payload in stream_ai_content(topic, PROMPT_TEMPLATE, bypass_cache=bypass_cache):
+            if kind == 'token':
+                yield sse_event('token', {'text': payload})
+            elif kind == 'section':
+                name, value = payload
+                # Results hold image prompts as a tuple; compare like with like
+                sent[name] = tuple(value) if isinstance(value, list) else value
+                yield sse_event('section', {'name': name, 'value': value})
+            else:
+                content, is_fallback = payload
+
+        # Settle any section that wasn't streamed or changed in the final result
+        for name in SECTION_NAMES:
+            if sent.get(name) != content[name]:
+                yield sse_event('section', {'name': name, 'value': content[name]})
+
+        delivery_id = (send or send_email)(content, topic)
+        yield sse_event('done', {
+            'success': True,
+            'fallback': is_fallback,
+            'email_queued': delivery_id is not None,
+            'delivery_id': delivery_id
+        })
+    except Exception as e:
+        yield sse_event('error', {'error': str(e)})
+
+@app.route('/generate/stream', methods=['GET', 'POST'])
+def generate_stream():
+    """Stream generated tokens, then each parsed section, as server-sent events"""
+    data = request.get_json(silent=True) or request.args
+    topic = (data.get('topic') or '').strip()
+    bypass_cache = str(data.get('bypass_cache', '')).lower() in ('1', 'true')
+
+    if not topic:
+        return jsonify({'error': 'Topic is required'}), 400
+
+    return Response(
+        stream_with_context(content_events(topic, bypass_cache)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def submit_job(data):
+    """Queue a generation job from a POST /jobs body; returns (body, status)"""
+    topic = (data.get('topic') or '').strip()
+    if not topic:
+        return {'error': 'Topic is required'}, 400
+    if job_queue.queued_count() >= JOB_MAX_QUEUED:
+        return {'error': 'Too many queued jobs, try again later'}, 503
+    job_id = job_queue.enqueue(topic, {
+        'bypass_cache': str(data.get('bypass_cache', '')).lower() in ('1', 'true'),
+        'email': str(data.get('email', 'true')).lower() not in ('0', 'false'),
+    })
+    return {
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': f'/jobs/{job_id}',
+        'events_url': f'/jobs/{job_id}/events'
+    }, 202
+
+def job_status(job_id, args):
+    """A job's state for GET /jobs/<id>; returns (body, status)
+
+    ?wait=N holds the request up to N seconds until the job finishes or,
+    with ?version=V, until it moves past version V.
+    """
+    try:
+        wait = min(max(float(args.get('wait', 0)), 0.0), JOB_LONG_POLL_MAX)
+        version = int(args['version']) if args.get('version') else None
+    except ValueError:
+        return {'error': 'wait and version must be numbers'}, 400
+    job = job_queue.wait(job_id, version, wait) if wait else job_queue.get(job_id)
+    if job is None:
+        return {'error': 'Unknown job id'}, 404
+    return job, 200
+
+def job_events(job_id, heartbeat=15.0):
+    """Server-sent events for a job: 'progress' on every change, then 'done' or 'error'"""
+    version = None
+    while True:
+        job = job_queue.get(job_id) if version is None else job_queue.wait(job_id, version, heartbeat)
+        if job is None:
+            yield sse_event('error', {'error': 'Unknown job id'})
+            return
+        if job['version'] == version:
+            yield ': keep-alive\n\n'
+            continue
+        version = job['version']
+        if job['status'] == 'done':
+            yield sse_event('done', job)
+            return
+        if job['status'] == 'failed':
+            yield sse_event('error', job)
+            return
+        yield sse_event('progress', {k: job[k] for k in ('status', 'stage', 'attempts', 'version', 'position')
+                                     if k in job})
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue a topic for the job workers and answer straight away"""
+    body, status = submit_job(request.get_json(silent=True) or {})
+    response = jsonify(body)
+    response.status_code = status
+    if status == 202:
+        response.headers['Location'] = body['status_url']
+    return response
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    body, status = job_status(job_id, request.args)
+    return jsonify(body), status
+
+@app.route('/jobs/<job_id>/events')
+def stream_job(job_id):
+    if job_queue.get(job_id) is None:
+        return jsonify({'error': 'Unknown job id'}), 404
+    return Response(
+        stream_with_context(job_events(job_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def history_page(args):
+    """Look up a /history page from query args (any mapping); returns (body, status)"""
+    if content_store is None:
+        return {'error': 'Content store is disabled'}, 404
+    try:
+        limit = min(max(int(args.get('limit', 20)), 1), 100)
+        before = int(args['before']) if args.get('before') else None
+    except ValueError:
+        return {'error': 'limit and before must be integers'}, 400
+    fallback = args.get('fallback')
+    page = content_store.history(
+        topic=args.get('topic'),
+        query=args.get('q'),
+        model=args.get('model'),
+        is_fallback=None if fallback is None else fallback.lower() in ('1', 'true'),
+        before=before,
+        limit=limit,
+    )
+    return page, 200
+
+def lookup_content(content_id):
+    """Stored record for /content/<id>; returns (body, status)"""
+    record = None
+    if content_store is not None and CONTENT_ID_RE.match(content_id):
+        record = content_store.get(content_id)
+    if record is None:
+        return {'error': 'Unknown content id'}, 404
+    return record, 200
+
+@app.route('/history')
+def history():
+    """Newest-first generated content, filterable by topic, search text, model and fallback"""
+    body, status = history_page(request.args)
+    return jsonify(body), status
+
+@app.route('/content/<content_id>')
+def stored_content(content_id):
+    body, status = lookup_content(content_id)
+    response = jsonify(body)
+    response.status_code = status
+    if status == 200:
+        # Stored records never change
+        response.set_etag(content_id)
+        response.cache_control.public = True
+        response.cache_control.max_age = 86400
+        return response.make_conditional(request)
+    return response
+
+@app.route('/deliveries/<delivery_id>')
+def delivery_status(delivery_id):
+    status = delivery_queue.status(delivery_id)
+    if status is None:
+        return jsonify({'error': 'Unknown delivery id'}), 404
+    return jsonify(status)
+
+# Gauges are read at scrape time
+metrics.registry.gauge('ai_agent_cache_entries', 'Entries in this worker\'s generation cache',
+                       lambda: generation_cache.stats()['entries'])
+metrics.registry.gauge('ai_agent_cache_bytes', 'Bytes held by this worker\'s generation cache',
+                       lambda: generation_cache.stats()['bytes'])
+metrics.registry.gauge('ai_agent_cache_hit_ratio', 'Generation cache hit ratio since start',
+                       lambda: generation_cache.stats()['hit_ratio'])
+metrics.registry.gauge('ai_agent_email_queue_pending', 'Emails waiting in the delivery spool',
+                       delivery_queue.pending_count)
+metrics.registry.gauge('ai_agent_digest_pending', 'Topics waiting for the next email digest',
+                       digest_spool.pending_count)
+metrics.registry.gauge('ai_agent_jobs_queued', 'Generation jobs waiting for a worker',
+                       job_queue.queued_count)
+metrics.registry.gauge('ai_agent_singleflight_inflight', 'Distinct generations currently in flight',
+                       singleflight.in_flight)
+if rate_limiter is not None:
+    metrics.registry.gauge('ai_agent_upstream_rate', 'Current adaptive upstream request rate (req/s)',
+                           lambda: rate_limiter.rate)
+    metrics.registry.gauge('ai_agent_upstream_queue_waiting', 'Requests waiting for an upstream slot',
+                           lambda: rate_limiter.stats()['waiting'])
+metrics.registry.gauge('ai_agent_startup_seconds', 'Seconds this process spent starting up',
+                       lambda: startup.total)
+metrics.registry.gauge('ai_agent_circuit_open', '1 while the inference circuit breaker is open',
+                       lambda: int(inference_client.breaker.state == 'open'))
+
+@app.before_request
+def ensure_background():
+    # Servers without the post_fork hook (plain "gunicorn app:app", flask run)
+    start_background()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    # Opt-in per-request stage breakdown, returned as a Server-Timing header
+    g.trace = request.headers.get('X-Trace-Stages', '').lower() in ('1', 'true')
+    if g.trace:
+        metrics.start_trace()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, endpoint, str(response.status_code))
+    if g.get('trace'):
+        response.headers['Server-Timing'] = metrics.server_timing(metrics.finish_trace())
+    return response
+
+@app.after_request
+def compress_response(response):
+    """Negotiated gzip/brotli for complete (non-streamed) text responses"""
+    if (not COMPRESS_RESPONSES or response.status_code != 200 or response.direct_passthrough
+            or response.is_streamed or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    add_vary(response, 'Accept-Encoding')
+    body, encoding = encode_body(response.get_data(), request.headers.get('Accept-Encoding'), COMPRESS_MIN_BYTES)
+    if encoding:
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        # The bytes differ per coding, so the validator can only be weak
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+HEALTH_CHECK_TTL = float(os.getenv('HEALTH_CHECK_TTL', 30))
+_health_cache = {'checked_at': 0.0, 'checks': None}
+
+def _check_upstream():
+    """Any HTTP answer from the inference host means it is reachable"""
+    import requests
+
+    try:
+        inference_client.session.head(HUGGINGFACE_API_URL, timeout=(2, 3))
+        return {'reachable': True, 'circuit': inference_client.breaker.state}
+    except requests.RequestException as e:
+        return {'reachable': False, 'circuit': inference_client.breaker.state, 'error': str(e)}
+
+def _check_smtp():
+    try:
+        with socket.create_connection((SMTP_HOST, SMTP_PORT), timeout=2):
+            pass
+        return {'reachable': True, 'pending': delivery_queue.pending_count()}
+    except OSError as e:
+        return {'reachable': False, 'pending': delivery_queue.pending_count(), 'error': str(e)}
+
+def readiness():
+    """Return (report, ready); upstream and SMTP checks are cached for HEALTH_CHECK_TTL"""
+    now = time.monotonic()
+    if _health_cache['checks'] is None or now - _health_cache['checked_at'] > HEALTH_CHECK_TTL:
+        checks = {'backend': 'routes' if inference_router is not None else INFERENCE_BACKEND, 'smtp': _check_smtp()}
+        if checks['backend'] == 'remote':
+            checks['upstream'] = _check_upstream()
+        _health_cache.update(checked_at=now, checks=checks)
+    checks = _health_cache['checks']
+
+    ready = checks['smtp']['reachable'] and checks.get('upstream', {'reachable': True})['reachable']
+    report = {'status': 'healthy' if ready else 'degraded', 'checks': checks, 'cache': generation_cache.stats()}
+    if rate_limiter is not None:
+        report['rate_limit'] = rate_limiter.stats()
+    if inference_router is not None:
+        report['routing'] = inference_router.stats()
+    if semantic_cache is not None:
+        report['semantic_cache'] = semantic_cache.stats()
+    if content_store is not None:
+        report['store'] = content_store.stats()
+    report['jobs'] = job_queue.stats()
+    if prewarmer is not None:
+        report['prewarm'] = prewarmer.stats()
+    return report, ready
+
 @app.route('/health')
 def health_check():
-    return jsonify({'status': 'healthy'})
+    # Unreachable dependencies degrade the service (fallback content, queued
+    # email) rather than break it, so only ?strict=1 turns them into a 503
+    report, ready = readiness()
+    if not ready and request.args.get('strict') in ('1', 'true'):
+        return jsonify(report), 503
+    return jsonify(report)
+
+startup.mark('routes')
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
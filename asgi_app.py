@@ -0,0 +1,372 @@
+"""Async (ASGI) serving mode
+
+Run with:
+    uvicorn asgi_app:app --host 0.0.0.0 --port $PORT
+or under gunicorn:
+    gunicorn asgi_app:app -k uvicorn.workers.UvicornWorker
+
+Upstream inference goes through httpx and email through aiosmtplib, so one
+process can hold many in-flight generations. Configuration, caching, parsing,
+fallback content and the email spool are shared with the sync Flask app.
+Only the remote Inference API has an async client: with local inference,
+routes or the staged pipeline, generations run on threads through the sync
+app's backend instead.
+"""
+
+import asyncio
+import contextlib
+import os
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import app as sync_app
+from async_inference import AsyncInferenceClient
+from async_mailer import AsyncDeliveryQueue
+from cache import copy_content
+from content import dumps_with_content
+from inference import CircuitOpenError, UpstreamError
+from metrics import registry, stage, FALLBACKS, GENERATIONS
+from prompts import continuation
+from ratelimit import RateLimitedError, request_priority, PRIORITY_INTERACTIVE
+from responses import encode_body, etag_matches
+from validation import StreamValidator, validated_stream
+
+inference_client = AsyncInferenceClient(
+    sync_app.HUGGINGFACE_API_URL,
+    token=os.getenv('HUGGINGFACE_TOKEN', ''),
+    pool_size=int(os.getenv('HF_ASYNC_POOL_SIZE', 100)),
+    connect_timeout=sync_app.inference_client.timeout[0],
+    read_timeout=sync_app.inference_client.timeout[1],
+    max_retries=sync_app.inference_client.max_retries,
+    backoff_base=sync_app.inference_client.backoff_base,
+    backoff_max=sync_app.inference_client.backoff_max,
+    breaker=sync_app.inference_client.breaker,
+    limiter=sync_app.rate_limiter,
+)
+
+delivery_queue = AsyncDeliveryQueue(
+    sync_app.EMAIL_SPOOL_DIR,
+    sync_app.SMTP_HOST,
+    sync_app.SMTP_PORT,
+    username=sync_app.GMAIL_USER,
+    password=sync_app.GMAIL_PASSWORD,
+    use_starttls=sync_app.SMTP_STARTTLS,
+    batch_size=sync_app.delivery_queue.batch_size,
+    max_attempts=sync_app.delivery_queue.max_attempts,
+    backoff_base=sync_app.delivery_queue.backoff_base,
+)
+
+
+# cache_key -> task generating it, shared by concurrent requests for the key
+_in_flight = {}
+
+
+async def generate_ai_content(topic, prompt_template, bypass_cache=False):
+    """Async version of app.generate_ai_content sharing its cache"""
+    if sync_app.staged_pipeline is not None or sync_app.inference_backend is not sync_app.inference_client:
+        # The async client only speaks to the remote API; other backends run on threads
+        return await asyncio.to_thread(sync_app.generate_ai_content, topic, prompt_template, bypass_cache)
+
+    cache_key = sync_app.content_cache_key(topic, prompt_template)
+
+    if not bypass_cache:
+        with stage('cache_lookup'):
+            cached = sync_app.generation_cache.get(cache_key)
+        if cached is not None:
+            GENERATIONS.inc('cache')
+            return cached
+        similar = await asyncio.to_thread(sync_app.find_similar_content, topic, prompt_template, cache_key)
+        if similar is not None:
+            GENERATIONS.inc('semantic')
+            return similar
+
+    if bypass_cache:
+        # A forced regeneration neither joins cached callers nor hands them its result
+        content, source = await _generate(topic, prompt_template, cache_key, bypass_cache)
+    else:
+        task = _in_flight.get(cache_key)
+        leader = task is None
+        if leader:
+            task = asyncio.ensure_future(_generate(topic, prompt_template, cache_key, bypass_cache))
+            _in_flight[cache_key] = task
+            task.add_done_callback(lambda _: _in_flight.pop(cache_key, None))
+        else:
+            sync_app.singleflight.record_coalesced()
+        budget = sync_app.LATENCY_BUDGETS[PRIORITY_INTERACTIVE]
+        try:
+            # Shielded, so a disconnecting client doesn't cancel the others' generation
+            content, source = await asyncio.wait_for(asyncio.shield(task), None if leader else budget or None)
+        except asyncio.TimeoutError:
+            FALLBACKS.inc('coalesce_timeout')
+            print(f"Using fallback: timed out waiting for the in-flight call for {cache_key}")
+            content = None
+
+    if content is None:
+        # Fallback output is never cached so the next request retries the API
+        GENERATIONS.inc('fallback')
+        return sync_app.generate_fallback_content(topic)
+
+    GENERATIONS.inc(source)
+    # Coalesced callers share the leader's result; give each its own copy
+    return copy_content(content)
+
+
+async def _generate(topic, prompt_template, cache_key, bypass_cache):
+    """Returns (content or None, source); runs once per key across concurrent requests"""
+    if sync_app.content_store is not None and not bypass_cache:
+        stored = await asyncio.to_thread(sync_app.content_store.find_reusable, cache_key, sync_app.STORE_REUSE_TTL)
+        if stored is not None:
+            sync_app.generation_cache.set(cache_key, stored)
+            sync_app.remember_topic(topic, cache_key)
+            return stored, 'store'
+
+    try:
+        with stage('prompt'):
+            prompt = sync_app.prompt_registry.build(prompt_template, topic)
+        budget = sync_app.LATENCY_BUDGETS[PRIORITY_INTERACTIVE]
+        with stage('upstream'), request_priority(PRIORITY_INTERACTIVE, budget):
+            ai_response = await inference_client.generate_text(
+                sync_app.MODELS['text_generation'],
+                prompt.text,
+                sync_app.GENERATION_PARAMETERS
+            )
+        # The async client returns whole responses: validate the text as if it had streamed in
+        validator = StreamValidator()
+        with stage('parse'):
+            for _ in validated_stream([continuation(prompt, ai_response)], validator):
+                pass
+        sync_app.prompt_registry.record(prompt, validator.text, topic)
+        # Regenerating missing sections uses the sync backend, off the loop
+        with request_priority(PRIORITY_INTERACTIVE, budget):
+            content, complete = await asyncio.to_thread(sync_app.complete_sections, topic, validator)
+        if content is not None:
+            if complete:
+                sync_app.generation_cache.set(cache_key, content)
+                sync_app.remember_topic(topic, cache_key)
+            sync_app.record_result(topic, content, cache_key, is_fallback=not complete)
+            return content, 'upstream'
+    except UpstreamError as e:
+        FALLBACKS.inc('circuit_open' if isinstance(e, CircuitOpenError)
+                      else 'rate_limited' if isinstance(e, RateLimitedError) else 'upstream_error')
+        print(f"AI API unavailable, using fallback: {e}")
+    except Exception as e:
+        FALLBACKS.inc('error')
+        print(f"Error generating AI content: {e}")
+
+    sync_app.record_result(topic, sync_app.generate_fallback_content(topic), cache_key, is_fallback=True)
+    return None, 'upstream'
+
+
+def send_email(content, topic):
+    """Spool an email for the async delivery loop; returns the delivery id or None"""
+    return sync_app.send_email(content, topic, queue=delivery_queue)
+
+
+def encoded_response(request, body, media_type, headers=None):
+    """Response compressed to suit the client's Accept-Encoding"""
+    headers = dict(headers or {})
+    if sync_app.COMPRESS_RESPONSES:
+        headers['Vary'] = 'Accept-Encoding'
+        body, encoding = encode_body(body, request.headers.get('accept-encoding'), sync_app.COMPRESS_MIN_BYTES)
+        if encoding:
+            headers['Content-Encoding'] = encoding
+            if 'ETag' in headers:
+                # The bytes differ per coding, so the validator can only be weak
+                headers['ETag'] = 'W/' + headers['ETag']
+    return Response(body, media_type=media_type, headers=headers)
+
+
+async def index(request):
+    # Pre-rendered, minified and compressed once by the sync app
+    page = sync_app.INDEX_PAGE
+    headers = {'ETag': f'"{page.etag}"', 'Cache-Control': f'public, max-age={sync_app.INDEX_MAX_AGE}',
+               'Vary': 'Accept-Encoding'}
+    if etag_matches(request.headers.get('if-none-match'), page.etag):
+        return Response(status_code=304, headers=headers)
+    encoding, body = page.encoded(request.headers.get('accept-encoding') if sync_app.COMPRESS_RESPONSES else None)
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return Response(body, media_type='text/html', headers=headers)
+
+
+async def generate_content(request: Request):
+    try:
+        data = await request.json()
+        topic = data.get('topic', '').strip()
+        bypass_cache = bool(data.get('bypass_cache', False))
+
+        if not topic:
+            return JSONResponse({'error': 'Topic is required'}, status_code=400)
+
+        content = await generate_ai_content(topic, sync_app.PROMPT_TEMPLATE, bypass_cache=bypass_cache)
+
+        # Spool writes are small but still file I/O, so keep them off the loop
+        delivery_id = await asyncio.to_thread(send_email, content, topic)
+
+        return encoded_response(request, dumps_with_content({
+            'success': True,
+            'content': content,
+            'email_queued': delivery_id is not None,
+            'delivery_id': delivery_id,
+            'message': 'Content generated and email queued for delivery!'
+        }).encode('utf-8'), 'application/json')
+
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def content_by_topic(request):
+    """Idempotent, cacheable generation: no email, and an ETag on the content hash"""
+    topic = request.query_params.get('topic', '').strip()
+    if not topic:
+        return JSONResponse({'error': 'Topic is required'}, status_code=400)
+
+    content = await generate_ai_content(topic, sync_app.PROMPT_TEMPLATE)
+    body = dumps_with_content({
+        'success': True,
+        'fallback': content.is_fallback,
+        'content': content
+    }).encode('utf-8')
+    if content.is_fallback:
+        return encoded_response(request, body, 'application/json', {'Cache-Control': 'no-store'})
+    headers = {'ETag': f'"{content.etag()}"', 'Cache-Control': f'public, max-age={sync_app.CONTENT_MAX_AGE}'}
+    if etag_matches(request.headers.get('if-none-match'), content.etag()):
+        return Response(status_code=304, headers=headers)
+    return encoded_response(request, body, 'application/json', headers)
+
+
+async def generate_stream(request: Request):
+    """SSE endpoint used by the web page: tokens as they are generated, then each section"""
+    if request.method == 'POST':
+        data = await request.json()
+    else:
+        data = request.query_params
+    topic = (data.get('topic') or '').strip()
+    bypass_cache = str(data.get('bypass_cache', '')).lower() in ('1', 'true')
+
+    if not topic:
+        return JSONResponse({'error': 'Topic is required'}, status_code=400)
+
+    async def events():
+        # The async client returns whole responses, so tokens come from the sync
+        # backend's stream; its generator blocks, so step it from a thread
+        generator = sync_app.content_events(topic, bypass_cache, send=send_email)
+        try:
+            while True:
+                event = await asyncio.to_thread(next, generator, None)
+                if event is None:
+                    return
+                yield event
+        finally:
+            # Drops the upstream stream if the client went away mid-generation
+            with contextlib.suppress(ValueError):  # still running in its thread
+                generator.close()
+
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def delivery_status(request):
+    status = delivery_queue.status(request.path_params['delivery_id'])
+    if status is None:
+        return JSONResponse({'error': 'Unknown delivery id'}, status_code=404)
+    return JSONResponse(status)
+
+
+async def create_job(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    body, status = await asyncio.to_thread(sync_app.submit_job, data if isinstance(data, dict) else {})
+    headers = {'Location': body['status_url']} if status == 202 else None
+    return JSONResponse(body, status_code=status, headers=headers)
+
+
+async def get_job(request):
+    # A long-poll sleeps in a worker thread rather than on the loop
+    body, status = await asyncio.to_thread(sync_app.job_status, request.path_params['job_id'], request.query_params)
+    return JSONResponse(body, status_code=status)
+
+
+async def stream_job(request):
+    job_id = request.path_params['job_id']
+    if await asyncio.to_thread(sync_app.job_queue.get, job_id) is None:
+        return JSONResponse({'error': 'Unknown job id'}, status_code=404)
+
+    async def events():
+        # The sync generator blocks while it polls, so step it from a thread
+        generator = sync_app.job_events(job_id)
+        while True:
+            event = await asyncio.to_thread(next, generator, None)
+            if event is None:
+                return
+            yield event
+
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def history(request):
+    # SQLite reads block, so keep them off the loop
+    body, status = await asyncio.to_thread(sync_app.history_page, request.query_params)
+    return JSONResponse(body, status_code=status)
+
+
+async def stored_content(request):
+    body, status = await asyncio.to_thread(sync_app.lookup_content, request.path_params['content_id'])
+    return JSONResponse(body, status_code=status)
+
+
+async def health_check(request):
+    # The readiness probes do blocking socket I/O, so keep them off the loop
+    report, ready = await asyncio.to_thread(sync_app.readiness)
+    if not ready and request.query_params.get('strict') in ('1', 'true'):
+        return JSONResponse(report, status_code=503)
+    return JSONResponse(report)
+
+
+async def metrics_endpoint(request):
+    return PlainTextResponse(registry.render(), media_type='text/plain; version=0.0.4')
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # This process delivers email from the event loop, not the sync app's thread
+    # Periodic digests are queued for the async loop too
+    sync_app.digest_spool.queue = delivery_queue
+    sync_app.start_background(deliver=False)
+    await delivery_queue.start_async()
+    try:
+        yield
+    finally:
+        await delivery_queue.stop_async()
+        await inference_client.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route('/', index),
+        Route('/generate', generate_content, methods=['POST']),
+        Route('/generate/stream', generate_stream, methods=['GET', 'POST']),
+        Route('/content', content_by_topic),
+        Route('/jobs', create_job, methods=['POST']),
+        Route('/jobs/{job_id}', get_job),
+        Route('/jobs/{job_id}/events', stream_job),
+        Route('/history', history),
+        Route('/content/{content_id}', stored_content),
+        Route('/deliveries/{delivery_id}', delivery_status),
+        Route('/health', health_check),
+        Route('/metrics', metrics_endpoint),
+    ],
+    lifespan=lifespan,
+)
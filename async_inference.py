@@ -0,0 +1,112 @@
+"""asyncio counterpart of InferenceClient for the ASGI serving mode"""
+
+import asyncio
+import random
+
+import httpx
+
+from inference import (
+    RETRYABLE_STATUS_CODES,
+    CircuitBreaker,
+    CircuitOpenError,
+    UpstreamError,
+    _retry_hint,
+)
+from metrics import UPSTREAM_RESPONSES
+
+
+class AsyncInferenceClient:
+    """Pooled httpx.AsyncClient with the same timeout, retry and breaker rules"""
+
+    def __init__(self, base_url, token='', pool_size=100, connect_timeout=3.05,
+                 read_timeout=30.0, max_retries=2, backoff_base=0.5,
+                 backoff_max=8.0, breaker=None, limiter=None):
+        self.base_url = base_url
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        headers = {'Authorization': f"Bearer {token}"} if token else {}
+        self.client = httpx.AsyncClient(
+            headers=headers,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    def _backoff_delay(self, attempt, response=None):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if response is not None:
+            hint = _retry_hint(response)
+            if hint is not None:
+                delay = max(delay, min(hint, self.backoff_max))
+        return delay
+
+    async def post_model(self, model, payload):
+        """POST a payload to a model endpoint and return the decoded JSON body"""
+        if self.limiter is not None:
+            await self.limiter.acquire_async()
+        admission = self.breaker.admit()
+        if admission is None:
+            UPSTREAM_RESPONSES.inc(model, 'circuit_open')
+            raise CircuitOpenError(f"Circuit open for {self.base_url}")
+        try:
+            return await self._attempts(model, payload)
+        finally:
+            if admission == 'probe':
+                # Also when the request is cancelled mid-call
+                self.breaker.release_probe()
+
+    async def _attempts(self, model, payload):
+        url = f"{self.base_url}{model}"
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.client.post(url, json=payload)
+            except httpx.HTTPError as e:
+                UPSTREAM_RESPONSES.inc(model, 'timeout' if isinstance(e, httpx.TimeoutException) else 'error')
+                last_error = UpstreamError(f"Request to {model} failed: {e}")
+                response = None
+            else:
+                UPSTREAM_RESPONSES.inc(model, str(response.status_code))
+                if response.status_code == 200:
+                    self.breaker.record_success()
+                    if self.limiter is not None:
+                        self.limiter.on_success()
+                    return response.json()
+                if response.status_code == 429 and self.limiter is not None:
+                    self.limiter.on_throttled(_retry_hint(response))
+                last_error = UpstreamError(
+                    f"{model} returned HTTP {response.status_code}",
+                    status_code=response.status_code,
+                )
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    if response.status_code >= 500:
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()
+                    raise last_error
+
+            if attempt < self.max_retries:
+                delay = self._backoff_delay(attempt, response)
+                if self.limiter is not None:
+                    # Out of latency budget is not a breaker failure
+                    self.limiter.ensure_budget(delay)
+                    await asyncio.sleep(delay)
+                    await self.limiter.acquire_async()
+                else:
+                    await asyncio.sleep(delay)
+
+        self.breaker.record_failure()
+        raise last_error
+
+    async def generate_text(self, model, prompt, parameters):
+        """Run a text-generation model and return the generated text"""
+        data = await self.post_model(model, {"inputs": prompt, "parameters": parameters})
+        try:
+            return data[0]["generated_text"]
+        except (KeyError, IndexError, TypeError):
+            raise UpstreamError(f"Unexpected response shape from {model}")
+
+    async def aclose(self):
+        await self.client.aclose()
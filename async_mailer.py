@@ -0,0 +1,120 @@
+"""asyncio delivery loop for the email spool, used by the ASGI serving mode"""
+
+import asyncio
+import time
+
+import aiosmtplib
+
+from mailer import DeliveryQueue
+
+
+class AsyncDeliveryQueue(DeliveryQueue):
+    """Drains the same on-disk spool as DeliveryQueue from an asyncio task
+
+    Spool bookkeeping is shared with the threaded queue, so messages queued
+    by either serving mode are delivered by whichever one is running.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._task = None
+        self._loop = None
+        self._async_wakeup = None
+        self._async_smtp = None
+
+    def start(self):
+        # Delivery runs on the event loop (see start_async), not on a thread
+        pass
+
+    def _wake(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._async_wakeup.set)
+
+    async def start_async(self):
+        self._loop = asyncio.get_running_loop()
+        self._async_wakeup = asyncio.Event()
+        await asyncio.to_thread(self._recover_stale)
+        self._task = asyncio.create_task(self._run_async())
+
+    async def stop_async(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self._disconnect_async()
+
+    async def _run_async(self):
+        while True:
+            try:
+                batch = await asyncio.to_thread(self._claim_due)
+                for record in batch:
+                    await self._deliver_async(record)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error in email delivery loop: {e}")
+                batch = []
+            if batch:
+                continue
+            if self._async_smtp is not None and time.monotonic() - self._last_used > self.idle_timeout:
+                await self._disconnect_async()
+            try:
+                await asyncio.wait_for(self._async_wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._async_wakeup.clear()
+
+    async def _deliver_async(self, record):
+        record['attempts'] += 1
+        record['updated_at'] = time.time()
+        try:
+            smtp = await self._connection_async()
+            refused, _ = await smtp.sendmail(self.sender, record['recipients'], self._build_message(record))
+            self._last_used = time.monotonic()
+        except Exception as e:
+            await self._disconnect_async()
+            await asyncio.to_thread(self._delivery_failed, record, e)
+            return
+        if refused:
+            print(f"Recipients refused for email {record['id']}: {', '.join(sorted(refused))}")
+            record['refused'] = sorted(refused)
+        await asyncio.to_thread(self._delivery_succeeded, record)
+
+    async def _connection_async(self):
+        """Return a live, authenticated SMTP session, reconnecting if needed"""
+        if self._async_smtp is not None:
+            try:
+                if (await self._async_smtp.noop()).code == 250:
+                    return self._async_smtp
+            except (aiosmtplib.SMTPException, OSError):
+                pass
+            await self._disconnect_async()
+
+        smtp = aiosmtplib.SMTP(
+            hostname=self.smtp_host,
+            port=self.smtp_port,
+            timeout=self.smtp_timeout,
+            start_tls=False,
+        )
+        await smtp.connect()
+        try:
+            if self.use_starttls:
+                await smtp.starttls()
+            if self.username and self.password:
+                await smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self._async_smtp = smtp
+        return smtp
+
+    async def _disconnect_async(self):
+        if self._async_smtp is None:
+            return
+        try:
+            await self._async_smtp.quit()
+        except Exception:
+            self._async_smtp.close()
+        self._async_smtp = None
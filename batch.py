@@ -0,0 +1,119 @@
+"""Bulk generation for lists of topics, usable from the web app or the command line
+
+Usage:
+    python batch.py topics.jsonl [--concurrency 4] [--no-email] [--bypass-cache]
+    python batch.py --topic "Black Holes" --topic "Ancient Rome"
+
+Results are written to stdout as NDJSON, one line per topic, as they complete.
+"""
+
+import argparse
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from cache import normalize_topic
+from content import dumps_with_content
+
+
+def parse_topic_lines(lines):
+    """Read topics from JSONL ({"topic": ...} objects or JSON strings) or plain text lines"""
+    topics = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            topics.append(line)
+            continue
+        if isinstance(item, dict):
+            item = item.get('topic', '')
+        if isinstance(item, str) and item.strip():
+            topics.append(item.strip())
+    return topics
+
+
+def dedupe_topics(topics):
+    """Collapse topics that normalize to the same key, keeping the first spelling
+
+    Returns a list of (topic, [duplicate spellings]) in first-seen order.
+    """
+    unique = {}
+    for topic in topics:
+        topic = topic.strip()
+        if not topic:
+            continue
+        key = normalize_topic(topic)
+        if key in unique:
+            unique[key][1].append(topic)
+        else:
+            unique[key] = (topic, [])
+    return list(unique.values())
+
+
+def run_batch(topics, generate, concurrency=4):
+    """Generate content for each unique topic with bounded concurrency
+
+    Yields one result dict per unique topic in completion order.
+    """
+    unique = dedupe_topics(topics)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {
+            executor.submit(generate, topic): (index, topic, duplicates)
+            for index, (topic, duplicates) in enumerate(unique)
+        }
+        for future in as_completed(futures):
+            index, topic, duplicates = futures[future]
+            result = {'index': index, 'topic': topic, 'duplicates': duplicates}
+            try:
+                result['content'] = future.result()
+            except Exception as e:
+                result['error'] = str(e)
+            yield result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate content for many topics at once")
+    parser.add_argument('file', nargs='?', help="JSONL or text file of topics ('-' for stdin)")
+    parser.add_argument('--topic', action='append', default=[], help="Topic to generate (repeatable)")
+    parser.add_argument('--concurrency', type=int, default=None, help="Parallel generations")
+    parser.add_argument('--no-email', action='store_true', help="Don't send the digest email")
+    parser.add_argument('--bypass-cache', action='store_true', help="Force fresh generations")
+    args = parser.parse_args(argv)
+
+    topics = list(args.topic)
+    if args.file == '-':
+        topics += parse_topic_lines(sys.stdin)
+    elif args.file:
+        with open(args.file, encoding='utf-8') as f:
+            topics += parse_topic_lines(f)
+    if not topics:
+        parser.error("no topics given")
+
+    # Imported here so the module stays importable from app.py itself
+    import app
+
+    def generate(topic):
+        return app.generate_ai_content(topic, app.PROMPT_TEMPLATE, bypass_cache=args.bypass_cache,
+                                       priority=app.PRIORITY_BATCH)
+
+    if not args.no_email:
+        app.delivery_queue.start()
+
+    results = []
+    for result in run_batch(topics, generate, args.concurrency or app.BATCH_CONCURRENCY):
+        results.append(result)
+        sys.stdout.write(dumps_with_content(result) + '\n')
+        sys.stdout.flush()
+
+    if not args.no_email:
+        delivery_ids = app.send_digest_email(results)
+        # The queue delivers in the background; wait for it before exiting
+        statuses = [app.delivery_queue.wait(delivery_id) for delivery_id in delivery_ids]
+        summary = ', '.join(status['status'] if status else 'unknown' for status in statuses)
+        print(f"Digest email: {summary or 'not sent'}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
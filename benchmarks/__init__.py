@@ -0,0 +1,6 @@
+"""Offline benchmarks: mocked upstreams, a load test and micro-benchmarks
+
+Run from the repository root, e.g.:
+    python -m benchmarks.micro
+    python -m benchmarks.load_test --workers 1,2,4 --concurrency 1,8,32
+"""
@@ -0,0 +1,248 @@
+"""Load test the Flask app under gunicorn against mocked upstreams
+
+Starts the mock inference API and SMTP server, then for each worker count
+boots `gunicorn "app:create_app()"` with gunicorn.conf.py, as deployed, and
+drives each endpoint at each concurrency level, reporting p50/p95/p99
+latency, requests/sec and resident memory per worker.
+
+    python -m benchmarks.load_test --workers 1,2,4 --concurrency 1,8,32 --requests 200
+"""
+
+import argparse
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.mock_upstreams import MockInferenceServer, MockSMTPServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def child_pids(pid):
+    """PIDs of the direct children of pid (Linux /proc only)"""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may contain spaces; ppid follows the closing paren
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return children
+
+
+def rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def start_gunicorn(workers, port, env, worker_class, threads):
+    command = [
+        sys.executable, '-m', 'gunicorn', 'app:create_app()',
+        '--workers', str(workers),
+        '--worker-class', worker_class,
+        '--threads', str(threads),
+        '--bind', f'127.0.0.1:{port}',
+        '--timeout', '120',
+        '--log-level', 'warning',
+    ]
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+        try:
+            if requests.get(f'http://127.0.0.1:{port}/health', timeout=1).status_code == 200:
+                # Give every worker time to boot before measuring
+                while len(child_pids(process.pid)) < workers and time.monotonic() < deadline:
+                    time.sleep(0.1)
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    stop_gunicorn(process)
+    raise RuntimeError("gunicorn did not become ready within 60s")
+
+
+def stop_gunicorn(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def run_level(base_url, endpoint, concurrency, total, topics, bypass_cache, topic_prefix='Benchmark topic'):
+    """Send `total` requests with `concurrency` client threads; return a result row"""
+    local = threading.local()
+    counter = iter(range(total))
+    counter_lock = threading.Lock()
+
+    def session():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return local.session
+
+    def one(i):
+        started = time.perf_counter()
+        try:
+            if endpoint == '/generate':
+                topic = f"{topic_prefix} {i % topics if topics else i}"
+                response = session().post(base_url + endpoint, json={'topic': topic, 'bypass_cache': bypass_cache}, timeout=120)
+            else:
+                response = session().get(base_url + endpoint, timeout=120)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    def worker():
+        results = []
+        while True:
+            with counter_lock:
+                i = next(counter, None)
+            if i is None:
+                return results
+            results.append(one(i))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(worker) for _ in range(concurrency)]
+        results = [r for future in futures for r in future.result()]
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, ok in results)
+    return {
+        'endpoint': endpoint,
+        'concurrency': concurrency,
+        'requests': len(results),
+        'errors': sum(1 for _, ok in results if not ok),
+        'rps': len(results) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def format_row(row):
+    rss = row.get('rss_mb_per_worker')
+    rss = f"{rss:8.1f}" if rss is not None else '     n/a'
+    return (f"{row['workers']:>7} {row['endpoint']:<10} {row['concurrency']:>5} {row['requests']:>6} "
+            f"{row['errors']:>6} {row['rps']:>8.1f} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} "
+            f"{row['p99_ms']:>8.1f} {rss}")
+
+
+HEADER = (f"{'workers':>7} {'endpoint':<10} {'conc':>5} {'reqs':>6} {'errors':>6} {'req/s':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'RSS MB':>8}")
+
+
+def int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int_list, default=[1, 2, 4], help='comma-separated gunicorn worker counts')
+    parser.add_argument('--concurrency', type=int_list, default=[1, 8, 32], help='comma-separated client concurrency levels')
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint and concurrency level')
+    parser.add_argument('--endpoints', default='/generate,/health')
+    parser.add_argument('--worker-class', default='sync')
+    parser.add_argument('--threads', type=int, default=1, help='threads per worker (gthread)')
+    parser.add_argument('--topics', type=int, default=0,
+                        help='cycle through this many topics so repeats hit the cache (0 = every topic unique)')
+    parser.add_argument('--bypass-cache', action='store_true')
+    parser.add_argument('--latency', type=float, default=0.2, help='mock inference latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of inference calls failing with 503/429')
+    parser.add_argument('--smtp-latency', type=float, default=0.05)
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--hf-port', type=int, default=8765)
+    parser.add_argument('--smtp-port', type=int, default=8025)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    hf = MockInferenceServer(port=args.hf_port, latency=args.latency, jitter=args.jitter,
+                             error_rate=args.error_rate, retry_after=1).start()
+    smtp = MockSMTPServer(port=args.smtp_port, latency=args.smtp_latency).start()
+    endpoints = [e.strip() for e in args.endpoints.split(',') if e.strip()]
+    rows = []
+
+    print(HEADER)
+    try:
+        for workers in args.workers:
+            # Fresh spool, cache and lock directories so runs don't share state
+            state_dir = tempfile.mkdtemp(prefix='ai-agent-bench-')
+            env = dict(
+                os.environ,
+                HUGGINGFACE_API_URL=hf.url,
+                HUGGINGFACE_TOKEN='',
+                INFERENCE_BACKEND='remote',
+                GMAIL_USER='bench@example.com',
+                GMAIL_PASSWORD='',
+                RECIPIENT_EMAIL='inbox@example.com',
+                SMTP_HOST='127.0.0.1',
+                SMTP_PORT=str(args.smtp_port),
+                SMTP_STARTTLS='false',
+                EMAIL_SPOOL_DIR=os.path.join(state_dir, 'spool'),
+                CACHE_DB_PATH=os.path.join(state_dir, 'cache.sqlite3'),
+                SINGLEFLIGHT_LOCK_DIR=os.path.join(state_dir, 'locks'),
+                HF_BACKOFF_MAX='2',
+            )
+            process = start_gunicorn(workers, args.port, env, args.worker_class, args.threads)
+            try:
+                for concurrency in args.concurrency:
+                    for endpoint in endpoints:
+                        # Unique topics must stay unique across levels, or later
+                        # levels would be served from the shared cache
+                        prefix = 'Benchmark topic' if args.topics else f'Benchmark topic c{concurrency}'
+                        row = run_level(f'http://127.0.0.1:{args.port}', endpoint, concurrency,
+                                        args.requests, args.topics, args.bypass_cache, prefix)
+                        sizes = [rss_mb(pid) for pid in child_pids(process.pid)]
+                        sizes = [s for s in sizes if s is not None]
+                        row['workers'] = workers
+                        row['rss_mb_per_worker'] = sum(sizes) / len(sizes) if sizes else None
+                        rows.append(row)
+                        print(format_row(row), flush=True)
+            finally:
+                stop_gunicorn(process)
+                shutil.rmtree(state_dir, ignore_errors=True)
+    finally:
+        hf.stop()
+        smtp.stop()
+
+    print(f"\nMock inference requests: {hf.requests} ({hf.errors} injected errors), emails received: {smtp.messages} ({smtp.recipients} recipients)")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
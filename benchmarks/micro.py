@@ -0,0 +1,76 @@
+"""Micro-benchmarks for the CPU-bound parts of a request
+
+    python -m benchmarks.micro [--number 2000] [--repeat 5]
+"""
+
+import argparse
+import itertools
+import os
+import timeit
+
+# Importing app reads configuration; keep it away from real services
+os.environ.setdefault('HUGGINGFACE_API_URL', 'http://127.0.0.1:9/')
+os.environ.setdefault('EMAIL_SPOOL_DIR', os.path.join('spool', 'bench-email'))
+
+import app
+import fallback
+from content import ContentResult
+from validation import StreamValidator, validated_stream
+from benchmarks.mock_upstreams import sample_response
+
+
+def bench(label, fn, number, repeat, setup=None):
+    """Print the best per-call time over `repeat` runs of `number` calls"""
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        timings.append(timeit.timeit(fn, number=number))
+    best = min(timings) / number
+    print(f"{label:<52} {best * 1e6:>10.2f} us/call")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=2000, help='calls per timing run')
+    parser.add_argument('--repeat', type=int, default=5, help='timing runs; the best is reported')
+    args = parser.parse_args()
+
+    topic = 'Octopuses'
+    generated = sample_response(topic)
+    echoed = app.PROMPT_TEMPLATE.format(topic=topic) + '\n\n' + generated
+
+    # The fallback renderer memoizes by topic; unique topics measure a real render
+    unique_topics = (f"Topic {i}" for i in itertools.count())
+
+    bench('parse_ai_response (generation only)', lambda: app.parse_ai_response(generated, topic), args.number, args.repeat)
+    bench('parse_ai_response (prompt echoed back)', lambda: app.parse_ai_response(echoed, topic), args.number, args.repeat)
+    bench('parse_ai_response (no sections -> fallback)', lambda: app.parse_ai_response('no sections here', topic),
+          args.number, args.repeat)
+
+    # Token-sized chunks, as a streamed generation arrives
+    tokens = generated.split(' ')
+    tokens = [token + ' ' for token in tokens[:-1]] + tokens[-1:]
+    bench('StreamValidator (streamed tokens)', lambda: list(validated_stream(tokens, StreamValidator())),
+          args.number // 10 or 1, args.repeat)
+
+    bench('generate_fallback_content (new topic)', lambda: app.generate_fallback_content(next(unique_topics)),
+          args.number, args.repeat, setup=fallback._render.cache_clear)
+    bench('generate_fallback_content (repeat topic)', lambda: app.generate_fallback_content(topic),
+          args.number, args.repeat)
+    bench('build_email_body', lambda: app.build_email_body(app.generate_fallback_content(topic), topic),
+          args.number, args.repeat)
+
+    # A fresh result each call, so the lazily cached encodings are measured too
+    parsed = app.parse_ai_response(generated, topic)
+    bench('ContentResult JSON (new result)', lambda: ContentResult(*parsed.values()).json_text(),
+          args.number, args.repeat)
+    bench('ContentResult pack + unpack (new result)', lambda: ContentResult.unpack(ContentResult(*parsed.values()).pack()),
+          args.number, args.repeat)
+
+    app.delivery_queue.stop()
+
+
+if __name__ == '__main__':
+    main()
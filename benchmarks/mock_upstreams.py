@@ -0,0 +1,302 @@
+"""Local stand-ins for the Hugging Face Inference API and an SMTP server
+
+Run standalone to point a dev server at them:
+    python -m benchmarks.mock_upstreams --hf-port 8765 --smtp-port 8025 --latency 0.5 --error-rate 0.1
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample_response.txt')
+
+with open(SAMPLE_PATH, encoding='utf-8') as f:
+    SAMPLE_RESPONSE = f.read()
+
+
+def sample_response(topic):
+    """Model output in the sectioned format the content prompt asks for"""
+    return SAMPLE_RESPONSE.replace('{topic}', topic)
+
+
+_TOKEN_RE = re.compile(r'\s*\S+|\s+')
+
+
+def defective_response(topic, defect):
+    """Sample output with one section dropped ('drop') or ending in a loop ('loop')"""
+    parts = sample_response(topic).split('\n---\n')
+    if defect == 'drop':
+        del parts[random.randrange(len(parts))]
+        return '\n---\n'.join(parts)
+    keep = random.randrange(1, len(parts))
+    return '\n---\n'.join(parts[:keep]) + '\n\n' + 'And that is a fact.\n' * 40
+
+
+def _topic_from_prompt(prompt):
+    marker = 'Unknown Facts About '
+    start = prompt.find(marker)
+    if start == -1:
+        return 'Topic'
+    start += len(marker)
+    end = prompt.find('"', start)
+    return prompt[start:end if end != -1 else None].strip('*" ') or 'Topic'
+
+
+class MockInferenceServer:
+    """HF Inference API mock with configurable latency and 503/429 injection
+
+    Text-generation models echo the prompt followed by a sample generation,
+    like the real API; summarization models return a short summary. A share
+    of requests (error_rate) fail with 503 or 429 and a Retry-After header.
+
+    Requests with "stream": true get the generation as server-sent token
+    events (token_latency apart), and tokens_sent counts the tokens that
+    were written before the client hung up. A share of generations
+    (defect_rate) lose a section or end in a loop; with ramble the model
+    starts over once it is done, as gpt2 does until it hits its length limit.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8765, latency=0.0, jitter=0.0,
+                 error_rate=0.0, retry_after=1, token_latency=0.0, defect_rate=0.0, ramble=False):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.token_latency = token_latency
+        self.defect_rate = defect_rate
+        self.ramble = ramble
+        self.requests = 0
+        self.errors = 0
+        self.tokens_sent = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                failed = mock._record()
+                delay = mock.latency + random.uniform(0, mock.jitter)
+                if delay:
+                    time.sleep(delay)
+
+                if failed:
+                    status = random.choice((503, 429))
+                    body = json.dumps({'error': 'Model is currently loading', 'estimated_time': mock.retry_after})
+                    self._reply(status, body, {'Retry-After': str(mock.retry_after)})
+                    return
+
+                prompt = payload.get('inputs', '')
+                if 'cnn' in self.path or 'bart' in self.path:
+                    body = json.dumps([{'summary_text': ' '.join(str(prompt).split()[:40])}])
+                    self._reply(200, body)
+                    return
+                generation = mock.generation(prompt)
+                if payload.get('stream'):
+                    self._stream(generation)
+                    return
+                mock._count_tokens(len(_TOKEN_RE.findall(generation)))
+                self._reply(200, json.dumps([{'generated_text': f"{prompt}{generation}"}]))
+
+            def _stream(self, generation):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.close_connection = True
+                try:
+                    for token in _TOKEN_RE.findall(generation):
+                        self.wfile.write(f"data: {json.dumps({'token': {'text': token}})}\n\n".encode('utf-8'))
+                        self.wfile.flush()
+                        mock._count_tokens(1)
+                        if mock.token_latency:
+                            time.sleep(mock.token_latency)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def _reply(self, status, body, headers=None):
+                data = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def generation(self, prompt):
+        topic = _topic_from_prompt(prompt)
+        if random.random() < self.defect_rate:
+            text = defective_response(topic, random.choice(('drop', 'loop')))
+        else:
+            text = sample_response(topic)
+        # A prompt ending with a section header asks for that section alone
+        last_line = prompt.rstrip().rsplit('\n', 1)[-1].strip()
+        for part in text.split('\n---\n'):
+            header, _, body = part.strip().partition('\n')
+            if last_line and header == last_line:
+                text = body
+                break
+        if self.ramble:
+            text = f"{text}\n\n{sample_response(topic)}"
+        return f"\n\n{text}"
+
+    def _count_tokens(self, count):
+        with self._lock:
+            self.tokens_sent += count
+
+    def _record(self):
+        with self._lock:
+            self.requests += 1
+            failed = random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return failed
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class MockSMTPServer:
+    """Minimal SMTP sink: accepts every message and counts it
+
+    Speaks just enough SMTP for smtplib without STARTTLS or AUTH, so run
+    the app with SMTP_STARTTLS=false and no GMAIL_PASSWORD against it.
+    Advertises PIPELINING; pipelined commands are simply read line by line.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8025, latency=0.0):
+        self.latency = latency
+        self.messages = 0
+        self.recipients = 0
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer((host, port), self._handler(), bind_and_activate=False)
+        self._server.allow_reuse_address = True
+        self._server.daemon_threads = True
+        self._server.server_bind()
+        self._server.server_activate()
+        self._thread = None
+
+    def _handler(self):
+        mock = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode('ascii') + b'\r\n')
+
+            def handle(self):
+                try:
+                    self.converse()
+                except ConnectionError:
+                    # Health checks connect and hang up without QUIT
+                    pass
+
+            def converse(self):
+                self.reply('220 mock-smtp ready')
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode('utf-8', 'replace').strip().upper()
+                    if command.startswith('EHLO'):
+                        self.wfile.write(b'250-mock-smtp\r\n250-PIPELINING\r\n250 8BITMIME\r\n')
+                    elif command.startswith('RCPT'):
+                        with mock._lock:
+                            mock.recipients += 1
+                        self.reply('250 OK')
+                    elif command.startswith('DATA'):
+                        self.reply('354 End data with <CR><LF>.<CR><LF>')
+                        while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                            pass
+                        if mock.latency:
+                            time.sleep(mock.latency)
+                        with mock._lock:
+                            mock.messages += 1
+                        self.reply('250 OK queued')
+                    elif command.startswith('QUIT'):
+                        self.reply('221 Bye')
+                        return
+                    else:
+                        # HELO, MAIL, RCPT, RSET, NOOP
+                        self.reply('250 OK')
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--hf-port', type=int, default=8765)
+    parser.add_argument('--smtp-port', type=int, default=8025)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every inference call')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random latency, up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of inference calls failing with 503/429')
+    parser.add_argument('--token-latency', type=float, default=0.0, help='seconds between streamed tokens')
+    parser.add_argument('--defect-rate', type=float, default=0.0,
+                        help='share of generations missing a section or ending in a loop')
+    parser.add_argument('--ramble', action='store_true', help='keep generating after the last section')
+    parser.add_argument('--smtp-latency', type=float, default=0.0)
+    args = parser.parse_args()
+
+    hf = MockInferenceServer(port=args.hf_port, latency=args.latency, jitter=args.jitter,
+                             error_rate=args.error_rate, token_latency=args.token_latency,
+                             defect_rate=args.defect_rate, ramble=args.ramble).start()
+    smtp = MockSMTPServer(port=args.smtp_port, latency=args.smtp_latency).start()
+    print(f"Mock inference API at {hf.url}, mock SMTP at 127.0.0.1:{args.smtp_port}")
+    print(f"  HUGGINGFACE_API_URL={hf.url} SMTP_HOST=127.0.0.1 SMTP_PORT={args.smtp_port} SMTP_STARTTLS=false")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"inference requests={hf.requests} injected_errors={hf.errors} "
+                  f"tokens_sent={hf.tokens_sent} emails={smtp.messages}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        hf.stop()
+        smtp.stop()
+
+
+if __name__ == '__main__':
+    main()
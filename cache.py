@@ -0,0 +1,272 @@
+"""Content-addressed cache for generated content"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from content import FIELDS, MAGIC, ContentResult
+
+# Marks a shared-tier entry holding a single stage's value rather than a result
+STAGE_MAGIC = b'SV1'
+
+
+def normalize_topic(topic):
+    """Case-fold and collapse whitespace so trivially different topics share a key"""
+    return ' '.join(topic.casefold().split())
+
+
+def make_cache_key(topic, model, prompt_template, parameters):
+    """Hash everything that influences the generated output into one key"""
+    template_hash = hashlib.sha256(prompt_template.encode('utf-8')).hexdigest()
+    material = json.dumps(
+        [normalize_topic(topic), model, template_hash, parameters],
+        sort_keys=True,
+        separators=(',', ':'),
+    )
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def copy_content(content):
+    """Shallow copy so callers can't mutate a cached entry in place"""
+    if isinstance(content, (ContentResult, str)):
+        # Immutable, so it can be shared as is
+        return content
+    if isinstance(content, list):
+        return list(content)
+    return {k: list(v) if isinstance(v, list) else v for k, v in content.items()}
+
+
+def encode_entry(content):
+    """Bytes for the shared tier: packed for results, tagged UTF-8 JSON for stage values"""
+    if isinstance(content, ContentResult):
+        return content.pack()
+    return STAGE_MAGIC + json.dumps(content, ensure_ascii=False).encode('utf-8')
+
+
+def decode_entry(raw):
+    """Inverse of encode_entry; also reads section dicts written as JSON by older versions"""
+    if isinstance(raw, str):
+        raw = raw.encode('utf-8')
+    if raw[:len(MAGIC)] == MAGIC:
+        return ContentResult.unpack(raw)
+    if raw[:len(STAGE_MAGIC)] == STAGE_MAGIC:
+        return json.loads(raw[len(STAGE_MAGIC):])
+    content = json.loads(raw)
+    if not isinstance(content, dict) or any(name not in content for name in FIELDS):
+        # e.g. a stage value from before stage entries were tagged; recomputed on a miss
+        raise ValueError("Not a cached result")
+    return ContentResult.from_dict(content)
+
+
+class LRUCache:
+    """In-process LRU with a per-entry TTL and entry/byte budgets"""
+
+    def __init__(self, max_entries=512, max_bytes=16 * 1024 * 1024, ttl=3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, size, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, size, ttl=None):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (time.monotonic() + (ttl or self.ttl), size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+class SQLiteCache:
+    """On-disk cache tier shared by every worker process on the host"""
+
+    def __init__(self, path, ttl=3600, max_entries=10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS generation_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_generation_cache_accessed"
+            " ON generation_cache (accessed_at)"
+        )
+        conn.commit()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        # A connection must not cross a fork (e.g. from a preloaded gunicorn master)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key):
+        """(value, seconds left to live) for a live key, or None"""
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value, expires_at FROM generation_cache WHERE key = ? AND expires_at > ?",
+            (key, now),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE generation_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        conn.commit()
+        return row[0], row[1] - now
+
+    def set(self, key, value, ttl=None):
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO generation_cache (key, value, expires_at, accessed_at)"
+            " VALUES (?, ?, ?, ?)",
+            (key, value, now + (ttl or self.ttl), now),
+        )
+        # Threads share the counter, each with its own connection
+        with self._writes_lock:
+            self._writes += 1
+            evict = self._writes % 100 == 0
+        # Evict periodically rather than on every write
+        if evict:
+            self._evict(conn, now)
+        conn.commit()
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM generation_cache WHERE expires_at <= ?", (now,))
+        conn.execute(
+            "DELETE FROM generation_cache WHERE key IN ("
+            " SELECT key FROM generation_cache ORDER BY accessed_at DESC"
+            " LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self):
+        conn = self._connect()
+        conn.execute("DELETE FROM generation_cache")
+        conn.commit()
+
+
+class GenerationCache:
+    """Two-tier cache: per-process LRU backed by an optional shared SQLite tier"""
+
+    def __init__(self, memory, shared=None):
+        self.memory = memory
+        self.shared = shared
+        self._stats_lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_shared = 0
+        self.misses = 0
+        self.sets = 0
+
+    def _count(self, field):
+        with self._stats_lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def get(self, key):
+        content = self.memory.get(key)
+        if content is not None:
+            self._count('hits_memory')
+            return copy_content(content)
+
+        if self.shared is not None:
+            try:
+                entry = self.shared.get_entry(key)
+            except sqlite3.Error as e:
+                print(f"Error reading shared cache: {e}")
+                entry = None
+            if entry is not None:
+                raw, ttl = entry
+                try:
+                    content = decode_entry(raw)
+                except ValueError as e:
+                    print(f"Error decoding shared cache entry: {e}")
+                    self._count('misses')
+                    return None
+                # Promote so the next hit in this worker stays in memory, but
+                # only for as long as the shared entry has left to live
+                self.memory.set(key, content, len(raw), ttl)
+                self._count('hits_shared')
+                return copy_content(content)
+
+        self._count('misses')
+        return None
+
+    def set(self, key, content, ttl=None):
+        """Store content; ttl overrides the tiers' default lifetime for this entry"""
+        raw = encode_entry(content)
+        self.memory.set(key, copy_content(content), len(raw), ttl)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, raw, ttl)
+            except sqlite3.Error as e:
+                print(f"Error writing shared cache: {e}")
+        self._count('sets')
+
+    def stats(self):
+        hits = self.hits_memory + self.hits_shared
+        lookups = hits + self.misses
+        return {
+            'hits': hits,
+            'hits_memory': self.hits_memory,
+            'hits_shared': self.hits_shared,
+            'misses': self.misses,
+            'sets': self.sets,
+            'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+            'entries': len(self.memory),
+            'bytes': self.memory.size_bytes,
+            'shared_tier': self.shared is not None,
+        }
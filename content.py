@@ -0,0 +1,191 @@
+"""Compact result type for generated content
+
+A ContentResult holds the five sections of one generation. Its JSON text,
+email body and packed cache encoding are each rendered once, on first use,
+and reused from then on, so a result that is cached, returned to several
+callers and emailed is only ever serialized once per format. Results are
+treated as immutable: build a new one instead of changing a section.
+
+The packed encoding is the canonical form stored in the shared cache tier:
+
+    magic "CR1" | flags (u8) | prompt count (u16) | field lengths (u32 each)
+    | UTF-8 fields: script, video_name, description, meta_tags, prompts...
+"""
+
+import hashlib
+import json
+import struct
+
+FIELDS = ('script', 'video_name', 'description', 'meta_tags', 'image_prompts')
+
+MAGIC = b'CR1'
+FLAG_FALLBACK = 1
+_HEADER = struct.Struct('<3sBH')
+
+EMAIL_IMAGE_LABELS = ('INTRO', 'FACT 1', 'FACT 2', 'FACT 3', 'FACT 4', 'FACT 5', 'OUTRO')
+
+
+class ContentResult:
+    """The sections of one generated result, with lazily cached encodings
+
+    Reads like the plain dict it replaces (content['script'], .items(),
+    .values() ...), so code that only reads sections works with either.
+    """
+
+    __slots__ = FIELDS + ('is_fallback', '_json', '_email', '_packed', '_etag')
+
+    def __init__(self, script='', video_name='', description='', meta_tags='', image_prompts=(),
+                 is_fallback=False, packed=None):
+        self.script = script
+        self.video_name = video_name
+        self.description = description
+        self.meta_tags = meta_tags
+        self.image_prompts = tuple(image_prompts)
+        self.is_fallback = is_fallback
+        self._json = None
+        self._email = None  # (topic, body) of the last rendered email
+        self._packed = packed
+        self._etag = None
+
+    @classmethod
+    def from_dict(cls, content, is_fallback=False):
+        """Wrap a sections dict; a ContentResult is returned unchanged"""
+        if content is None or isinstance(content, cls):
+            return content
+        return cls(content['script'], content['video_name'], content['description'],
+                   content['meta_tags'], content['image_prompts'], is_fallback)
+
+    def to_dict(self):
+        return {name: getattr(self, name) if name != 'image_prompts' else list(self.image_prompts)
+                for name in FIELDS}
+
+    # -- dict-style reads ----------------------------------------------
+
+    def __getitem__(self, name):
+        if name not in FIELDS:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def get(self, name, default=None):
+        return getattr(self, name) if name in FIELDS else default
+
+    def __contains__(self, name):
+        return name in FIELDS
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def keys(self):
+        return FIELDS
+
+    def values(self):
+        return [getattr(self, name) for name in FIELDS]
+
+    def items(self):
+        return [(name, getattr(self, name)) for name in FIELDS]
+
+    def __eq__(self, other):
+        if isinstance(other, ContentResult):
+            return self.values() == other.values() and self.is_fallback == other.is_fallback
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"ContentResult(video_name={self.video_name!r}, is_fallback={self.is_fallback})"
+
+    # -- encodings -----------------------------------------------------
+
+    def json_text(self):
+        """The sections as a JSON object, rendered once"""
+        if self._json is None:
+            self._json = json.dumps(self.to_dict(), ensure_ascii=False)
+        return self._json
+
+    def email_body(self, topic):
+        """Plain-text email body; repeat renders for the same topic are free"""
+        cached = self._email
+        if cached is not None and cached[0] == topic:
+            return cached[1]
+        labels = EMAIL_IMAGE_LABELS
+        body = f"""
+        Topic: {topic}
+        
+        🎬 VIDEO SCRIPT (2-3 minutes):
+        {self.script}
+        
+        📺 YOUTUBE SHORTS CONTENT:
+        Video Title: {self.video_name}
+        
+        Description:
+        {self.description}
+        
+        Meta Tags: {self.meta_tags}
+        
+        🖼️ AI IMAGE GENERATION PROMPTS (9:16 vertical):
+        {chr(10).join([f"{labels[i]}: {prompt}" for i, prompt in enumerate(self.image_prompts)])}
+        
+        ---
+        Generated by AI Agent
+        """
+        self._email = (topic, body)
+        return body
+
+    def pack(self):
+        """The canonical binary encoding, built once"""
+        if self._packed is None:
+            fields = [self.script, self.video_name, self.description, self.meta_tags, *self.image_prompts]
+            encoded = [field.encode('utf-8') for field in fields]
+            self._packed = b''.join([
+                _HEADER.pack(MAGIC, FLAG_FALLBACK if self.is_fallback else 0, len(self.image_prompts)),
+                struct.pack(f'<{len(encoded)}I', *map(len, encoded)),
+                *encoded,
+            ])
+        return self._packed
+
+    def etag(self):
+        """Hash of the packed encoding, for HTTP validators"""
+        if self._etag is None:
+            self._etag = hashlib.sha256(self.pack()).hexdigest()[:32]
+        return self._etag
+
+    @classmethod
+    def unpack(cls, data):
+        """Inverse of pack(); raises ValueError on anything else"""
+        data = bytes(data)
+        if len(data) < _HEADER.size:
+            raise ValueError("Packed content is truncated")
+        magic, flags, count = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a packed content result")
+        try:
+            lengths = struct.unpack_from(f'<{4 + count}I', data, _HEADER.size)
+        except struct.error as e:
+            raise ValueError(f"Packed content is truncated: {e}")
+        offset = _HEADER.size + 4 * len(lengths)
+        if offset + sum(lengths) != len(data):
+            raise ValueError("Packed content has the wrong length")
+        view = memoryview(data)
+        fields = []
+        for length in lengths:
+            fields.append(str(view[offset:offset + length], 'utf-8'))
+            offset += length
+        return cls(*fields[:4], fields[4:], is_fallback=bool(flags & FLAG_FALLBACK), packed=data)
+
+
+def dumps_with_content(payload):
+    """json.dumps for a response dict whose 'content' may be a ContentResult
+
+    The result's cached JSON is spliced in rather than serialized again.
+    """
+    content = payload.get('content')
+    if not isinstance(content, ContentResult):
+        return json.dumps(payload, ensure_ascii=False)
+    rest = json.dumps({key: value for key, value in payload.items() if key != 'content'}, ensure_ascii=False)
+    separator = ', ' if rest != '{}' else ''
+    return f'{rest[:-1]}{separator}"content": {content.json_text()}}}'
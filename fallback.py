@@ -0,0 +1,108 @@
+"""Precompiled fallback content used when the AI API is unavailable"""
+
+from functools import lru_cache
+
+from content import ContentResult
+
+PLACEHOLDER = '{topic}'
+
+
+class TopicTemplate:
+    """A template split once, at import, into immutable static segments
+
+    Rendering only splices the topic between the shared segments, so a
+    render is a single str.join with no formatting work.
+    """
+
+    __slots__ = ('segments',)
+
+    def __init__(self, source):
+        self.segments = tuple(source.split(PLACEHOLDER))
+
+    def render(self, topic):
+        return topic.join(self.segments)
+
+
+# Video Script (2-3 minutes)
+SCRIPT_TEMPLATE = TopicTemplate("""
+🎬 **VIDEO SCRIPT: 5 Interesting and Unknown Facts About {topic}**
+
+[HOOK - First 10 seconds]
+Hey there! Did you know that {topic} has some secrets that will absolutely blow your mind? Stick around because you're about to discover 5 fascinating facts about {topic} that almost nobody knows!
+
+[FACT 1]
+Here's something incredible: {topic} has been around for much longer than you might think. Scientists have discovered evidence that suggests {topic} has been influencing our world for centuries, and the way it works is absolutely mind-bending. What's even more surprising is that most people use {topic} every single day without even realizing its true potential.
+
+[FACT 2]
+Get this: {topic} has some properties that scientists are still trying to fully understand. Recent research has revealed that {topic} behaves in ways that completely defy our expectations. It's like nature decided to play a trick on us, and the more we learn about {topic}, the more mysterious it becomes.
+
+[FACT 3]
+This next fact will change how you think about {topic} forever. Did you know that {topic} has played a crucial role in some of the most important discoveries in human history? Without {topic}, many of the things we take for granted today might never have been possible. It's literally been a game-changer throughout history.
+
+[FACT 4]
+Here's where it gets really interesting: {topic} has some hidden connections that most people never discover. The way it interacts with other elements in our world is absolutely fascinating, and once you understand these connections, you'll see {topic} in a completely new light.
+
+[FACT 5]
+And finally, the most mind-blowing fact of all: {topic} is still evolving and changing even today. Modern technology has given us new ways to understand and utilize {topic}, and what we're discovering now is just the beginning. The future of {topic} is going to be absolutely incredible!
+
+[OUTRO]
+If you found these facts about {topic} as fascinating as I do, make sure to hit that like button and follow for more amazing discoveries! There's always something new to learn, and I can't wait to share more incredible facts with you. Thanks for watching!
+""")
+
+# YouTube Shorts Title
+VIDEO_NAME_TEMPLATE = TopicTemplate('5 Unknown Facts About {topic} That Will Shock You! 🤯')
+
+# Video Description
+DESCRIPTION_TEMPLATE = TopicTemplate('Discover 5 mind-blowing and lesser-known facts about {topic} that will completely change how you see the world! From ancient discoveries to modern breakthroughs, this video reveals secrets about {topic} that almost nobody knows. Follow for more amazing facts! 🔔')
+
+# Meta Tags / Hashtags
+META_TAGS_TEMPLATE = TopicTemplate('#shorts #{topic}facts #{topic}shorts #{topic}trivia #curiousfacts #didyouknow #amazingfacts #mindblowing #education #learning #viral #trending #youtubeshorts')
+
+# AI Image Generation Prompts (9:16 vertical aspect ratio)
+IMAGE_PROMPT_TEMPLATES = (
+    # INTRO IMAGE
+    TopicTemplate("Epic cinematic 9:16 vertical shot for YouTube Shorts intro: {topic} concept with dramatic golden hour lighting, mysterious fog swirling around, floating holographic text saying '5 Unknown Facts', scientific diagrams and formulas glowing in the background, professional photography style with shallow depth of field, high contrast, cinematic composition, trending on social media aesthetic, perfect for grabbing viewer attention in first 3 seconds"),
+
+    # FACT 1 IMAGE
+    TopicTemplate('Detailed 9:16 vertical illustration for fact 1: {topic} with ancient historical elements, vintage parchment texture background, detailed hand-drawn diagrams and maps, mystical atmosphere with glowing elements, historical accuracy, renaissance-style artwork, intricate details, warm sepia tones, professional illustration quality, perfect for educational content'),
+
+    # FACT 2 IMAGE
+    TopicTemplate('Modern laboratory setting 9:16 vertical shot: {topic} research equipment with clean white background, scientific instruments and microscopes, blue and white LED lighting, professional photography style, high-tech atmosphere, clean minimalist design, perfect for scientific content, trending aesthetic'),
+
+    # FACT 3 IMAGE
+    TopicTemplate('Timeline visualization 9:16 vertical format: {topic} development through history with chronological progression, modern infographic style, clean design, educational illustration, colorful timeline elements, professional graphic design, perfect for educational content, social media optimized'),
+
+    # FACT 4 IMAGE
+    TopicTemplate('Connection network visualization 9:16 vertical shot: {topic} with interconnected elements, neural network style graphics, flowing lines and connections, modern digital art style, vibrant colors, professional illustration, perfect for showing relationships and connections, trending design aesthetic'),
+
+    # FACT 5 IMAGE
+    TopicTemplate('Futuristic visualization 9:16 vertical shot: {topic} applications with sci-fi atmosphere, holographic displays floating in space, advanced technology elements, neon lighting effects, cutting-edge design, cyberpunk aesthetic, professional 3D rendering style, perfect for showing future possibilities'),
+
+    # OUTRO IMAGE
+    TopicTemplate('Engaging 9:16 vertical outro shot: {topic} concept with call-to-action elements, like and subscribe buttons floating, social media icons, vibrant colors, modern design, perfect for encouraging viewer engagement, trending YouTube Shorts aesthetic, professional graphic design, optimized for viewer retention'),
+)
+
+
+def clean_topic(topic):
+    """Collapse whitespace so equivalent topics share one memoized render"""
+    return ' '.join(topic.split())
+
+
+# Bounded so a stream of unique topics during an outage cannot grow memory
+@lru_cache(maxsize=256)
+def _render(topic):
+    return ContentResult(
+        SCRIPT_TEMPLATE.render(topic),
+        VIDEO_NAME_TEMPLATE.render(topic),
+        DESCRIPTION_TEMPLATE.render(topic),
+        META_TAGS_TEMPLATE.render(topic),
+        tuple(template.render(topic) for template in IMAGE_PROMPT_TEMPLATES),
+        is_fallback=True,
+    )
+
+
+def render_fallback(topic):
+    """Return fallback content for a topic, rendering each topic only once"""
+    # Results are immutable, so every caller shares the memoized one along
+    # with its already-rendered JSON and email body
+    return _render(clean_topic(topic))
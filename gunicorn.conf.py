@@ -0,0 +1,31 @@
+"""gunicorn settings (picked up automatically from the working directory)
+
+    gunicorn "app:create_app()"
+
+With preload_app the master imports the app once and every worker is forked
+from it, sharing configuration, templates and (with the local backend) model
+weights copy-on-write. Set GUNICORN_PRELOAD=false to have each worker import
+the app itself, e.g. to pick up code changes on a HUP.
+"""
+
+import os
+
+# gunicorn itself reads PORT and WEB_CONCURRENCY for the bind address and worker count
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+
+def pre_fork(server, worker):
+    if server.cfg.preload_app:
+        import app
+
+        # Runs once; later forks find everything already loaded
+        app.preload()
+
+
+def post_fork(server, worker):
+    # Background threads don't survive the fork; start this worker's own.
+    # Async (uvicorn) workers start theirs from the ASGI lifespan instead.
+    if 'uvicorn' not in server.cfg.worker_class_str.lower():
+        import app
+
+        app.start_background()
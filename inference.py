@@ -0,0 +1,286 @@
+"""Pooled HTTP client for the Hugging Face Inference API"""
+
+import json
+import os
+import random
+import threading
+import time
+
+from metrics import UPSTREAM_RESPONSES
+
+# Status codes that mean "try again shortly" on the free inference tier:
+# 429 is rate limiting, 503 is returned while the model is being loaded.
+RETRYABLE_STATUS_CODES = (429, 503)
+
+
+class UpstreamError(Exception):
+    """Raised when the inference API could not produce a usable response"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpenError(UpstreamError):
+    """Raised without touching the network while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def allow_request(self):
+        """Return True if a call may go out to the upstream right now"""
+        return self.admit() is not None
+
+    def admit(self):
+        """None if a call is refused, else 'probe' for the half-open probe or 'closed'
+
+        A probe must end in record_success(), record_failure() or, if it
+        ended without a verdict on the upstream, release_probe().
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return None
+            # Cool-down elapsed: let exactly one probe through
+            if self._probe_in_flight:
+                return None
+            self._probe_in_flight = True
+            return 'probe'
+
+    def release_probe(self):
+        """Let the next call probe again, leaving the breaker's state as it is"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                # A failed probe re-opens the breaker for another full cool-down
+                self._opened_at = time.monotonic()
+
+
+class InferenceClient:
+    """Keep-alive session to the inference API with timeouts, retries and a breaker"""
+
+    def __init__(self, base_url, token='', pool_size=10, connect_timeout=3.05,
+                 read_timeout=30.0, max_retries=2, backoff_base=0.5,
+                 backoff_max=8.0, breaker=None, limiter=None):
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+
+        self.pool_size = pool_size
+        self._token = token
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        """Pooled keep-alive session, created on first use in each process
+
+        Deferring it keeps requests out of the import path, and a worker forked
+        from a preloaded gunicorn master never shares the master's sockets.
+        """
+        if self._session is None or self._session_pid != os.getpid():
+            with self._session_lock:
+                if self._session is None or self._session_pid != os.getpid():
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    # Retries are handled in post_model() so they can be jittered and
+                    # reported to the breaker; the adapter only sizes the pool.
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size,
+                                          max_retries=0, pool_block=False)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    if self._token:
+                        session.headers['Authorization'] = f"Bearer {self._token}"
+                    self._session = session
+                    self._session_pid = os.getpid()
+        return self._session
+
+    def _backoff_delay(self, attempt, hint=None):
+        """Full-jitter exponential backoff, stretched by any server hint"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if hint is not None:
+            delay = max(delay, min(hint, self.backoff_max))
+        return delay
+
+    def _send(self, model, payload, stream=False):
+        """POST with retries and breaker accounting; returns a 200 response"""
+        if self.limiter is not None:
+            # Wait for a rate-limit slot before claiming the breaker's probe
+            self.limiter.acquire()
+        admission = self.breaker.admit()
+        if admission is None:
+            UPSTREAM_RESPONSES.inc(model, 'circuit_open')
+            raise CircuitOpenError(f"Circuit open for {self.base_url}")
+        try:
+            return self._attempts(model, payload, stream)
+        finally:
+            if admission == 'probe':
+                # A probe cut short by anything but an upstream verdict (an
+                # unexpected error, no budget left to retry) must not leave
+                # the breaker refusing every call
+                self.breaker.release_probe()
+
+    def _attempts(self, model, payload, stream):
+        """The POST and its retries, reporting the upstream's health to the breaker"""
+        import requests
+
+        url = f"{self.base_url}{model}"
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            hint = None
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout, stream=stream)
+            except requests.RequestException as e:
+                UPSTREAM_RESPONSES.inc(model, 'timeout' if isinstance(e, requests.Timeout) else 'error')
+                last_error = UpstreamError(f"Request to {model} failed: {e}")
+            else:
+                UPSTREAM_RESPONSES.inc(model, str(response.status_code))
+                if response.status_code == 200:
+                    self.breaker.record_success()
+                    if self.limiter is not None:
+                        self.limiter.on_success()
+                    return response
+                hint = _retry_hint(response)
+                # A streamed response holds its pooled connection until closed
+                response.close()
+                if response.status_code == 429 and self.limiter is not None:
+                    self.limiter.on_throttled(hint)
+                last_error = UpstreamError(
+                    f"{model} returned HTTP {response.status_code}",
+                    status_code=response.status_code,
+                )
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    # Client errors (bad token, bad payload) are not an outage
+                    if response.status_code >= 500:
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()
+                    raise last_error
+
+            if attempt < self.max_retries:
+                delay = self._backoff_delay(attempt, hint)
+                if self.limiter is not None:
+                    # Running out of latency budget raises here; that says nothing
+                    # about the upstream, so it isn't a breaker failure
+                    self.limiter.ensure_budget(delay)
+                    time.sleep(delay)
+                    self.limiter.acquire()
+                else:
+                    time.sleep(delay)
+
+        self.breaker.record_failure()
+        raise last_error
+
+    def post_model(self, model, payload):
+        """POST a payload to a model endpoint and return the decoded JSON body"""
+        return self._send(model, payload).json()
+
+    def generate_text(self, model, prompt, parameters):
+        """Run a text-generation model and return the generated text"""
+        data = self.post_model(model, {"inputs": prompt, "parameters": parameters})
+        try:
+            return data[0]["generated_text"]
+        except (KeyError, IndexError, TypeError):
+            raise UpstreamError(f"Unexpected response shape from {model}")
+
+    def warm(self, model):
+        """Send a tiny request that waits for the model to load instead of failing with 503"""
+        self.post_model(model, {
+            "inputs": "Hello",
+            "parameters": {"max_new_tokens": 1},
+            "options": {"wait_for_model": True},
+        })
+
+    def stream_text(self, model, prompt, parameters):
+        """Yield generated text chunks (without the prompt) as the model produces them
+
+        Models served with token streaming answer with server-sent events;
+        anything else answers with plain JSON, which is yielded as one chunk.
+        """
+        import requests
+
+        payload = {"inputs": prompt, "parameters": parameters, "stream": True}
+        response = self._send(model, payload, stream=True)
+        with response:
+            if 'text/event-stream' not in response.headers.get('Content-Type', ''):
+                data = response.json()
+                try:
+                    text = data[0]["generated_text"]
+                except (KeyError, IndexError, TypeError):
+                    raise UpstreamError(f"Unexpected response shape from {model}")
+                # Only the continuation is streamed, never the echoed prompt
+                yield text[len(prompt):] if text.startswith(prompt) else text
+                return
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith('data:'):
+                        continue
+                    event = json.loads(line[5:])
+                    if event.get('error'):
+                        raise UpstreamError(f"{model} stream failed: {event['error']}")
+                    token = event.get('token') or {}
+                    if token.get('text') and not token.get('special'):
+                        yield token['text']
+            except requests.RequestException as e:
+                raise UpstreamError(f"Stream from {model} interrupted: {e}")
+
+    def summarize(self, model, text, parameters=None):
+        """Run a summarization model and return the summary text"""
+        data = self.post_model(model, {"inputs": text, "parameters": parameters or {}})
+        try:
+            return data[0]["summary_text"]
+        except (KeyError, IndexError, TypeError):
+            raise UpstreamError(f"Unexpected response shape from {model}")
+
+
+def _retry_hint(response):
+    """Seconds the server asked us to wait, from Retry-After or estimated_time"""
+    retry_after = response.headers.get('Retry-After')
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    if response.status_code == 503:
+        try:
+            return float(response.json().get('estimated_time'))
+        except (ValueError, TypeError, AttributeError):
+            pass
+    return None
@@ -0,0 +1,365 @@
+"""Durable generation jobs: POST /jobs answers at once, worker processes do the work
+
+Jobs are rows in a SQLite (WAL) file, so the web processes that accept them
+and the worker processes that run them share nothing but that file, scale
+independently, and either side can restart without losing a job. A worker
+claims a job by taking a lease on it; a job whose worker dies is claimed
+again once the lease runs out, up to max_attempts times.
+
+Run the worker pool next to the web server:
+    python jobs.py --processes 2 --threads 4
+"""
+
+import argparse
+import json
+import os
+import re
+import signal
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+FINISHED = ('done', 'failed')
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS jobs ("
+    " id TEXT PRIMARY KEY,"
+    " topic TEXT NOT NULL,"
+    " options TEXT NOT NULL,"
+    " status TEXT NOT NULL,"
+    " stage TEXT NOT NULL,"
+    " version INTEGER NOT NULL DEFAULT 0,"
+    " attempts INTEGER NOT NULL DEFAULT 0,"
+    " run_after REAL NOT NULL,"
+    " lease_until REAL,"
+    " worker TEXT,"
+    " result TEXT,"
+    " error TEXT,"
+    " created_at REAL NOT NULL,"
+    " updated_at REAL NOT NULL,"
+    " started_at REAL,"
+    " finished_at REAL)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs (status, run_after)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_lease ON jobs (status, lease_until)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at)",
+)
+
+
+class JobQueue:
+    """SQLite-backed job table shared by every web and worker process"""
+
+    def __init__(self, path, lease_seconds=300.0, max_attempts=3, backoff_base=10.0, retention=7 * 86400):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.retention = retention
+        self._local = threading.local()
+        conn = self._connect()
+        with conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Autocommit, so claim() can take the write lock with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _update(self, job_id, worker, **fields):
+        """Change a job this worker still holds; False if its lease was lost"""
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f"{name} = :{name}" for name in fields)
+        cursor = self._connect().execute(
+            f"UPDATE jobs SET {assignments}, version = version + 1"
+            " WHERE id = :id AND worker = :worker AND status = 'running'",
+            dict(fields, id=job_id, worker=worker),
+        )
+        return cursor.rowcount == 1
+
+    # -- web side ------------------------------------------------------
+
+    def enqueue(self, topic, options=None):
+        """Add a job and return its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO jobs (id, topic, options, status, stage, run_after, created_at, updated_at)"
+            " VALUES (?, ?, ?, 'queued', 'queued', ?, ?, ?)",
+            (job_id, topic, json.dumps(options or {}), now, now, now),
+        )
+        return job_id
+
+    def get(self, job_id):
+        """The job's status record, or None"""
+        if not JOB_ID_RE.match(job_id):
+            return None
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        record = {
+            'id': row['id'],
+            'topic': row['topic'],
+            'status': row['status'],
+            'stage': row['stage'],
+            'version': row['version'],
+            'attempts': row['attempts'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+            'started_at': row['started_at'],
+            'finished_at': row['finished_at'],
+        }
+        if row['status'] == 'queued':
+            record['position'] = self._connect().execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND run_after < ?", (row['run_after'],)
+            ).fetchone()[0]
+        if row['result'] is not None:
+            record['result'] = json.loads(row['result'])
+        if row['error'] is not None:
+            record['error'] = row['error']
+        return record
+
+    def wait(self, job_id, version=None, timeout=30.0, poll_interval=0.25):
+        """Long-poll: the job once it is past `version` or finished, or as it is after `timeout`
+
+        The worker is usually another process, so this polls the row (a
+        primary-key read on a WAL database never waits for writers).
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if (job is None or job['status'] in FINISHED
+                    or (version is not None and job['version'] != version)
+                    or time.monotonic() >= deadline):
+                return job
+            time.sleep(min(poll_interval, max(0.0, deadline - time.monotonic())))
+
+    def queued_count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def stats(self):
+        counts = dict(self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in ('queued', 'running', 'done', 'failed')}
+
+    # -- worker side ---------------------------------------------------
+
+    def claim(self, worker):
+        """Lease the oldest due job (or one whose worker went quiet) to `worker`, or None"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Jobs that keep losing their worker are given up on, not retried forever
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', stage = 'failed', error = 'worker lost', finished_at = ?,"
+                " updated_at = ?, version = version + 1"
+                " WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (now, now, now, self.max_attempts),
+            )
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE (status = 'queued' AND run_after <= ?)"
+                " OR (status = 'running' AND lease_until < ?) ORDER BY run_after LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', stage = 'claimed', worker = ?, lease_until = ?,"
+                " attempts = attempts + 1, started_at = COALESCE(started_at, ?), updated_at = ?,"
+                " version = version + 1 WHERE id = ?",
+                (worker, now + self.lease_seconds, now, now, row['id']),
+            )
+            job = conn.execute("SELECT id, topic, options, attempts FROM jobs WHERE id = ?", (row['id'],)).fetchone()
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return {'id': job['id'], 'topic': job['topic'], 'options': json.loads(job['options']),
+                'attempts': job['attempts']}
+
+    def progress(self, job_id, worker, stage):
+        """Record the job's current stage and extend its lease"""
+        return self._update(job_id, worker, stage=stage, lease_until=time.time() + self.lease_seconds)
+
+    def complete(self, job_id, worker, result_json):
+        """Finish a job with its result, already encoded as JSON"""
+        return self._update(job_id, worker, status='done', stage='done', result=result_json,
+                            error=None, finished_at=time.time())
+
+    def fail(self, job_id, worker, error, attempts):
+        """Retry the job later with backoff, or fail it for good after max_attempts"""
+        if attempts < self.max_attempts:
+            return self._update(job_id, worker, status='queued', stage='retrying', error=error,
+                                lease_until=None,
+                                run_after=time.time() + self.backoff_base * 2 ** (attempts - 1))
+        return self._update(job_id, worker, status='failed', stage='failed', error=error,
+                            finished_at=time.time())
+
+    def prune(self):
+        """Drop finished jobs older than the retention period"""
+        cursor = self._connect().execute(
+            "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (time.time() - self.retention,))
+        return cursor.rowcount
+
+
+class JobWorker:
+    """Claims jobs from a JobQueue on `threads` threads and runs handler(job, progress) on each
+
+    The handler returns the job's result as a JSON string; progress(stage)
+    records how far it got and keeps the lease alive.
+    """
+
+    def __init__(self, jobs, handler, threads=2, poll_interval=1.0, prune_interval=3600.0):
+        self.jobs = jobs
+        self.handler = handler
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.prune_interval = prune_interval
+        self._threads = []
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._pruned_at = 0.0
+        self.completed = 0
+        self.failed = 0
+        self.lost = 0
+
+    def start(self):
+        """Start the worker threads in this process if they aren't running"""
+        with self._start_lock:
+            if self._pid == os.getpid() and any(t.is_alive() for t in self._threads):
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._threads = [
+                threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+                for i in range(self.threads)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=30.0):
+        """Stop claiming jobs and give the running ones `timeout` seconds to finish"""
+        self._stopping.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+    def _run(self):
+        worker = f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+        while not self._stopping.is_set():
+            try:
+                job = self.jobs.claim(worker)
+                if job is None:
+                    self._maybe_prune()
+                    self._stopping.wait(self.poll_interval)
+                    continue
+                self._process(job, worker)
+            except Exception as e:
+                print(f"Error in job worker: {e}")
+                self._stopping.wait(self.poll_interval)
+
+    def _process(self, job, worker):
+        def progress(stage):
+            if not self.jobs.progress(job['id'], worker, stage):
+                print(f"Lost the lease on job {job['id']}")
+
+        try:
+            result = self.handler(job, progress)
+        except Exception as e:
+            print(f"Error running job {job['id']} (attempt {job['attempts']}): {e}")
+            if self.jobs.fail(job['id'], worker, str(e), job['attempts']):
+                self.failed += 1
+            else:
+                self._lost(job)
+            return
+        if self.jobs.complete(job['id'], worker, result):
+            self.completed += 1
+        else:
+            self._lost(job)
+
+    def _lost(self, job):
+        # Another worker re-claimed the job after our lease ran out; its outcome stands
+        print(f"Lost the lease on job {job['id']}, discarding this attempt's outcome")
+        self.lost += 1
+
+    def _maybe_prune(self):
+        if time.monotonic() - self._pruned_at < self.prune_interval:
+            return
+        self._pruned_at = time.monotonic()
+        try:
+            self.jobs.prune()
+        except sqlite3.Error as e:
+            print(f"Error pruning jobs: {e}")
+
+    def stats(self):
+        return {'threads': self.threads, 'completed': self.completed, 'failed': self.failed, 'lost': self.lost}
+
+
+def run_worker_process(threads):
+    """One worker process: the app's background threads plus `threads` job threads"""
+    # Imported here so the module stays importable from app.py itself
+    import app
+
+    app.start_background()
+    worker = app.build_job_worker(threads)
+    stopping = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stopping.set())
+    worker.start()
+    print(f"Job worker {os.getpid()} running {threads} threads on {app.JOBS_DB_PATH}")
+    stopping.wait()
+    # Running jobs get to finish; anything cut off is re-claimed once its lease expires
+    worker.stop()
+    app.delivery_queue.stop()
+    if app.content_store is not None:
+        app.content_store.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run generation job workers")
+    parser.add_argument('--processes', type=int, default=int(os.getenv('JOB_PROCESSES', 1)),
+                        help="Worker processes")
+    parser.add_argument('--threads', type=int, default=int(os.getenv('JOB_THREADS', 4)),
+                        help="Job threads per process")
+    args = parser.parse_args(argv)
+
+    if args.processes <= 1:
+        run_worker_process(args.threads)
+        return 0
+
+    import multiprocessing
+
+    processes = [multiprocessing.Process(target=run_worker_process, args=(args.threads,), name=f'job-worker-{i}')
+                 for i in range(args.processes)]
+    for process in processes:
+        process.start()
+
+    def forward(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for process in processes:
+        process.join()
+    return 0 if all(process.exitcode == 0 for process in processes) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
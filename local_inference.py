@@ -0,0 +1,222 @@
+"""In-process CPU inference backend built on transformers/torch"""
+
+import json
+import os
+import queue
+import threading
+import time
+
+from inference import UpstreamError
+
+
+class _PendingRequest:
+    __slots__ = ('inputs', 'parameters', 'done', 'result', 'error')
+
+    def __init__(self, inputs, parameters):
+        self.inputs = inputs
+        self.parameters = parameters
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Collects concurrent calls for a short window and runs them as one batch"""
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait=0.02):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+            self._thread.start()
+
+    def submit(self, inputs, parameters):
+        """Queue one input and block until its batch has been processed"""
+        self._ensure_thread()
+        request = _PendingRequest(inputs, parameters)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Requests can only share a forward pass if their parameters match
+            groups = {}
+            for request in batch:
+                key = json.dumps(request.parameters, sort_keys=True)
+                groups.setdefault(key, []).append(request)
+            for requests_ in groups.values():
+                try:
+                    outputs = self.run_batch([r.inputs for r in requests_], requests_[0].parameters)
+                    for request, output in zip(requests_, outputs):
+                        request.result = output
+                except Exception as e:
+                    for request in requests_:
+                        request.error = e
+                for request in requests_:
+                    request.done.set()
+
+
+class LocalBackend:
+    """Runs the configured Hugging Face models on CPU inside this process
+
+    Models are loaded lazily on first use (or eagerly via preload()) and
+    shared by every request thread in the worker. Concurrent prompts are
+    micro-batched into a single forward pass.
+    """
+
+    def __init__(self, num_threads=None, quantize=False, max_batch_size=8, max_wait=0.02):
+        self.num_threads = num_threads
+        self.quantize = quantize
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pipelines = {}
+        self._batchers = {}
+        self._load_lock = threading.Lock()
+
+    def _load_pipeline(self, task, model):
+        """Load a transformers pipeline once per process"""
+        key = (task, model)
+        pipe = self._pipelines.get(key)
+        if pipe is not None:
+            return pipe
+        with self._load_lock:
+            pipe = self._pipelines.get(key)
+            if pipe is not None:
+                return pipe
+
+            # Heavy imports are deferred until a local model is actually used
+            import torch
+            from transformers import pipeline
+
+            if self.num_threads:
+                torch.set_num_threads(self.num_threads)
+
+            started = time.perf_counter()
+            pipe = pipeline(task, model=model, device=-1)
+            pipe.model.eval()
+            if self.quantize:
+                # Dynamic int8 only rewrites nn.Linear layers (e.g. BART);
+                # GPT-2's Conv1D projections are left in fp32.
+                pipe.model = torch.quantization.quantize_dynamic(
+                    pipe.model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+            if task == 'text-generation':
+                # Left padding so batched prompts generate from aligned ends
+                pipe.tokenizer.padding_side = 'left'
+                if pipe.tokenizer.pad_token is None:
+                    pipe.tokenizer.pad_token = pipe.tokenizer.eos_token
+            print(f"Loaded local {task} model {model} in {time.perf_counter() - started:.1f}s")
+
+            self._pipelines[key] = pipe
+            return pipe
+
+    def _batcher(self, task, model):
+        key = (task, model)
+        batcher = self._batchers.get(key)
+        if batcher is None:
+            batcher = self._batchers.setdefault(key, MicroBatcher(
+                lambda inputs, parameters: self._run_batch(task, model, inputs, parameters),
+                max_batch_size=self.max_batch_size,
+                max_wait=self.max_wait,
+            ))
+        return batcher
+
+    def _run_batch(self, task, model, inputs, parameters):
+        import torch
+
+        pipe = self._load_pipeline(task, model)
+        kwargs = dict(parameters)
+        if task == 'text-generation':
+            kwargs.setdefault('pad_token_id', pipe.tokenizer.eos_token_id)
+            kwargs.setdefault('truncation', True)
+        with torch.inference_mode():
+            outputs = pipe(inputs, batch_size=len(inputs), **kwargs)
+        if task == 'text-generation':
+            # One list of candidate sequences per input prompt
+            return [output[0]['generated_text'] for output in outputs]
+        return [output['summary_text'] for output in outputs]
+
+    def preload(self, models):
+        """Load models up front, e.g. before gunicorn forks its workers"""
+        self._load_pipeline('text-generation', models['text_generation'])
+        self._load_pipeline('summarization', models['summarization'])
+
+    def warm(self, model):
+        """Load a text-generation model if this process hasn't yet"""
+        self._load_pipeline('text-generation', model)
+
+    def generate_text(self, model, prompt, parameters):
+        """Run a text-generation model and return the generated text"""
+        try:
+            return self._batcher('text-generation', model).submit(prompt, parameters)
+        except Exception as e:
+            raise UpstreamError(f"Local generation with {model} failed: {e}")
+
+    def stream_text(self, model, prompt, parameters, timeout=120.0):
+        """Yield generated text chunks as they are decoded (not micro-batched)"""
+        stop = threading.Event()
+        try:
+            import torch
+            from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+            class Stopped(StoppingCriteria):
+                def __call__(self, input_ids, scores, **kwargs):
+                    return stop.is_set()
+
+            pipe = self._load_pipeline('text-generation', model)
+            streamer = TextIteratorStreamer(pipe.tokenizer, skip_prompt=True,
+                                            skip_special_tokens=True, timeout=timeout)
+            inputs = pipe.tokenizer(prompt, return_tensors='pt', truncation=True)
+            kwargs = dict(parameters)
+            kwargs.setdefault('pad_token_id', pipe.tokenizer.eos_token_id)
+
+            def run():
+                with torch.inference_mode():
+                    pipe.model.generate(**inputs, streamer=streamer,
+                                        stopping_criteria=StoppingCriteriaList([Stopped()]), **kwargs)
+
+            threading.Thread(target=run, name='local-stream', daemon=True).start()
+        except Exception as e:
+            raise UpstreamError(f"Local streaming with {model} failed: {e}")
+        try:
+            yield from streamer
+        except queue.Empty:
+            raise UpstreamError(f"Local streaming with {model} stalled for {timeout}s")
+        finally:
+            # A caller that stops reading (closes this generator) stops the model at its next token
+            stop.set()
+
+    def summarize(self, model, text, parameters=None):
+        """Run a summarization model and return the summary text"""
+        try:
+            return self._batcher('summarization', model).submit(text, parameters or {})
+        except Exception as e:
+            raise UpstreamError(f"Local summarization with {model} failed: {e}")
@@ -0,0 +1,371 @@
+"""Background email delivery queue with a durable on-disk spool"""
+
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+
+from metrics import stage
+
+# Spool layout: one JSON file per message, moved between state directories
+# with os.rename so claims are atomic across gunicorn workers.
+SPOOL_STATES = ('pending', 'sending', 'sent', 'failed')
+DELIVERY_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+def pipelined_sendmail(smtp, sender, recipients, message):
+    """sendmail() that writes MAIL FROM and every RCPT TO in one go when the server allows it
+
+    Without PIPELINING each recipient costs a network round trip; with it a
+    message to any number of recipients costs three (envelope, DATA, body).
+    Returns {recipient: (code, reply)} for refused recipients, like sendmail().
+    """
+    import smtplib
+
+    smtp.ehlo_or_helo_if_needed()
+    if not smtp.has_extn('pipelining'):
+        return smtp.sendmail(sender, recipients, message)
+
+    envelope = f"MAIL FROM:{smtplib.quoteaddr(sender)}\r\n"
+    envelope += ''.join(f"RCPT TO:{smtplib.quoteaddr(recipient)}\r\n" for recipient in recipients)
+    smtp.send(envelope)
+    # Every command gets a reply, in order, even after MAIL FROM was refused
+    mail_code, mail_reply = smtp.getreply()
+    refused = {}
+    for recipient in recipients:
+        code, reply = smtp.getreply()
+        if code not in (250, 251):
+            refused[recipient] = (code, reply)
+    if mail_code != 250:
+        smtp.rset()
+        raise smtplib.SMTPSenderRefused(mail_code, mail_reply, sender)
+    if len(refused) == len(recipients):
+        smtp.rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+    code, reply = smtp.data(message)
+    if code != 250:
+        smtp.rset()
+        raise smtplib.SMTPDataError(code, reply)
+    return refused
+
+
+class DeliveryQueue:
+    """Spools messages to disk and sends them in batches over one SMTP session"""
+
+    def __init__(self, spool_dir, smtp_host, smtp_port, username=None, password=None,
+                 sender=None, use_starttls=True, batch_size=20, max_attempts=5,
+                 backoff_base=30.0, backoff_max=900.0, idle_timeout=60.0,
+                 poll_interval=2.0, stale_after=300.0, smtp_timeout=30.0,
+                 sent_retention=7 * 24 * 3600):
+        self.spool_dir = spool_dir
+        self.smtp_host = smtp_host
+        self.smtp_port = smtp_port
+        self.username = username
+        self.password = password
+        self.sender = sender or username
+        self.use_starttls = use_starttls
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.smtp_timeout = smtp_timeout
+        self.sent_retention = sent_retention
+
+        self._smtp = None
+        self._last_used = 0.0
+        # flush() and wait() deliver on the caller's thread; one SMTP session
+        # can't carry two conversations at once
+        self._send_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+        for state in SPOOL_STATES:
+            os.makedirs(os.path.join(spool_dir, state), exist_ok=True)
+
+    # -- spool helpers -------------------------------------------------
+
+    def _path(self, state, delivery_id):
+        return os.path.join(self.spool_dir, state, f"{delivery_id}.json")
+
+    def _write(self, state, record):
+        """Write a record atomically into a state directory"""
+        path = self._path(state, record['id'])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _read(self, path):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    # -- public API ----------------------------------------------------
+
+    def enqueue(self, recipients, subject, body):
+        """Spool a message for delivery and return its delivery id"""
+        if isinstance(recipients, str):
+            recipients = [recipients]
+        now = time.time()
+        record = {
+            'id': uuid.uuid4().hex,
+            'recipients': list(recipients),
+            'subject': subject,
+            'body': body,
+            'attempts': 0,
+            'next_attempt_at': now,
+            'created_at': now,
+            'updated_at': now,
+            'last_error': None,
+        }
+        self._write('pending', record)
+        self.start()
+        self._wake()
+        return record['id']
+
+    def status(self, delivery_id):
+        """Return the delivery state for an id, or None if it is unknown"""
+        if not DELIVERY_ID_RE.match(delivery_id or ''):
+            return None
+        for state in SPOOL_STATES:
+            try:
+                record = self._read(self._path(state, delivery_id))
+            except (FileNotFoundError, ValueError):
+                continue
+            if state == 'pending':
+                state = 'retrying' if record['attempts'] else 'queued'
+            return {
+                'id': delivery_id,
+                'status': state,
+                'attempts': record['attempts'],
+                'created_at': record['created_at'],
+                'updated_at': record['updated_at'],
+                'last_error': record['last_error'],
+                'refused': record.get('refused', []),
+            }
+        return None
+
+    def start(self):
+        """Start the delivery thread in this process if it isn't running"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            # After a fork the parent's thread and SMTP socket don't exist here
+            self._smtp = None
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._recover_stale()
+            self._prune_sent()
+            self._thread = threading.Thread(target=self._run, name='email-delivery', daemon=True)
+            self._thread.start()
+
+    def _wake(self):
+        self._wakeup.set()
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._disconnect()
+
+    def flush(self):
+        """Deliver everything that is currently due, on the calling thread"""
+        while self._deliver_batch():
+            pass
+
+    def pending_count(self):
+        """Number of messages waiting for (re)delivery"""
+        return sum(1 for name in os.listdir(os.path.join(self.spool_dir, 'pending')) if name.endswith('.json'))
+
+    def wait(self, delivery_id, timeout=60.0):
+        """Block until a message is sent or has failed; returns its final status"""
+        deadline = time.monotonic() + timeout
+        while True:
+            self.flush()
+            status = self.status(delivery_id)
+            if status is None or status['status'] in ('sent', 'failed') or time.monotonic() >= deadline:
+                return status
+            time.sleep(0.2)
+
+    # -- delivery loop -------------------------------------------------
+
+    def _recover_stale(self):
+        """Requeue messages left in 'sending' by a worker that died mid-send"""
+        sending_dir = os.path.join(self.spool_dir, 'sending')
+        cutoff = time.time() - self.stale_after
+        for name in os.listdir(sending_dir):
+            path = os.path.join(sending_dir, name)
+            try:
+                if name.endswith('.json') and os.path.getmtime(path) < cutoff:
+                    os.rename(path, os.path.join(self.spool_dir, 'pending', name))
+            except OSError:
+                continue
+
+    def _prune_sent(self):
+        """Drop delivered records once they are past the retention window"""
+        sent_dir = os.path.join(self.spool_dir, 'sent')
+        cutoff = time.time() - self.sent_retention
+        for name in os.listdir(sent_dir):
+            path = os.path.join(sent_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                continue
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                delivered = self._deliver_batch()
+            except Exception as e:
+                print(f"Error in email delivery loop: {e}")
+                delivered = False
+            if delivered:
+                continue
+            if self._smtp is not None and time.monotonic() - self._last_used > self.idle_timeout:
+                with self._send_lock:
+                    self._disconnect()
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _claim_due(self):
+        """Atomically move up to batch_size due messages from pending to sending"""
+        pending_dir = os.path.join(self.spool_dir, 'pending')
+        now = time.time()
+        claimed = []
+        for name in sorted(os.listdir(pending_dir)):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(pending_dir, name)
+            try:
+                record = self._read(path)
+            except (FileNotFoundError, ValueError):
+                continue
+            if record['next_attempt_at'] > now:
+                continue
+            claimed_path = os.path.join(self.spool_dir, 'sending', name)
+            try:
+                os.rename(path, claimed_path)
+                # Stale detection in _recover_stale goes by claim time
+                os.utime(claimed_path)
+            except FileNotFoundError:
+                continue  # another worker claimed it first
+            claimed.append(record)
+            if len(claimed) >= self.batch_size:
+                break
+        claimed.sort(key=lambda r: r['created_at'])
+        return claimed
+
+    def _deliver_batch(self):
+        """Send one batch over the shared connection; return True if any were due"""
+        batch = self._claim_due()
+        if not batch:
+            return False
+        with self._send_lock:
+            for record in batch:
+                self._deliver(record)
+        return True
+
+    def _deliver(self, record):
+        record['attempts'] += 1
+        record['updated_at'] = time.time()
+        try:
+            smtp = self._connection()
+            with stage('smtp_send'):
+                refused = pipelined_sendmail(smtp, self.sender, record['recipients'], self._build_message(record))
+            self._last_used = time.monotonic()
+        except Exception as e:
+            # The session may be in an unknown state after any error
+            self._disconnect()
+            self._delivery_failed(record, e)
+            return
+        if refused:
+            # The rest got it; retrying would send them a duplicate
+            print(f"Recipients refused for email {record['id']}: {', '.join(sorted(refused))}")
+            record['refused'] = sorted(refused)
+        self._delivery_succeeded(record)
+
+    def _delivery_succeeded(self, record):
+        record['last_error'] = None
+        self._finish(record, 'sent')
+
+    def _delivery_failed(self, record, error):
+        """Reschedule with jittered exponential backoff, or give up"""
+        print(f"Error sending email {record['id']}: {error}")
+        record['last_error'] = str(error)
+        if record['attempts'] >= self.max_attempts:
+            self._finish(record, 'failed')
+        else:
+            delay = min(self.backoff_max, self.backoff_base * (2 ** (record['attempts'] - 1)))
+            record['next_attempt_at'] = time.time() + random.uniform(delay / 2, delay)
+            self._finish(record, 'pending')
+
+    def _finish(self, record, state):
+        self._write(state, record)
+        try:
+            os.remove(self._path('sending', record['id']))
+        except FileNotFoundError:
+            pass
+
+    def _build_message(self, record):
+        # The email package is only needed once something is actually sent
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+
+        msg = MIMEMultipart()
+        msg['From'] = self.sender
+        # Fan-out messages go to everyone at once; don't show subscribers each other
+        recipients = record['recipients']
+        msg['To'] = recipients[0] if len(recipients) == 1 else 'undisclosed-recipients:;'
+        msg['Subject'] = record['subject']
+        msg.attach(MIMEText(record['body'], 'plain'))
+        return msg.as_string()
+
+    # -- SMTP session --------------------------------------------------
+
+    def _connection(self):
+        """Return a live, authenticated SMTP session, reconnecting if needed"""
+        import smtplib
+
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            self._disconnect()
+
+        with stage('smtp_connect'):
+            smtp = smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=self.smtp_timeout)
+            try:
+                if self.use_starttls:
+                    smtp.starttls()
+                if self.username and self.password:
+                    smtp.login(self.username, self.password)
+            except Exception:
+                smtp.close()
+                raise
+        self._smtp = smtp
+        return smtp
+
+    def _disconnect(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            self._smtp.close()
+        self._smtp = None
@@ -0,0 +1,204 @@
+"""Minimal in-process metrics with Prometheus text exposition
+
+Metrics are per worker process; scrape each worker (or run a single worker
+per container) to aggregate.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 384, 512, 768, 1024, 2048)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            for bound, count in zip(self.buckets, series):
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', bound))} {count}"
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', '+Inf'))} {series[-2]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {series[-2]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]}"
+
+
+class Gauge:
+    """Gauge whose value is read from a callable at scrape time"""
+
+    def __init__(self, name, documentation, read):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def render(self):
+        try:
+            value = self.read()
+        except Exception as e:
+            print(f"Error reading gauge {self.name}: {e}")
+            return
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {value}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    'ai_agent_stage_seconds', 'Time spent in each stage of a generation', ('stage',))
+REQUEST_SECONDS = registry.histogram(
+    'ai_agent_request_seconds', 'HTTP request latency by endpoint', ('endpoint', 'status'))
+UPSTREAM_RESPONSES = registry.counter(
+    'ai_agent_upstream_responses_total', 'Inference API responses by model and status code', ('model', 'status'))
+GENERATIONS = registry.counter(
+    'ai_agent_generations_total', 'Generations by where the content came from', ('source',))
+FALLBACKS = registry.counter(
+    'ai_agent_fallbacks_total', 'Fallback template uses by reason', ('reason',))
+ROUTE_CALLS = registry.counter(
+    'ai_agent_route_calls_total', 'Text-generation calls by route and outcome', ('route', 'outcome'))
+HEDGES = registry.counter(
+    'ai_agent_hedged_requests_total', 'Hedged duplicate requests sent, and those that answered first', ('event',))
+OUTPUT_CHECKS = registry.counter(
+    'ai_agent_output_checks_total', 'Generated outputs by how streaming validation ended', ('verdict',))
+REPAIRS = registry.counter(
+    'ai_agent_section_repairs_total', 'Sections regenerated with a targeted prompt, by outcome', ('section', 'outcome'))
+TOKENS = registry.histogram(
+    'ai_agent_tokens', 'Prompt and generated tokens per text-generation call', ('kind',), buckets=TOKEN_BUCKETS)
+
+# Per-request stage breakdown, only collected when a trace is active
+_trace = threading.local()
+
+
+def start_trace():
+    _trace.stages = []
+
+
+def finish_trace():
+    """Stop collecting and return [(stage, seconds), ...] for this request"""
+    stages = getattr(_trace, 'stages', None)
+    _trace.stages = None
+    return stages or []
+
+
+@contextmanager
+def stage(name):
+    """Time a block into the stage histogram (and the active trace, if any)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, name)
+        stages = getattr(_trace, 'stages', None)
+        if stages is not None:
+            stages.append((name, elapsed))
+
+
+def server_timing(stages):
+    """Format a stage breakdown as a Server-Timing header value"""
+    return ', '.join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages)
+
+
+class StartupTimer:
+    """Wall-clock breakdown of process startup, one mark() per phase"""
+
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self._last = self.started
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    @property
+    def total(self):
+        return self._last - self.started
+
+    def summary(self):
+        parts = ', '.join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in self.phases)
+        return f"{self.total * 1000:.0f}ms ({parts})"
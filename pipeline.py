@@ -0,0 +1,247 @@
+"""Staged generation: write the script once, then derive the other sections from it
+
+Stage 1 runs the text-generation model on a script-only prompt. Stage 2
+derives the title and description with the summarization model (both calls
+run concurrently) and the hashtags and image prompts with cheap extractive
+steps over the script. Every stage is cached on its own, keyed by its recipe
+and its inputs, so changing one stage's prompt or parameters only reruns
+that stage.
+"""
+
+import contextvars
+import hashlib
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import make_cache_key
+from content import ContentResult
+from metrics import stage
+from prompts import continuation
+from sections import IMAGE_PROMPT_COUNT, empty_content, parse_sections
+
+SCRIPT_PROMPT_TEMPLATE = """
+        You are a creative content producer making highly engaging YouTube Shorts with a duration of 2 to 3 minutes.
+
+        Write the script for **"5 Interesting and Unknown Facts About {topic}"**: a hook in the first 10 seconds, five surprising facts and an outro asking viewers to like and follow.
+        Label the parts [HOOK], [FACT 1] to [FACT 5] and [OUTRO].
+
+        🧠 **1. Video Script (2-3 minutes max):**
+        """
+
+TITLE_PARAMETERS = {"max_length": 24, "min_length": 6, "do_sample": False}
+DESCRIPTION_PARAMETERS = {"max_length": 90, "min_length": 30, "do_sample": False}
+
+TITLE_MAX_CHARS = 80
+DESCRIPTION_CALL_TO_ACTION = "Follow for more amazing facts! 🔔"
+
+# BART reads at most 1024 tokens; longer scripts are cut before summarizing
+SUMMARY_INPUT_CHARS = 3000
+
+IMAGE_PROMPT_STYLE = (
+    "Cinematic 9:16 vertical shot for the {part} of a YouTube Short about {topic}: "
+    "{scene} Dramatic lighting, rich detail, professional photography style, "
+    "optimized for social media."
+)
+
+# Cache recipes of the extractive stages. Bump the version when a stage's
+# code changes so results cached by the old code are not reused.
+EXTRACTIVE_RECIPES = {
+    'meta_tags': 'hashtags-v1',
+    'image_prompts': f'image-prompts-v1\0{IMAGE_PROMPT_STYLE}',
+}
+
+SCRIPT_PART_RE = re.compile(r'^[^\w\n\[]*\[(?P<part>HOOK|FACT\s*[1-5]|OUTRO)\b[^\]\n]*\][ \t]*', re.MULTILINE | re.IGNORECASE)
+SENTENCE_RE = re.compile(r'[^.!?]+[.!?]*')
+WORD_RE = re.compile(r"\b[a-z]{4,}\b(?!')")
+
+STOPWORDS = frozenset("""
+about absolutely actually after again almost also always another around back
+because been before being better could discover discovered does don't down
+each even ever every fact facts fascinating first follow from going have
+here incredible into it's just know learn like little make many might more
+most much never next only other over really right same share should since
+some something still such than that that's their them then there these they
+thing things think this those through today together truly under until very
+want watching ways well were what what's when where which while will with
+without world would you're your
+""".split())
+
+IMAGE_PARTS = ('intro', 'fact 1', 'fact 2', 'fact 3', 'fact 4', 'fact 5', 'outro')
+
+
+def first_sentence(text, limit=None, min_words=1):
+    """First sentence of at least min_words words (else the first one), clipped to limit"""
+    sentences = [s.strip() for s in SENTENCE_RE.findall(' '.join(text.split())) if s.strip()]
+    sentence = next((s for s in sentences if len(s.split()) >= min_words), sentences[0] if sentences else '')
+    if limit and len(sentence) > limit:
+        sentence = sentence[:limit].rsplit(' ', 1)[0].rstrip(',;:')
+    return sentence
+
+
+def clip_title(summary, limit=TITLE_MAX_CHARS):
+    """One line of at most `limit` characters, cut on a word boundary"""
+    title = first_sentence(summary, min_words=4).rstrip('.')
+    if len(title) > limit:
+        title = title[:limit].rsplit(' ', 1)[0].rstrip(',;:')
+    return title
+
+
+def strip_part_labels(script):
+    return SCRIPT_PART_RE.sub('', script).strip()
+
+
+def script_parts(script):
+    """Map HOOK / FACT n / OUTRO labels to their text, in script order"""
+    matches = list(SCRIPT_PART_RE.finditer(script))
+    parts = {}
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(script)
+        name = ' '.join(match.group('part').lower().split())
+        parts[name] = script[match.end():end].strip()
+    return parts
+
+
+def extract_hashtags(script, topic, count=8):
+    """Topic tags plus the script's most frequent content words"""
+    slug = re.sub(r'\W+', '', topic.lower())
+    topic_words = set(topic.lower().split())
+    words = Counter(
+        word for word in WORD_RE.findall(script.lower())
+        if word not in STOPWORDS and word not in topic_words
+    )
+    tags = ['#shorts', f'#{slug}', f'#{slug}facts']
+    tags += [f'#{word}' for word, _ in words.most_common(count)]
+    tags += ['#didyouknow', '#youtubeshorts']
+    return ' '.join(dict.fromkeys(tag for tag in tags if len(tag) > 1))
+
+
+def extract_image_prompts(script, topic):
+    """One prompt per script part (hook, five facts, outro) from its first sentence"""
+    parts = script_parts(script)
+    scenes = [parts.get('hook'), *(parts.get(f'fact {i}') for i in range(1, 6)), parts.get('outro')]
+    if not any(scenes):
+        # Unlabelled script: spread its sentences over the seven shots
+        sentences = [s.strip() for s in SENTENCE_RE.findall(' '.join(script.split())) if s.strip()]
+        step = max(1, len(sentences) // IMAGE_PROMPT_COUNT)
+        scenes = sentences[::step][:IMAGE_PROMPT_COUNT]
+    prompts = []
+    for part, scene in zip(IMAGE_PARTS, scenes):
+        scene = first_sentence(scene or '', limit=200, min_words=5)
+        if scene:
+            prompts.append(IMAGE_PROMPT_STYLE.format(part=part, topic=topic, scene=scene))
+    return prompts
+
+
+class StagedPipeline:
+    """Generates the five content sections in dependent, individually cached stages"""
+
+    def __init__(self, backend, cache, models, generation_parameters,
+                 script_prompt=SCRIPT_PROMPT_TEMPLATE, title_parameters=TITLE_PARAMETERS,
+                 description_parameters=DESCRIPTION_PARAMETERS, fallback=None, prompts=None, max_workers=4):
+        self.backend = backend
+        self.cache = cache
+        self.models = models
+        self.generation_parameters = generation_parameters
+        self.script_prompt = script_prompt
+        self.title_parameters = title_parameters
+        self.description_parameters = description_parameters
+        self.fallback = fallback
+        self.prompts = prompts
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pipeline')
+
+    def fingerprint(self):
+        """Hash of every stage's recipe, for keying the assembled result"""
+        material = repr((
+            self._script_recipe(), self.models, self.generation_parameters,
+            self.title_parameters, self.description_parameters,
+            sorted(EXTRACTIVE_RECIPES.items()),
+        ))
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def _script_recipe(self):
+        # With a prompt registry the prompt sent also depends on its token budget
+        return self.prompts.fingerprint(self.script_prompt) if self.prompts else self.script_prompt
+
+    def _cached(self, key, compute, bypass_cache, ttl):
+        if not bypass_cache:
+            value = self.cache.get(key)
+            if value is not None:
+                return value
+        value = compute()
+        if value:
+            self.cache.set(key, value, ttl)
+        return value
+
+    def script(self, topic, bypass_cache=False, ttl=None):
+        """Stage 1: the script, or '' if the model didn't produce one"""
+        model = self.models['text_generation']
+        key = make_cache_key(topic, model, self._script_recipe(), self.generation_parameters)
+
+        def compute():
+            with stage('pipeline_script'):
+                if self.prompts is None:
+                    text = self.backend.generate_text(model, self.script_prompt.format(topic=topic),
+                                                      self.generation_parameters)
+                else:
+                    prompt = self.prompts.build(self.script_prompt, topic)
+                    text = self.backend.generate_text(model, prompt.text, self.generation_parameters)
+                    self.prompts.record(prompt, continuation(prompt, text), topic)
+            # The prompt ends with the script header, so the continuation is the script
+            return parse_sections(text)['script']
+
+        return self._cached(key, compute, bypass_cache, ttl)
+
+    def _summary(self, name, topic, script, parameters, finish, bypass_cache, ttl):
+        model = self.models['summarization']
+        key = make_cache_key(topic, model, f"{name}\0{script}", parameters)
+
+        def compute():
+            with stage(f'pipeline_{name}'):
+                text = strip_part_labels(script)[:SUMMARY_INPUT_CHARS]
+                summary = self.backend.summarize(model, text, parameters)
+            return finish(summary)
+
+        return self._cached(key, compute, bypass_cache, ttl)
+
+    def _extract(self, name, topic, script, extract, bypass_cache, ttl):
+        key = make_cache_key(topic, 'extractive', f"{EXTRACTIVE_RECIPES[name]}\0{script}", {})
+        with stage(f'pipeline_{name}'):
+            return self._cached(key, lambda: extract(script, topic), bypass_cache, ttl)
+
+    def run(self, topic, bypass_cache=False, ttl=None):
+        """Return (content, complete), or (None, False) if no script was generated
+
+        A derived stage that fails is filled from the fallback content and
+        makes the result incomplete (and flagged is_fallback), so the caller
+        should not cache it.
+        """
+        script = self.script(topic, bypass_cache, ttl)
+        if not script:
+            return None, False
+
+        # Copy the context so the upstream priority and deadline carry over
+        title = self._executor.submit(
+            contextvars.copy_context().run, self._summary, 'video_name', topic, script, self.title_parameters,
+            clip_title, bypass_cache, ttl)
+        description = self._executor.submit(
+            contextvars.copy_context().run, self._summary, 'description', topic, script, self.description_parameters,
+            lambda summary: f"{summary.strip()} {DESCRIPTION_CALL_TO_ACTION}", bypass_cache, ttl)
+
+        meta_tags = self._extract('meta_tags', topic, script, extract_hashtags, bypass_cache, ttl)
+        image_prompts = self._extract('image_prompts', topic, script, extract_image_prompts, bypass_cache, ttl)
+
+        content = empty_content()
+        content.update(script=script, meta_tags=meta_tags, image_prompts=image_prompts)
+        for name, future in (('video_name', title), ('description', description)):
+            try:
+                content[name] = future.result()
+            except Exception as e:
+                print(f"Error in {name} stage, using fallback: {e}")
+
+        complete = True
+        for name in ('video_name', 'description', 'meta_tags', 'image_prompts'):
+            if not content[name]:
+                complete = False
+                content[name] = self.fallback(topic)[name] if self.fallback else ''
+        return ContentResult.from_dict(content, is_fallback=not complete), complete
@@ -0,0 +1,243 @@
+"""Scheduled prewarming: generate a published topic list ahead of peak traffic
+
+The web app runs a Prewarmer thread when PREWARM_FEED is set. It can also be
+run by hand (or from cron) to work through a feed immediately:
+
+    python prewarm.py topics.txt [--rate 6] [--ttl 86400]
+    python prewarm.py https://example.com/topics.jsonl
+
+Feeds are plain text (one topic per line), JSONL (see batch.py) or a JSON
+array of strings.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+
+from batch import dedupe_topics, parse_topic_lines
+
+try:
+    import fcntl
+except ImportError:  # Windows: every worker prewarms
+    fcntl = None
+
+
+def load_topic_feed(source, timeout=10):
+    """Read topics from a file path or an http(s) URL"""
+    if source.startswith(('http://', 'https://')):
+        import requests
+
+        response = requests.get(source, timeout=timeout)
+        response.raise_for_status()
+        text = response.text
+    else:
+        with open(source, encoding='utf-8') as f:
+            text = f.read()
+
+    if text.lstrip().startswith('['):
+        try:
+            items = json.loads(text)
+        except ValueError:
+            items = None
+        if isinstance(items, list):
+            return parse_topic_lines(json.dumps(item) for item in items)
+    return parse_topic_lines(text.splitlines())
+
+
+def parse_window(window):
+    """Turn "HH:MM-HH:MM" (local time) into (start, end) minutes after midnight"""
+    start, end = window.split('-')
+
+    def minutes(value):
+        hours, mins = value.strip().split(':')
+        return int(hours) * 60 + int(mins)
+
+    return minutes(start), minutes(end)
+
+
+def in_window(window, now=None):
+    """True if now falls inside the window; windows may wrap past midnight"""
+    if window is None:
+        return True
+    now = now or datetime.datetime.now()
+    start, end = window
+    current = now.hour * 60 + now.minute
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end
+
+
+class Prewarmer:
+    """Background thread that pre-generates a topic feed during an off-peak window
+
+    generate(topic) must store its result in the shared cache and
+    is_cached(topic) must report whether a topic is already there. Calls are
+    spaced to stay under `rate` generations per minute and paused while the
+    circuit breaker is open. When several gunicorn workers run a Prewarmer,
+    an flock on lock_path lets only one of them do the work.
+    """
+
+    def __init__(self, feed, generate, is_cached, warm=None, window=None, rate=6.0,
+                 feed_interval=3600.0, warm_interval=0.0, lock_path=None, breaker=None,
+                 poll_interval=30.0):
+        self.feed = feed
+        self.generate = generate
+        self.is_cached = is_cached
+        self.warm = warm
+        self.window = parse_window(window) if window else None
+        self.min_gap = 60.0 / rate if rate > 0 else 0.0
+        self.feed_interval = feed_interval
+        self.warm_interval = warm_interval
+        self.lock_path = lock_path if fcntl is not None else None
+        self.breaker = breaker
+        self.poll_interval = poll_interval
+        self._lock_file = None
+        self._last_call = 0.0
+        self._last_run = None
+        self._last_warm = None
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.runs = 0
+        self.generated = 0
+        self.skipped = 0
+        self.failed = 0
+        self.warmups = 0
+        self.last_error = None
+
+    def start(self):
+        """Start the prewarm thread in this process if it isn't running"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._lock_file = None
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='prewarm', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            'feed': self.feed,
+            'active': self._holds_lock(),
+            'runs': self.runs,
+            'generated': self.generated,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'warmups': self.warmups,
+            'last_error': self.last_error,
+        }
+
+    def _run(self):
+        while not self._stopping.is_set():
+            if self._holds_lock():
+                try:
+                    self.tick()
+                except Exception as e:
+                    self.last_error = str(e)
+                    print(f"Error prewarming: {e}")
+            self._stopping.wait(self.poll_interval)
+
+    def _holds_lock(self):
+        """Take (and keep) the cross-worker prewarm lock if nobody else has it"""
+        if not self.lock_path:
+            return True
+        if self._lock_file is not None:
+            return True
+        directory = os.path.dirname(self.lock_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def tick(self):
+        """Warm the model if due, and work through the feed if the window is open"""
+        now = time.monotonic()
+        if self.warm and self.warm_interval and (
+                self._last_warm is None or now - self._last_warm >= self.warm_interval):
+            self.warm_model()
+        if self.feed and in_window(self.window) and (
+                self._last_run is None or now - self._last_run >= self.feed_interval):
+            self.run_once()
+
+    def warm_model(self):
+        self._last_warm = time.monotonic()
+        try:
+            self.warm()
+            self.warmups += 1
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Error warming model: {e}")
+
+    def run_once(self, ignore_window=False):
+        """Pre-generate every feed topic that isn't cached yet; returns a summary"""
+        self._last_run = time.monotonic()
+        self.runs += 1
+        topics = [topic for topic, _ in dedupe_topics(load_topic_feed(self.feed))]
+        if self.warm:
+            # The feed usually runs right before peak; make sure the model is up first
+            self.warm_model()
+
+        summary = {'topics': len(topics), 'generated': 0, 'skipped': 0, 'failed': 0}
+        for topic in topics:
+            if self._stopping.is_set() or not (ignore_window or in_window(self.window)):
+                break
+            if self.is_cached(topic):
+                summary['skipped'] += 1
+                continue
+            self._throttle()
+            self.generate(topic)
+            # Fallback content is never cached, so this tells the two apart
+            outcome = 'generated' if self.is_cached(topic) else 'failed'
+            summary[outcome] += 1
+
+        self.generated += summary['generated']
+        self.skipped += summary['skipped']
+        self.failed += summary['failed']
+        return summary
+
+    def _throttle(self):
+        """Space upstream calls and sit out an open circuit breaker"""
+        while self.breaker is not None and self.breaker.state == 'open' and not self._stopping.is_set():
+            self._stopping.wait(min(self.breaker.reset_timeout, self.poll_interval))
+        wait = self._last_call + self.min_gap - time.monotonic()
+        if wait > 0:
+            self._stopping.wait(wait)
+        self._last_call = time.monotonic()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-generate content for a topic feed now")
+    parser.add_argument('feed', help='file path or http(s) URL of the topic feed')
+    parser.add_argument('--rate', type=float, default=None, help='max generations per minute')
+    parser.add_argument('--ttl', type=int, default=None, help='seconds to keep prewarmed content cached')
+    parser.add_argument('--no-warm', action='store_true', help='skip the model warm-up request')
+    args = parser.parse_args(argv)
+
+    # Deferred so --help works without the app's configuration
+    import app
+
+    prewarmer = app.build_prewarmer(args.feed, rate=args.rate, ttl=args.ttl, warm=not args.no_warm)
+    summary = prewarmer.run_once(ignore_window=True)
+    print(json.dumps(summary))
+    return 0 if summary['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
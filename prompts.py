@@ -0,0 +1,230 @@
+"""Prompt registry: templates compiled once, measured in tokens and fitted to a budget
+
+gpt2 has a 1024-token context shared by the prompt and the generation, and
+the full content prompt alone takes most of it. Each template is split into
+lines once and every line's token cost is measured once (per template
+version). A prompt is then assembled in up to three steps, stopping as soon
+as it fits PROMPT_TOKEN_BUDGET:
+
+1. the template exactly as written;
+2. compacted: indentation, blank lines and markdown emphasis removed;
+3. trimmed: instruction lines dropped, least important first (trailing
+   notes, then section bodies from the last section to the first, then the
+   preamble). Section headers, "---" separators and the title line are
+   always kept, since the section parser and the model rely on them.
+"""
+
+import functools
+import hashlib
+import math
+import re
+import threading
+
+from metrics import TOKENS
+from sections import HEADER_RE, SEPARATOR_RE
+
+# GPT-2's pre-tokenizer split, used to estimate counts without the tokenizer
+_PIECE_RE = re.compile(r"'(?:s|t|re|ve|m|ll|d)| ?[^\W\d_]+| ?\d+| ?[^\s\w]+|\s+(?!\S)|\s+")
+_EMPHASIS_RE = re.compile(r'\*\*|__')
+_SPACE_RE = re.compile(r'[ \t]{2,}')
+
+
+@functools.lru_cache(maxsize=None)
+def load_tokenizer(model):
+    """The model's tokenizer, loaded once per process, or None if it's unavailable"""
+    try:
+        from transformers import AutoTokenizer
+    except ImportError:
+        return None
+    try:
+        return AutoTokenizer.from_pretrained(model)
+    except Exception as e:
+        print(f"Error loading tokenizer for {model}, estimating token counts: {e}")
+        return None
+
+
+def estimate_tokens(text):
+    """Rough GPT-2 token count: one per pre-tokenizer piece, more for long or non-ASCII ones"""
+    count = 0
+    for piece in _PIECE_RE.findall(text):
+        if piece.isascii():
+            count += max(1, math.ceil(len(piece) / 8))
+        else:
+            # Byte-level BPE spends about one token per two bytes of emoji and symbols
+            count += max(1, len(piece.encode('utf-8')) // 2)
+    return count
+
+
+class TokenCounter:
+    """Token counts with the model's own tokenizer when transformers is installed
+
+    count() measures any text. count_line() memoizes, and is meant for the
+    short strings that recur: template lines and topics. Whole prompts and
+    model outputs are rarely seen twice and would only crowd the cache.
+    """
+
+    def __init__(self, model, use_tokenizer=True, cache_size=4096):
+        self.model = model
+        self.use_tokenizer = use_tokenizer
+        self._tokenizer = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.count_line = functools.lru_cache(maxsize=cache_size)(self.count)
+
+    def load(self):
+        """Load the tokenizer (importing transformers); call it at startup, not per request"""
+        with self._lock:
+            if not self._loaded:
+                self._tokenizer = load_tokenizer(self.model) if self.use_tokenizer else None
+                self._loaded = True
+                if self._tokenizer is not None:
+                    # Drop the estimates counted before it was available
+                    self.count_line.cache_clear()
+        return self._tokenizer
+
+    def count(self, text):
+        # Until load() has run, estimate rather than load the tokenizer mid-request
+        tokenizer = self._tokenizer
+        if tokenizer is None:
+            return estimate_tokens(text)
+        return len(tokenizer.encode(text))
+
+
+class Prompt:
+    __slots__ = ('text', 'tokens', 'trimmed')
+
+    def __init__(self, text, tokens, trimmed=0):
+        self.text = text
+        self.tokens = tokens
+        self.trimmed = trimmed  # instruction lines dropped to fit the budget
+
+
+class PromptTemplate:
+    """One template, split into lines whose token costs are measured once"""
+
+    def __init__(self, text, counter, budget=0):
+        self.text = text
+        self.counter = counter
+        self.budget = budget
+        self.version = hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+        # Independent of the counter, so every worker keys a topic the same way
+        self.fingerprint = hashlib.sha256(f"{text}\0{budget}".encode('utf-8')).hexdigest()
+        self.lines = self._compact_lines(text)
+        self._drop_order = self._rank_lines(self.lines)
+        # Cost of each line without its {topic}s (plus its newline) and how many it has
+        self._costs = [counter.count_line(line.replace('{topic}', '') + '\n') for line in self.lines]
+        self._topics = [line.count('{topic}') for line in self.lines]
+        self._full_cost = counter.count(text.replace('{topic}', ''))
+        self._full_topics = text.count('{topic}')
+        self._fit = functools.lru_cache(maxsize=64)(self._plan)
+
+    @staticmethod
+    def _compact_lines(text):
+        lines = []
+        for line in text.splitlines():
+            line = _SPACE_RE.sub(' ', _EMPHASIS_RE.sub('', line)).strip()
+            if line:
+                lines.append(line)
+        return lines
+
+    @staticmethod
+    def _rank_lines(lines):
+        """Indexes of droppable lines, first to drop first"""
+        required = set()
+        blocks = [[]]  # lines between separators
+        for i, line in enumerate(lines):
+            if SEPARATOR_RE.fullmatch(line) or HEADER_RE.match(line):
+                required.add(i)
+            if SEPARATOR_RE.fullmatch(line):
+                blocks.append([])
+            else:
+                blocks[-1].append(i)
+        # The first line naming the topic carries the title the model continues from
+        required.add(next((i for i, line in enumerate(lines) if '{topic}' in line), 0))
+
+        preamble, sections, notes = blocks[0], [], []
+        for block in blocks[1:]:
+            (sections if any(HEADER_RE.match(lines[i]) for i in block) else notes).append(block)
+        ranked = [i for block in notes for i in reversed(block)]
+        ranked += [i for block in reversed(sections) for i in reversed(block)]
+        ranked += list(reversed(preamble))
+        return [i for i in ranked if i not in required]
+
+    def _plan(self, topic_cost):
+        """(kept line indexes, dropped count) for a topic costing topic_cost tokens"""
+        keep = set(range(len(self.lines)))
+        total = sum(self._costs) + topic_cost * sum(self._topics)
+        dropped = 0
+        for i in self._drop_order:
+            if total <= self.budget:
+                break
+            keep.discard(i)
+            total -= self._costs[i] + topic_cost * self._topics[i]
+            dropped += 1
+        return sorted(keep), dropped
+
+    def build(self, topic):
+        """The prompt for a topic, within the budget where the required lines allow"""
+        topic_cost = self.counter.count_line(' ' + topic)
+        if not self.budget:
+            # Nothing to fit, so don't tokenize the whole prompt per request: the
+            # template's count (measured once) plus the memoized topic's is close enough
+            return Prompt(self.text.format(topic=topic), self._full_cost + topic_cost * self._full_topics)
+
+        if self._full_cost + topic_cost * self._full_topics <= self.budget:
+            text = self.text.format(topic=topic)
+            tokens = self.counter.count(text)
+            if tokens <= self.budget:
+                return Prompt(text, tokens)
+
+        # Line costs are measured separately, so re-check the joined text and
+        # drop a little more if merges across lines made it come out over
+        while True:
+            kept, dropped = self._fit(topic_cost)
+            text = '\n'.join(self.lines[i] for i in kept).format(topic=topic) + '\n'
+            tokens = self.counter.count(text)
+            if tokens <= self.budget or dropped >= len(self._drop_order):
+                return Prompt(text, tokens, dropped)
+            topic_cost += tokens - self.budget
+
+
+class PromptRegistry:
+    """Compiled templates keyed by their text, so callers keep passing template strings"""
+
+    def __init__(self, counter, budget=0, log_usage=False):
+        self.counter = counter
+        self.budget = budget
+        self.log_usage = log_usage
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def get(self, text):
+        template = self._templates.get(text)
+        if template is None:
+            with self._lock:
+                template = self._templates.get(text)
+                if template is None:
+                    template = self._templates[text] = PromptTemplate(text, self.counter, self.budget)
+        return template
+
+    def fingerprint(self, text):
+        """Stands in for the template in cache keys: changes with the text or budget"""
+        return self.get(text).fingerprint
+
+    def build(self, text, topic):
+        return self.get(text).build(topic)
+
+    def record(self, prompt, output, label):
+        """Count the generated tokens and record them next to the prompt's"""
+        output_tokens = self.counter.count(output) if output else 0
+        TOKENS.observe(prompt.tokens, 'prompt')
+        TOKENS.observe(output_tokens, 'output')
+        if self.log_usage:
+            trimmed = f", {prompt.trimmed} instruction lines trimmed" if prompt.trimmed else ''
+            print(f"Tokens for {label}: prompt {prompt.tokens}, output {output_tokens}{trimmed}")
+        return output_tokens
+
+
+def continuation(prompt, generated):
+    """Generated text without the echoed prompt (text-generation returns both)"""
+    return generated[len(prompt.text):] if generated.startswith(prompt.text) else generated
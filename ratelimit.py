@@ -0,0 +1,212 @@
+"""Adaptive rate limiting and prioritized admission for upstream inference calls
+
+Every call to the inference API first takes a token from an
+AdaptiveRateLimiter. The refill rate backs off when the API answers 429
+(and pauses entirely for any Retry-After), then creeps back up while calls
+succeed. Callers that have to wait queue by priority, so interactive web
+requests go ahead of batch jobs, which go ahead of prewarming. A caller
+whose estimated queue wait would overrun its latency budget fails fast with
+RateLimitedError and the app serves the fallback content instead.
+
+The priority and deadline of the current request travel in a context
+variable set by request_priority(), so backends don't need extra arguments.
+"""
+
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from inference import UpstreamError
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_PREWARM = 2
+
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: 'interactive', PRIORITY_BATCH: 'batch', PRIORITY_PREWARM: 'prewarm'}
+
+# (priority, absolute monotonic deadline or None)
+_current = contextvars.ContextVar('upstream_request', default=(PRIORITY_INTERACTIVE, None))
+
+
+class RateLimitedError(UpstreamError):
+    """Raised when a call can't get an upstream slot within its latency budget"""
+
+
+@contextmanager
+def request_priority(priority, budget=None):
+    """Run upstream calls in this block at `priority`, within `budget` seconds"""
+    deadline = time.monotonic() + budget if budget else None
+    token = _current.set((priority, deadline))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def current_request():
+    return _current.get()
+
+
+class _Ticket:
+    __slots__ = ('priority', 'deadline', 'shed')
+
+    def __init__(self, priority, deadline):
+        self.priority = priority
+        self.deadline = deadline
+        self.shed = False
+
+
+class AdaptiveRateLimiter:
+    """Token bucket with AIMD rate control and a bounded priority wait queue"""
+
+    def __init__(self, rate=2.0, burst=5, min_rate=0.1, increase=0.05, decrease=0.5, max_waiting=100):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.max_waiting = max_waiting
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiting = []  # heap of (priority, seq, ticket)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.throttled = 0
+        self.rejected = 0
+        self.shed = 0
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _estimated_wait(self, entry, now):
+        """Seconds until `entry` could be granted if nothing else changes"""
+        ahead = sum(1 for other in self._waiting if other < entry)
+        needed = ahead + 1 - self._tokens
+        return max(0.0, self._paused_until - now) + max(0.0, needed) / self.rate
+
+    def _enqueue(self, priority, deadline):
+        if len(self._waiting) >= self.max_waiting:
+            worst = max(self._waiting)
+            if worst[0] <= priority:
+                self.rejected += 1
+                raise RateLimitedError("Upstream request queue is full")
+            # Make room by shedding the newest lowest-priority waiter
+            self._waiting.remove(worst)
+            heapq.heapify(self._waiting)
+            worst[2].shed = True
+            self.shed += 1
+            self._cond.notify_all()
+        entry = (priority, next(self._seq), _Ticket(priority, deadline))
+        heapq.heappush(self._waiting, entry)
+        return entry
+
+    def _cancel(self, entry):
+        if entry in self._waiting:
+            self._waiting.remove(entry)
+            heapq.heapify(self._waiting)
+            self._cond.notify_all()
+
+    def _poll(self, entry):
+        """Grant the token (returns None) or return how long to wait; raises if over budget"""
+        ticket = entry[2]
+        if ticket.shed:
+            raise RateLimitedError("Shed from the upstream queue by higher-priority requests")
+        now = time.monotonic()
+        self._refill(now)
+        if self._waiting[0] is entry and now >= self._paused_until and self._tokens >= 1:
+            self._tokens -= 1
+            heapq.heappop(self._waiting)
+            self._cond.notify_all()
+            return None
+
+        wait = self._estimated_wait(entry, now)
+        if ticket.deadline is not None and now + wait > ticket.deadline:
+            self.rejected += 1
+            raise RateLimitedError(
+                f"Estimated upstream queue wait of {wait:.1f}s exceeds the request's latency budget"
+            )
+        # Re-evaluate when the next token is due; grants and 429s also wake us
+        next_token = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+        return min(max(next_token, 0.005), 1.0)
+
+    def acquire(self):
+        """Block until the current request may call upstream"""
+        priority, deadline = current_request()
+        with self._cond:
+            entry = self._enqueue(priority, deadline)
+            try:
+                while True:
+                    wait = self._poll(entry)
+                    if wait is None:
+                        return
+                    self._cond.wait(wait)
+            except BaseException:
+                self._cancel(entry)
+                raise
+
+    async def acquire_async(self):
+        """acquire() for coroutines: polls instead of blocking the event loop"""
+        import asyncio
+
+        priority, deadline = current_request()
+        with self._cond:
+            entry = self._enqueue(priority, deadline)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._poll(entry)
+                if wait is None:
+                    return
+                await asyncio.sleep(wait)
+        except BaseException:
+            with self._cond:
+                self._cancel(entry)
+            raise
+
+    def ensure_budget(self, seconds):
+        """Fail fast if waiting `seconds` (e.g. a retry backoff) would overrun the budget"""
+        _, deadline = current_request()
+        if deadline is not None and time.monotonic() + seconds > deadline:
+            with self._cond:
+                self.rejected += 1
+            raise RateLimitedError("Retry backoff would exceed the request's latency budget")
+
+    def on_throttled(self, retry_after=None):
+        """The API answered 429: halve the rate and honour any Retry-After"""
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._tokens = 0.0
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            # Waiters re-estimate and the ones now over budget fail fast
+            self._cond.notify_all()
+
+    def on_success(self):
+        """Additive increase back towards the configured rate"""
+        if self.rate >= self.max_rate:
+            return
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = min(self.max_rate, self.rate + self.increase * self.max_rate)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'rate': round(self.rate, 3),
+                'max_rate': self.max_rate,
+                'waiting': len(self._waiting),
+                'paused_for': round(max(0.0, self._paused_until - time.monotonic()), 2),
+                'throttled': self.throttled,
+                'rejected': self.rejected,
+                'shed': self.shed,
+            }
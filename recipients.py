@@ -0,0 +1,306 @@
+"""Email subscribers with topic filters, fan-out grouping and periodic digests
+
+RECIPIENTS_FILE is a JSON array of subscribers:
+
+    [
+      {"email": "editor@example.com"},
+      {"email": "space-desk@example.com", "topics": ["space", "black hole*"]},
+      {"email": "weekly@example.com", "mode": "digest"}
+    ]
+
+A subscriber without "topics" gets every topic. A filter matches when it
+appears in the topic (case-insensitive), or as a whole-topic glob when it
+contains * ? or [. "immediate" subscribers (the default) share one email
+per generation; "digest" subscribers get everything since the last digest in
+one email every DIGEST_INTERVAL seconds.
+"""
+
+import fnmatch
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+from cache import normalize_topic
+
+try:
+    import fcntl
+except ImportError:  # Windows: every worker may send digests
+    fcntl = None
+
+MODES = ('immediate', 'digest')
+DIGEST_SEPARATOR = '\n        ========================================\n'
+
+
+def _compile_filters(filters):
+    """One regex for a subscriber's filters, or None for every topic"""
+    if not filters:
+        return None
+    parts = []
+    for topic_filter in filters:
+        topic_filter = normalize_topic(topic_filter)
+        if any(c in topic_filter for c in '*?['):
+            parts.append(f'^{fnmatch.translate(topic_filter)}')
+        else:
+            parts.append(re.escape(topic_filter))
+    return re.compile('|'.join(parts))
+
+
+class Recipient:
+    __slots__ = ('email', 'topics', 'mode', '_pattern')
+
+    def __init__(self, email, topics=None, mode='immediate'):
+        if mode not in MODES:
+            raise ValueError(f"Unknown delivery mode {mode!r} for {email}")
+        self.email = email
+        self.topics = tuple(topics or ())
+        self.mode = mode
+        self._pattern = _compile_filters(self.topics)
+
+    def wants(self, topic_key):
+        """True if this subscriber follows a normalized topic"""
+        return self._pattern is None or self._pattern.search(topic_key) is not None
+
+
+class RecipientRegistry:
+    """Subscribers from RECIPIENTS_FILE (re-read when it changes) or a fixed list"""
+
+    def __init__(self, recipients=(), path=None, check_interval=5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._recipients = list(recipients)
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        if path:
+            self._reload()
+
+    @classmethod
+    def from_config(cls, path=None, emails=None):
+        """The subscribers file if given, else everything to the comma-separated emails"""
+        if path:
+            return cls(path=path)
+        return cls([Recipient(email.strip()) for email in (emails or '').split(',') if email.strip()])
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+            with open(self.path, encoding='utf-8') as f:
+                entries = json.load(f)
+            recipients = [Recipient(entry['email'], entry.get('topics'), entry.get('mode', 'immediate'))
+                          for entry in entries]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # Keep the last good list rather than dropping every subscriber
+            print(f"Error loading recipients from {self.path}: {e}")
+            return
+        self._recipients = recipients
+        self._mtime = mtime
+
+    def recipients(self):
+        if self.path and time.monotonic() - self._checked >= self.check_interval:
+            with self._lock:
+                self._checked = time.monotonic()
+                try:
+                    changed = os.stat(self.path).st_mtime != self._mtime
+                except OSError:
+                    changed = False
+                if changed:
+                    self._reload()
+        return self._recipients
+
+    def __len__(self):
+        return len(self.recipients())
+
+    def match(self, topic, mode=None):
+        """Subscribers following a topic, optionally only those with one delivery mode"""
+        topic_key = normalize_topic(topic)
+        return [r for r in self.recipients() if (mode is None or r.mode == mode) and r.wants(topic_key)]
+
+    def stats(self):
+        recipients = self.recipients()
+        return {
+            'recipients': len(recipients),
+            'digest': sum(1 for r in recipients if r.mode == 'digest'),
+            'source': self.path or 'RECIPIENT_EMAIL',
+        }
+
+
+def group_items(items, recipients_of):
+    """Pair each distinct recipient list with the items it should get
+
+    Recipients that follow exactly the same items share one message, so a
+    digest body is rendered once per group rather than once per recipient.
+    """
+    per_recipient = {}
+    for index, item in enumerate(items):
+        for email in recipients_of(item):
+            per_recipient.setdefault(email, []).append(index)
+    groups = {}
+    for email, indexes in per_recipient.items():
+        groups.setdefault(tuple(indexes), []).append(email)
+    return [([items[i] for i in indexes], emails) for indexes, emails in groups.items()]
+
+
+def render_digest(items):
+    """One email body covering several {'topic', 'body'} items"""
+    return f"""
+        Batch of {len(items)} topics: {', '.join(item['topic'] for item in items)}
+        """ + DIGEST_SEPARATOR.join(item['body'] for item in items)
+
+
+class DigestSpool:
+    """Collects emails for digest subscribers on disk and sends them every `interval` seconds
+
+    add() writes one small file per generation, so every gunicorn worker
+    feeds the same digest and nothing is lost on a restart. An flock lets
+    only one worker roll up and queue each digest.
+    """
+
+    def __init__(self, spool_dir, queue, interval=3600.0, subject='AI Generated Content digest',
+                 poll_interval=30.0):
+        self.spool_dir = spool_dir
+        self.queue = queue
+        self.interval = interval
+        self.subject = subject
+        self.poll_interval = poll_interval
+        self._items_dir = os.path.join(spool_dir, 'items')
+        self._quarantine_dir = os.path.join(spool_dir, 'quarantine')
+        self._marker = os.path.join(spool_dir, 'last_sent')
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.digests = 0
+        self.messages = 0
+        os.makedirs(self._items_dir, exist_ok=True)
+
+    def add(self, topic, body, recipients):
+        """Hold an already rendered email body for the next digest"""
+        item_id = uuid.uuid4().hex
+        record = {'id': item_id, 'topic': topic, 'body': body, 'recipients': list(recipients),
+                  'created_at': time.time()}
+        # Names sort by creation time, so digests list topics in order
+        path = os.path.join(self._items_dir, f"{time.time_ns()}-{item_id}.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+            # On disk before it is renamed into place, as the delivery spool does
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return item_id
+
+    def pending_count(self):
+        return sum(1 for name in os.listdir(self._items_dir) if name.endswith('.json'))
+
+    def start(self):
+        """Start the digest thread in this process if it isn't running"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='email-digest', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                if self.due():
+                    self.flush(if_due=True)
+            except Exception as e:
+                print(f"Error sending email digest: {e}")
+            self._stopping.wait(self.poll_interval)
+
+    def due(self):
+        try:
+            last_sent = os.path.getmtime(self._marker)
+        except FileNotFoundError:
+            # First run: start the clock instead of sending straight away
+            self._touch_marker()
+            return False
+        return time.time() - last_sent >= self.interval
+
+    def _touch_marker(self):
+        with open(self._marker, 'a'):
+            pass
+        os.utime(self._marker)
+
+    def flush(self, if_due=False):
+        """Queue a digest of everything collected so far; returns the delivery ids
+
+        With if_due, nothing is sent unless the digest is still due once the
+        lock is held, since another worker may have just sent it.
+        """
+        lock_file = open(os.path.join(self.spool_dir, 'digest.lock'), 'a')
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return []  # another worker is sending this digest
+            if if_due and not self.due():
+                return []
+            names = sorted(name for name in os.listdir(self._items_dir) if name.endswith('.json'))
+            items = []
+            for name in list(names):
+                try:
+                    items.append(self._read_item(name))
+                except FileNotFoundError:
+                    names.remove(name)
+                except (ValueError, KeyError, TypeError) as e:
+                    names.remove(name)
+                    self._quarantine(name, e)
+
+            delivery_ids = []
+            for group, emails in group_items(items, lambda item: item['recipients']):
+                delivery_ids.append(self.queue.enqueue(
+                    emails, f"{self.subject}: {len(group)} topics", render_digest(group)))
+            # Only forget the items once their digests are safely spooled
+            for name in names:
+                try:
+                    os.remove(os.path.join(self._items_dir, name))
+                except FileNotFoundError:
+                    pass
+            self._touch_marker()
+            if delivery_ids:
+                self.digests += 1
+                self.messages += len(delivery_ids)
+            return delivery_ids
+        finally:
+            lock_file.close()
+
+    def _read_item(self, name):
+        with open(os.path.join(self._items_dir, name), encoding='utf-8') as f:
+            item = json.load(f)
+        if not isinstance(item['topic'], str) or not isinstance(item['body'], str):
+            raise ValueError("topic and body must be strings")
+        if not isinstance(item['recipients'], list):
+            raise ValueError("recipients must be a list")
+        return item
+
+    def _quarantine(self, name, error):
+        """Set an unreadable item aside, where it can be inspected, instead of dropping it"""
+        print(f"Error reading digest item {name}, moving it to {self._quarantine_dir}: {error}")
+        os.makedirs(self._quarantine_dir, exist_ok=True)
+        try:
+            os.replace(os.path.join(self._items_dir, name), os.path.join(self._quarantine_dir, name))
+        except FileNotFoundError:
+            pass
+
+    def quarantined_count(self):
+        try:
+            return sum(1 for name in os.listdir(self._quarantine_dir) if name.endswith('.json'))
+        except FileNotFoundError:
+            return 0
+
+    def stats(self):
+        return {'pending': self.pending_count(), 'quarantined': self.quarantined_count(),
+                'digests': self.digests, 'messages': self.messages, 'interval': self.interval}
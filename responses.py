@@ -0,0 +1,135 @@
+"""HTTP response helpers: compression negotiation, ETags and the pre-rendered index page"""
+
+import gzip
+import hashlib
+import re
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = frozenset({
+    'application/json', 'application/x-ndjson', 'text/html', 'text/plain',
+    'text/css', 'application/javascript',
+})
+
+GZIP_LEVEL = 6
+# Quality 5 is close to gzip -9 in size at a fraction of brotli's top-level cost
+BROTLI_QUALITY = 5
+
+
+def accepted_encodings(header):
+    """Parse Accept-Encoding into {coding: q}"""
+    accepted = {}
+    for item in (header or '').split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        match = re.search(r'q\s*=\s*([0-9.]+)', params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(header):
+    """Best coding we can produce for this Accept-Encoding, or None for identity"""
+    accepted = accepted_encodings(header)
+    wildcard = accepted.get('*', 0.0)
+    offers = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best, best_q = None, 0.0
+    for coding in offers:
+        q = accepted.get(coding, wildcard)
+        # Ties go to the earlier offer, i.e. brotli
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the output, and so any ETag derived from it, stable
+    return gzip.compress(body, GZIP_LEVEL, mtime=0)
+
+
+def encode_body(body, accept_encoding, min_bytes=1024):
+    """Return (body, encoding); small bodies and clients that don't ask stay as is"""
+    if len(body) < min_bytes:
+        return body, None
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None:
+        return body, None
+    return compress(body, encoding), encoding
+
+
+def make_etag(data):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison of an If-None-Match header against an (unquoted) ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate.strip('"') == etag:
+            return True
+    return False
+
+
+class StaticPage:
+    """A page rendered once at startup, with every compressed variant built up front"""
+
+    __slots__ = ('body', 'etag', 'variants')
+
+    def __init__(self, html):
+        self.body = html.encode('utf-8')
+        self.etag = make_etag(self.body)
+        self.variants = {None: self.body, 'gzip': compress(self.body, 'gzip')}
+        if brotli is not None:
+            self.variants['br'] = compress(self.body, 'br')
+
+    def encoded(self, accept_encoding):
+        """(encoding or None, body) for this request's Accept-Encoding"""
+        encoding = choose_encoding(accept_encoding)
+        return encoding, self.variants[encoding]
+
+
+_STYLE_RE = re.compile(r'(<style[^>]*>)(.*?)(</style>)', re.DOTALL | re.IGNORECASE)
+_CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+_CSS_SPACE_RE = re.compile(r'\s*([{};,>])\s*')
+_HTML_COMMENT_RE = re.compile(r'<!--(?!\[if).*?-->', re.DOTALL)
+_JS_LINE_COMMENT_RE = re.compile(r'^\s*//[^\n]*$', re.MULTILINE)
+
+
+def _minify_css(css):
+    css = _CSS_COMMENT_RE.sub('', css)
+    css = ' '.join(css.split())
+    css = _CSS_SPACE_RE.sub(r'\1', css)
+    return css.replace(': ', ':').replace(';}', '}')
+
+
+def minify_html(html):
+    """Conservative minification of a page with inline <style> and <script>
+
+    CSS is fully collapsed. Elsewhere only indentation, blank lines, HTML
+    comments and whole-line // comments go: newlines are kept so JavaScript
+    never depends on semicolon insertion surviving a join.
+    """
+    html = _STYLE_RE.sub(lambda m: m.group(1) + _minify_css(m.group(2)) + m.group(3), html)
+    html = _HTML_COMMENT_RE.sub('', html)
+    html = _JS_LINE_COMMENT_RE.sub('', html)
+    return '\n'.join(line.strip() for line in html.splitlines() if line.strip())
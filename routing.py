@@ -0,0 +1,323 @@
+"""Text-generation routing across several backends, with hedged requests
+
+INFERENCE_ROUTES lists the backends, comma-separated:
+
+    gpt2*3, distilgpt2, local:distilgpt2, gpt2@http://127.0.0.1:8765/
+
+Each entry is a model id, optionally "@<base url>" for another HF-compatible
+server (default HUGGINGFACE_API_URL), or "local:<model>" for in-process
+inference, then an optional "*<weight>". Every route keeps rolling latency
+and error statistics. A request goes to the healthy route with the lowest
+median latency divided by its weight (untried routes first), and fails over
+to the runner-up on an upstream error. With hedging, if the first route has
+not answered within its own p95 latency, the same request also goes to the
+runner-up and whichever answers first wins, so a model that is cold-loading
+on one backend doesn't set the tail latency.
+
+Only whole generations feed the latency window behind scoring and hedging.
+Streams keep their time to first chunk in a window of their own, since a
+first chunk arrives far sooner than a whole generation.
+"""
+
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from inference import UpstreamError
+from metrics import HEDGES, ROUTE_CALLS
+
+
+def parse_routes(spec, remote, local, default_url):
+    """Routes from an INFERENCE_ROUTES string
+
+    remote(base_url) and local() build the backends; every remote route gets
+    its own client (and circuit breaker), all local routes share one backend.
+    """
+    routes = []
+    local_backend = None
+    for entry in spec.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        target, _, weight = entry.partition('*')
+        target = target.strip()
+        try:
+            weight = float(weight) if weight.strip() else 1.0
+        except ValueError:
+            raise ValueError(f"Bad weight in route {entry!r}")
+        if target.startswith('local:'):
+            if local_backend is None:
+                local_backend = local()
+            routes.append(Route(target, local_backend, target[len('local:'):], weight))
+        else:
+            model, _, base_url = target.partition('@')
+            routes.append(Route(target, remote(base_url or default_url), model, weight))
+    if not routes:
+        raise ValueError("INFERENCE_ROUTES lists no routes")
+    return routes
+
+
+class Route:
+    """One backend + model, with its rolling latency and outcome window"""
+
+    def __init__(self, name, backend, model, weight=1.0, window=100):
+        self.name = name
+        self.backend = backend
+        self.model = model
+        self.weight = max(weight, 0.01)
+        self.latencies = deque(maxlen=window)  # seconds, successful generations only
+        self.ttfb = deque(maxlen=window)       # seconds to a stream's first chunk
+        self.outcomes = deque(maxlen=window)   # True for success
+        self.inflight = 0
+        self.last_failure = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, ok, stream=False):
+        """Record a call's outcome; a stream's seconds are its time to first chunk"""
+        with self._lock:
+            self.outcomes.append(ok)
+            if ok:
+                (self.ttfb if stream else self.latencies).append(seconds)
+            else:
+                self.last_failure = time.monotonic()
+
+    def percentile(self, q, stream=False):
+        with self._lock:
+            latencies = sorted(self.ttfb if stream else self.latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    @property
+    def error_rate(self):
+        with self._lock:
+            outcomes = list(self.outcomes)
+        return outcomes.count(False) / len(outcomes) if outcomes else 0.0
+
+    def healthy(self, max_error_rate, min_samples, cooldown):
+        """Breaker closed and error rate acceptable, or quiet long enough to try again"""
+        breaker = getattr(self.backend, 'breaker', None)
+        if breaker is not None and breaker.state == 'open':
+            return False
+        if len(self.outcomes) < min_samples or self.error_rate <= max_error_rate:
+            return True
+        return time.monotonic() - self.last_failure >= cooldown
+
+    def score(self):
+        """Lower is better: median latency over weight; untried routes first"""
+        median = self.percentile(0.5)
+        return (0.0 if median is None else median / self.weight, -self.weight)
+
+    def stats(self):
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        ttfb = self.percentile(0.5, stream=True)
+        return {
+            'name': self.name,
+            'model': self.model,
+            'weight': self.weight,
+            'samples': len(self.outcomes),
+            'error_rate': round(self.error_rate, 3),
+            'p50_ms': round(p50 * 1000) if p50 is not None else None,
+            'p95_ms': round(p95 * 1000) if p95 is not None else None,
+            'ttfb_p50_ms': round(ttfb * 1000) if ttfb is not None else None,
+            'inflight': self.inflight,
+        }
+
+
+class Router:
+    """Inference backend that spreads text generation over several routes
+
+    Implements the same generate_text / stream_text / summarize / warm calls
+    as InferenceClient and LocalBackend. The model argument callers pass for
+    text generation is replaced by the chosen route's model; summarization
+    goes to the first route's backend.
+    """
+
+    def __init__(self, routes, hedge=True, hedge_max_ratio=0.1, hedge_min_samples=10,
+                 hedge_default_delay=2.0, max_error_rate=0.5, min_samples=5, cooldown=30.0,
+                 explore=0.05, max_workers=16):
+        self.routes = list(routes)
+        self.hedge = hedge
+        self.hedge_max_ratio = hedge_max_ratio
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_default_delay = hedge_default_delay
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.explore = explore
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='router')
+
+    def rank(self):
+        """(routes best first, how many of them are healthy)"""
+        healthy, unhealthy = [], []
+        for route in self.routes:
+            if route.healthy(self.max_error_rate, self.min_samples, self.cooldown):
+                healthy.append(route)
+            else:
+                unhealthy.append(route)
+        healthy.sort(key=Route.score)
+        # Now and then try a route other than the current best, so routes
+        # that were slow once get fresh samples instead of being starved
+        if len(healthy) > 1 and random.random() < self.explore:
+            pick = random.choices(healthy, weights=[route.weight for route in healthy])[0]
+            healthy.remove(pick)
+            healthy.insert(0, pick)
+        # Unhealthy routes are a last resort, least failing first
+        unhealthy.sort(key=lambda route: route.error_rate)
+        return healthy + unhealthy, len(healthy)
+
+    def hedge_delay(self, route):
+        """How long to wait for a route before hedging: its p95, once it has enough samples"""
+        if len(route.latencies) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return max(0.05, route.percentile(0.95))
+
+    def _may_hedge(self):
+        with self._lock:
+            return self.hedges < self.hedge_max_ratio * self.requests
+
+    def _attempt(self, route, call):
+        started = time.perf_counter()
+        with route._lock:
+            route.inflight += 1
+        try:
+            result = call(route)
+        except UpstreamError:
+            route.record(time.perf_counter() - started, False)
+            ROUTE_CALLS.inc(route.name, 'error')
+            raise
+        finally:
+            with route._lock:
+                route.inflight -= 1
+        route.record(time.perf_counter() - started, True)
+        ROUTE_CALLS.inc(route.name, 'ok')
+        return result
+
+    def _submit(self, route, call):
+        # Each call gets its own copy so the upstream priority and deadline carry over
+        return self._executor.submit(contextvars.copy_context().run, self._attempt, route, call)
+
+    def _call(self, call):
+        """Run call(route) on the best route, failing over or hedging to the runner-up"""
+        ranked, healthy = self.rank()
+        with self._lock:
+            self.requests += 1
+        primary = ranked[0]
+        backup = ranked[1] if len(ranked) > 1 else None
+        if backup is None:
+            return self._attempt(primary, call)
+        if not (self.hedge and healthy > 1 and self._may_hedge()):
+            try:
+                return self._attempt(primary, call)
+            except UpstreamError as e:
+                print(f"Route {primary.name} failed, trying {backup.name}: {e}")
+                return self._attempt(backup, call)
+
+        first = self._submit(primary, call)
+        wait([first], timeout=self.hedge_delay(primary))
+        if first.done():
+            try:
+                return first.result()
+            except UpstreamError as e:
+                print(f"Route {primary.name} failed, trying {backup.name}: {e}")
+                return self._attempt(backup, call)
+
+        with self._lock:
+            self.hedges += 1
+        HEDGES.inc('sent')
+        second = self._submit(backup, call)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except UpstreamError as e:
+                    error = e
+                    continue
+                # The slower call keeps running; its latency still updates its route
+                if future is second:
+                    with self._lock:
+                        self.hedge_wins += 1
+                    HEDGES.inc('won')
+                return result
+        raise error
+
+    def generate_text(self, model, prompt, parameters):
+        """Run text generation on the best route and return the generated text"""
+        return self._call(lambda route: route.backend.generate_text(route.model, prompt, parameters))
+
+    def stream_text(self, model, prompt, parameters):
+        """Stream from the best route (streams are neither hedged nor failed over)
+
+        A stream counts as a success once its first chunk has arrived, and
+        its time to that chunk goes to the route's TTFB window, not to the
+        generation latencies used for scoring and hedging: readers often
+        close the stream early (see validation.py), so the time to its end
+        says little about the route. A stream closed before any chunk isn't
+        recorded.
+        """
+        route = self.rank()[0][0]
+        with self._lock:
+            self.requests += 1
+        with route._lock:
+            route.inflight += 1
+        started = time.perf_counter()
+        first_chunk = None
+        failed = False
+        chunks = route.backend.stream_text(route.model, prompt, parameters)
+        try:
+            for chunk in chunks:
+                if first_chunk is None:
+                    first_chunk = time.perf_counter() - started
+                yield chunk
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - started
+        except UpstreamError:
+            failed = True
+            raise
+        finally:
+            # Also runs when the reader closes the stream (GeneratorExit),
+            # which in turn closes the upstream one
+            chunks.close()
+            with route._lock:
+                route.inflight -= 1
+            if failed:
+                route.record(time.perf_counter() - started, False)
+                ROUTE_CALLS.inc(route.name, 'error')
+            elif first_chunk is not None:
+                route.record(first_chunk, True, stream=True)
+                ROUTE_CALLS.inc(route.name, 'ok')
+
+    def summarize(self, model, text, parameters=None):
+        return self.routes[0].backend.summarize(model, text, parameters)
+
+    def warm(self, model):
+        """Load every route's model, so none of them cold-loads on a live request"""
+        for route in self.routes:
+            try:
+                route.backend.warm(route.model)
+            except Exception as e:
+                print(f"Error warming route {route.name}: {e}")
+
+    def preload(self, models):
+        """Load the local routes' models (for a preloading gunicorn master)"""
+        for route in self.routes:
+            if hasattr(route.backend, 'preload'):
+                route.backend.preload(dict(models, text_generation=route.model))
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'routes': [route.stats() for route in self.routes],
+        }
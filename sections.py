@@ -0,0 +1,176 @@
+"""Single-pass parser for the sectioned text the content prompt asks the model for"""
+
+import re
+
+# Canonical section titles (number optional) plus short aliases that are only
+# recognised with their number, e.g. "3. Title" but never a bare "Title".
+_TITLES = {
+    'script': (r'Video\s+Script', r'Script'),
+    'image_prompts': (r'AI\s+Image\s+Generation\s+Prompts', r'(?:AI\s+)?Image(?:\s+Generation)?\s+Prompts'),
+    'video_name': (r'YouTube\s+Shorts\s+Title', r'(?:Video\s+)?Title'),
+    'description': (r'Video\s+Description', r'Description'),
+    'meta_tags': (r'Meta\s+Tags', r'(?:Hash)?[Tt]ags'),
+}
+
+# One header per line: any emoji / markdown decoration, an optional "N." and
+# the title. Everything up to and including a trailing ":" or "**" belongs to
+# the header; text after it on the same line is the start of the body.
+# Without its number a title only counts after bold, "#" or an emoji, so
+# that a body line like "Video script ideas:" is not taken for a header.
+HEADER_RE = re.compile(
+    r'^(?=[^\w\n]*[1-5][.)]|[^\w\n]*?(?:\*\*|#|[^\w\s\x00-\x7f]))[^\w\n]*(?:'
+    + '|'.join(
+        rf'(?P<{name}>(?:[1-5][.)]\s*\**\s*)?{canonical}|[1-5][.)]\s*\**\s*{alias})'
+        for name, (canonical, alias) in _TITLES.items()
+    )
+    + r')\b[^:\n]*:?\**[ \t]*',
+    re.MULTILINE | re.IGNORECASE,
+)
+
+# A line made only of dashes separates sections
+SEPARATOR_RE = re.compile(r'^[ \t]*-{3,}[ \t]*$', re.MULTILINE)
+
+# "[INTRO IMAGE]", "[FACT 3]", "FACT 3 IMAGE:", "**OUTRO:**" ... at the start of
+# a line. A bare word needs the brackets, "IMAGE" or a colon to count as a label
+# so that prompts starting with e.g. "Intro shot of" are left alone.
+IMAGE_LABEL_RE = re.compile(
+    r'^[^\w\n\[]*(?P<open>\[)?(?P<label>INTRO|FACT\s*[1-5]|OUTRO)\b(?P<image>\s+IMAGE\b)?'
+    r'(?(open)\]|(?(image)|\**\s*:))[^\w\n]*',
+    re.MULTILINE | re.IGNORECASE,
+)
+
+SECTION_NAMES = ('script', 'image_prompts', 'video_name', 'description', 'meta_tags')
+IMAGE_PROMPT_COUNT = 7
+
+
+def empty_content():
+    return {
+        'script': '',
+        'video_name': '',
+        'description': '',
+        'meta_tags': '',
+        'image_prompts': []
+    }
+
+
+def _section_end(text, start, end):
+    """End of a section body: the first separator line, or the next header"""
+    separator = SEPARATOR_RE.search(text, start, end)
+    return separator.start() if separator else end
+
+
+def _image_prompts(text, start, end):
+    """Extract up to seven prompts, ordered INTRO, FACT 1-5, OUTRO when labelled"""
+    labels = list(IMAGE_LABEL_RE.finditer(text, start, end))
+    if not labels:
+        # Unlabelled output: one prompt per non-empty line
+        prompts = [p.strip() for p in text[start:end].split('\n') if p.strip()]
+        return prompts[:IMAGE_PROMPT_COUNT]
+
+    slots = [''] * IMAGE_PROMPT_COUNT
+    for i, label in enumerate(labels):
+        stop = labels[i + 1].start() if i + 1 < len(labels) else end
+        prompt = ' '.join(text[label.end():stop].split())
+        if not prompt:
+            continue
+        name = label.group('label').upper()
+        if name == 'INTRO':
+            slots[0] = prompt
+        elif name == 'OUTRO':
+            slots[-1] = prompt
+        else:
+            slots[int(name[-1])] = prompt
+    return [p for p in slots if p]
+
+
+def _section_value(name, text, start, end):
+    end = _section_end(text, start, end)
+    if name == 'image_prompts':
+        return _image_prompts(text, start, end)
+    return text[start:end].strip()
+
+
+def parse_sections(text):
+    """Extract all five sections from model output in one pass over the text
+
+    Missing sections are left empty. When a header appears more than once
+    (e.g. the prompt is echoed back before the generation) the last non-empty
+    occurrence wins.
+    """
+    content = empty_content()
+    previous = None
+    for match in HEADER_RE.finditer(text):
+        if previous is not None:
+            _assign(content, previous.lastgroup, text, previous.end(), match.start())
+        previous = match
+    if previous is not None:
+        _assign(content, previous.lastgroup, text, previous.end(), len(text))
+    return content
+
+
+def _assign(content, name, text, start, end):
+    value = _section_value(name, text, start, end)
+    if value:
+        content[name] = value
+
+
+class SectionStreamParser:
+    """Incremental variant of parse_sections for token streams
+
+    feed() returns the (name, value) pairs of sections that were completed by
+    the new text, i.e. sections followed by a separator line or another
+    header. close() flushes the final section.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self._scanned = 0         # headers/separators before this are handled
+        self._current = None      # (name, body_start) of the open section
+        self._current_done = False
+        self.content = empty_content()
+
+    def feed(self, chunk):
+        self.text += chunk
+        # Only whole lines can be classified as headers or separators
+        end = self.text.rfind('\n', self._scanned) + 1
+        if end <= self._scanned:
+            return []
+        completed = []
+        for match in HEADER_RE.finditer(self.text, self._scanned, end):
+            self._finish_current(match.start(), completed)
+            self._current = (match.lastgroup, match.end())
+            self._current_done = False
+        if self._current is not None and not self._current_done:
+            name, body_start = self._current
+            separator = SEPARATOR_RE.search(self.text, max(body_start, self._scanned), end)
+            if separator:
+                self._finish_current(separator.start(), completed)
+        self._scanned = end
+        return completed
+
+    def close(self, end=None):
+        """Finish the open section at `end` (default: the end of the text)"""
+        completed = []
+        self._finish_current(len(self.text) if end is None else end, completed)
+        self._current = None
+        return completed
+
+    def open_section(self):
+        """(name, body start) of the section still being written, or None"""
+        if self._current is None or self._current_done:
+            return None
+        return self._current
+
+    def discard(self):
+        """Drop the open section without assigning it"""
+        self._current = None
+
+    def _finish_current(self, end, completed):
+        if self._current is None or self._current_done:
+            return
+        name, body_start = self._current
+        self._current_done = True
+        value = _section_value(name, self.text, body_start, end)
+        if value:
+            self.content[name] = value
+            completed.append((name, value))
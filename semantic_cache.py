@@ -0,0 +1,239 @@
+"""Near-duplicate topic lookup: "Black Hole", "black holes" and "blackholes" share content
+
+Topics are embedded with a hashed character n-gram vectorizer (no model to
+download) into unit vectors kept as rows of one contiguous NumPy matrix. A
+lookup is a single matrix-vector product (cosine similarity) followed by a
+top-k partition, and returns the cache keys of stored topics at or above the
+similarity threshold. Rows are evicted oldest-first once the index is full,
+and the matrix is compacted when enough rows are dead.
+
+Similarity alone is not enough on long topics, where the shared words swamp
+the ones that differ ("... ancient Rome" vs "... ancient Greece" scores over
+0.9). A candidate is only accepted if it has the same words up to inflection
+or spacing.
+"""
+
+import re
+import threading
+import time
+import zlib
+
+try:
+    import numpy as np
+except ImportError:  # semantic caching disabled
+    np = None
+
+from cache import normalize_topic
+
+
+_WORD_RE = re.compile(r'\w+')
+_SUFFIXES = ('ing', 'est', 'ed', 'er', 'ly')
+
+
+def _singular(word):
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 4 and word.endswith(('ses', 'xes', 'zes', 'ches', 'shes')):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def _stem(word):
+    word = _singular(word)
+    for suffix in _SUFFIXES:
+        if len(word) - len(suffix) >= 3 and word.endswith(suffix):
+            word = word[:-len(suffix)]
+            break
+    if len(word) > 3 and word[-1] == word[-2] and word[-1] not in 'aeiou':
+        word = word[:-1]  # running -> run
+    return word[:-1] if len(word) > 3 and word.endswith('e') else word
+
+
+def canonical_topic(topic):
+    """Word stems run together, so inflection, spacing and punctuation don't matter"""
+    return ''.join(_stem(word) for word in _WORD_RE.findall(normalize_topic(topic)))
+
+
+def topic_words(topic):
+    """The topic's word stems: "exploding volcanoes" and "volcano explodes" have the same"""
+    return frozenset(_stem(word) for word in _WORD_RE.findall(normalize_topic(topic)))
+
+
+def same_topic(a, b):
+    """Whether two topics differ only by inflection, spacing or punctuation
+
+    Numbers count as words, so "World War 1" is not "World War 2".
+    """
+    return canonical_topic(a) == canonical_topic(b) or topic_words(a) == topic_words(b)
+
+
+class NgramVectorizer:
+    """Hashed character n-gram counts, L2-normalized"""
+
+    def __init__(self, dim=512, ngram_sizes=(2, 3, 4)):
+        self.dim = dim
+        self.ngram_sizes = ngram_sizes
+
+    def __call__(self, topic):
+        text = f"^{canonical_topic(topic)}$"
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for n in self.ngram_sizes:
+            for i in range(len(text) - n + 1):
+                h = zlib.crc32(text[i:i + n].encode('utf-8'))
+                # A hashed sign keeps collisions from only ever adding up
+                vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """Topic vectors in a growable matrix, mapped to generation cache keys"""
+
+    def __init__(self, vectorizer=None, threshold=0.9, capacity=5000, top_k=3, compact_ratio=0.25):
+        if np is None:
+            raise RuntimeError("numpy is required for the semantic cache")
+        self.vectorizer = vectorizer or NgramVectorizer()
+        self.threshold = threshold
+        self.capacity = capacity
+        self.top_k = top_k
+        self.compact_ratio = compact_ratio
+        self._lock = threading.Lock()
+        self._reset(initial=64)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _reset(self, initial):
+        self._matrix = np.zeros((initial, self.vectorizer.dim), dtype=np.float32)
+        self._alive = np.zeros(initial, dtype=bool)
+        self._added = np.zeros(initial, dtype=np.float64)
+        self._keys = [None] * initial
+        self._topics = [None] * initial
+        self._words = [None] * initial
+        self._rows = {}  # canonical topic -> row
+        self._size = 0   # rows in use, dead ones included
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, topic, cache_key):
+        """Index a topic's cache key (replacing the key of an identical topic)"""
+        canonical = canonical_topic(topic)
+        if not canonical:
+            return
+        vector = self.vectorizer(topic)
+        with self._lock:
+            row = self._rows.get(canonical)
+            if row is None:
+                if len(self._rows) >= self.capacity:
+                    self._evict_oldest()
+                row = self._append_row()
+                self._rows[canonical] = row
+            self._matrix[row] = vector
+            self._alive[row] = True
+            self._added[row] = time.time()
+            self._keys[row] = cache_key
+            self._topics[row] = topic
+            self._words[row] = topic_words(topic)
+
+    def _append_row(self):
+        if self._size == len(self._alive):
+            limit = max(self.capacity, 64)
+            if len(self._rows) <= (1 - self.compact_ratio) * self._size or self._size >= limit:
+                self._compact()
+            if self._size == len(self._alive):
+                self._grow(min(2 * len(self._alive), limit))
+        row = self._size
+        self._size += 1
+        return row
+
+    def _grow(self, rows):
+        extra = rows - len(self._alive)
+        self._matrix = np.concatenate([self._matrix, np.zeros((extra, self.vectorizer.dim), dtype=np.float32)])
+        self._alive = np.concatenate([self._alive, np.zeros(extra, dtype=bool)])
+        self._added = np.concatenate([self._added, np.zeros(extra, dtype=np.float64)])
+        self._keys.extend([None] * extra)
+        self._topics.extend([None] * extra)
+        self._words.extend([None] * extra)
+
+    def _compact(self):
+        """Move the live rows to the front so the matrix stays dense"""
+        live = np.flatnonzero(self._alive[:self._size])
+        count = len(live)
+        self._matrix[:count] = self._matrix[live]
+        self._added[:count] = self._added[live]
+        self._alive[:count] = True
+        self._alive[count:] = False
+        self._keys[:count] = [self._keys[i] for i in live]
+        self._topics[:count] = [self._topics[i] for i in live]
+        self._words[:count] = [self._words[i] for i in live]
+        for i in range(count, self._size):
+            self._keys[i] = self._topics[i] = self._words[i] = None
+        self._rows = {canonical_topic(self._topics[i]): i for i in range(count)}
+        self._size = count
+
+    def _evict_oldest(self):
+        added = np.where(self._alive[:self._size], self._added[:self._size], np.inf)
+        self._drop(int(np.argmin(added)))
+        self.evictions += 1
+
+    def _drop(self, row):
+        self._alive[row] = False
+        self._rows.pop(canonical_topic(self._topics[row]), None)
+        self._keys[row] = self._topics[row] = self._words[row] = None
+
+    def discard(self, cache_key):
+        """Forget a key whose content has expired from the cache"""
+        with self._lock:
+            for row, key in enumerate(self._keys[:self._size]):
+                if key == cache_key and self._alive[row]:
+                    self._drop(row)
+
+    def lookup(self, topic, k=None):
+        """[(similarity, cache_key, topic)] of the k most similar topics over the threshold
+
+        Only topics with the same words as this one (see same_topic) are returned.
+        """
+        k = k or self.top_k
+        vector = self.vectorizer(topic)
+        canonical = canonical_topic(topic)
+        words = topic_words(topic)
+        with self._lock:
+            if not self._rows:
+                self.misses += 1
+                return []
+            # Rows are unit vectors, so the dot product is the cosine similarity
+            similarities = self._matrix[:self._size] @ vector
+            similarities[~self._alive[:self._size]] = -1.0
+            k = min(k, self._size)
+            top = np.argpartition(-similarities, k - 1)[:k]
+            top = top[np.argsort(-similarities[top])]
+            matches = [(float(similarities[row]), self._keys[row], self._topics[row])
+                       for row in top
+                       if similarities[row] >= self.threshold
+                       and (self._words[row] == words or canonical_topic(self._topics[row]) == canonical)]
+            if matches:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return matches
+
+    def rebuild(self, entries):
+        """Replace the index with (topic, cache_key) pairs, oldest first"""
+        with self._lock:
+            self._reset(initial=64)
+        for topic, cache_key in entries:
+            self.add(topic, cache_key)
+
+    def stats(self):
+        return {
+            'topics': len(self._rows),
+            'rows': self._size,
+            'matrix_bytes': self._matrix.nbytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'threshold': self.threshold,
+        }
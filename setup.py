@@ -12,9 +12,15 @@ setup(
         "beautifulsoup4==4.12.2",
         "python-dotenv==1.0.0",
         "gunicorn==21.2.0",
+        "starlette==0.32.0",
+        "uvicorn==0.24.0",
+        "httpx==0.25.2",
+        "aiosmtplib==3.0.1",
         "transformers==4.36.2",
         "torch==2.1.2",
         "Pillow==10.1.0",
+        "Brotli==1.1.0",
+        "numpy==1.26.4",
     ],
     python_requires=">=3.11",
 )
@@ -0,0 +1,121 @@
+"""Request coalescing: concurrent callers with the same key share one call"""
+
+import os
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: coalesce within the process only
+    fcntl = None
+
+
+class CoalesceTimeout(Exception):
+    """Raised to a waiting caller whose timeout ran out before the shared call finished"""
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Deduplicates in-flight calls within a worker and, optionally, across workers
+
+    Within a process, the first caller for a key runs the function and every
+    concurrent caller with the same key waits for and receives its result.
+    With a lock_dir, the leader also takes an flock on a striped lock file, so
+    leaders in other gunicorn workers queue behind it and then re-check the
+    shared cache (via the recheck callable) before calling upstream
+    themselves.
+    """
+
+    def __init__(self, lock_dir=None, lock_timeout=60.0, stripes=4096):
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.lock_timeout = lock_timeout
+        self.stripes = stripes
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    def do(self, key, fn, recheck=None, timeout=None):
+        """Return fn(), sharing one execution among concurrent callers of key
+
+        A caller that joins an execution already in flight waits at most
+        `timeout` seconds for it; the leader itself is never cut short.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise CoalesceTimeout(f"Timed out waiting for the in-flight call for {key}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._lead(key, fn, recheck)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def record_coalesced(self):
+        """Count a caller that shared a call coalesced outside do() (e.g. by the ASGI app)"""
+        with self._lock:
+            self.coalesced += 1
+
+    def in_flight(self):
+        """Number of distinct keys currently being computed in this process"""
+        with self._lock:
+            return len(self._calls)
+
+    def _lead(self, key, fn, recheck):
+        if not self.lock_dir:
+            return fn()
+
+        stripe = zlib.crc32(key.encode('utf-8')) % self.stripes
+        path = os.path.join(self.lock_dir, f"{stripe:04x}.lock")
+        with open(path, 'a') as lock_file:
+            acquired = self._acquire(lock_file)
+            try:
+                if acquired and recheck is not None:
+                    # Another worker may have produced the result while we waited
+                    result = recheck()
+                    if result is not None:
+                        return result
+                return fn()
+            finally:
+                if acquired:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _acquire(self, lock_file):
+        """Take the cross-worker lock, giving up after lock_timeout seconds"""
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    # Don't hang the request on a stuck holder; just run
+                    return False
+                time.sleep(0.05)
+
@@ -0,0 +1,330 @@
+"""Persistent store of every generated result, with indexed lookup and full-text search"""
+
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+from cache import normalize_topic
+from content import ContentResult
+
+CONTENT_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS contents ("
+    " rowid INTEGER PRIMARY KEY,"
+    " id TEXT NOT NULL UNIQUE,"
+    " topic TEXT NOT NULL,"
+    " topic_key TEXT NOT NULL,"
+    " cache_key TEXT,"
+    " model TEXT NOT NULL,"
+    " is_fallback INTEGER NOT NULL,"
+    " created_at REAL NOT NULL,"
+    " script TEXT NOT NULL,"
+    " video_name TEXT NOT NULL,"
+    " description TEXT NOT NULL,"
+    " meta_tags TEXT NOT NULL,"
+    " image_prompts TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_contents_topic ON contents (topic_key, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_contents_created ON contents (created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_contents_model ON contents (model, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_contents_fallback ON contents (is_fallback, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_contents_cache_key ON contents (cache_key, created_at)",
+)
+
+# External-content FTS index kept in step with the table by triggers
+FTS_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS contents_fts USING fts5("
+    " topic, script, video_name, description, content='contents', content_rowid='rowid',"
+    " tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS contents_fts_insert AFTER INSERT ON contents BEGIN"
+    " INSERT INTO contents_fts (rowid, topic, script, video_name, description)"
+    " VALUES (new.rowid, new.topic, new.script, new.video_name, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS contents_fts_delete AFTER DELETE ON contents BEGIN"
+    " INSERT INTO contents_fts (contents_fts, rowid, topic, script, video_name, description)"
+    " VALUES ('delete', old.rowid, old.topic, old.script, old.video_name, old.description); END",
+)
+
+SUMMARY_COLUMNS = "rowid, id, topic, model, is_fallback, created_at, video_name"
+FULL_COLUMNS = SUMMARY_COLUMNS + ", script, description, meta_tags, image_prompts"
+
+
+class ContentStore:
+    """SQLite (WAL) record of generated content, written in batches by a background thread
+
+    record() only queues the row, so request threads never wait on disk.
+    Rows that are queued but not yet written are still visible to get().
+    A row that fails to write is queued again, and given up after
+    max_attempts failures.
+    """
+
+    def __init__(self, path, batch_size=50, flush_interval=0.5, max_attempts=5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        self._queue = queue.Queue()
+        self._pending = {}  # id -> row, until written
+        self._failures = {}  # id -> failed writes so far
+        self._pending_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.written = 0
+        self.dropped = 0
+
+        conn = self._connect()
+        for statement in SCHEMA:
+            conn.execute(statement)
+        try:
+            for statement in FTS_SCHEMA:
+                conn.execute(statement)
+            self.fts = True
+        except sqlite3.OperationalError as e:
+            # SQLite built without FTS5: search falls back to LIKE
+            print(f"Full-text search unavailable, using LIKE: {e}")
+            self.fts = False
+        conn.commit()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # -- writes --------------------------------------------------------
+
+    def record(self, topic, content, model, is_fallback=False, cache_key=None):
+        """Queue a result for writing and return its content id"""
+        content_id = uuid.uuid4().hex
+        row = {
+            'id': content_id,
+            'topic': topic,
+            'topic_key': normalize_topic(topic),
+            'cache_key': cache_key,
+            'model': model,
+            'is_fallback': int(bool(is_fallback)),
+            'created_at': time.time(),
+            'script': content['script'],
+            'video_name': content['video_name'],
+            'description': content['description'],
+            'meta_tags': content['meta_tags'],
+            'image_prompts': json.dumps(content['image_prompts'], ensure_ascii=False),
+        }
+        with self._pending_lock:
+            self._pending[content_id] = row
+        self.start()
+        self._queue.put(row)
+        return content_id
+
+    def start(self):
+        """Start the writer thread in this process if it isn't running"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='content-store', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def flush(self):
+        """Write everything queued so far, on the calling thread"""
+        try:
+            while self._write_batch(block=False):
+                pass
+        except sqlite3.Error as e:
+            print(f"Error writing content store: {e}")
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self._write_batch(block=True)
+            except Exception as e:
+                print(f"Error writing content store: {e}")
+                self._stopping.wait(1.0)
+
+    def _write_batch(self, block):
+        """Collect up to batch_size rows and insert them in one transaction"""
+        rows = []
+        try:
+            rows.append(self._queue.get(block=block, timeout=self.flush_interval if block else None))
+        except queue.Empty:
+            return False
+        deadline = time.monotonic() + self.flush_interval
+        while len(rows) < self.batch_size:
+            try:
+                rows.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+
+        try:
+            self._insert(rows)
+        except sqlite3.Error:
+            if len(rows) == 1:
+                self._requeue(rows)
+                raise
+            # Write the rows one by one, so one bad row doesn't hold back the rest
+            failed = []
+            for row in rows:
+                try:
+                    self._insert([row])
+                except sqlite3.Error:
+                    failed.append(row)
+            self._requeue(failed)
+            if failed:
+                raise
+        return True
+
+    def _insert(self, rows):
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO contents (id, topic, topic_key, cache_key, model, is_fallback,"
+                " created_at, script, video_name, description, meta_tags, image_prompts)"
+                " VALUES (:id, :topic, :topic_key, :cache_key, :model, :is_fallback,"
+                " :created_at, :script, :video_name, :description, :meta_tags, :image_prompts)",
+                rows,
+            )
+        with self._pending_lock:
+            for row in rows:
+                self._pending.pop(row['id'], None)
+                self._failures.pop(row['id'], None)
+        self.written += len(rows)
+
+    def _requeue(self, rows):
+        """Queue failed rows again, giving up on those that have failed max_attempts times"""
+        with self._pending_lock:
+            for row in rows:
+                attempts = self._failures.get(row['id'], 0) + 1
+                if attempts < self.max_attempts:
+                    self._failures[row['id']] = attempts
+                    self._queue.put(row)
+                    continue
+                # Forget it entirely, so get() doesn't serve a row that will never exist
+                self._failures.pop(row['id'], None)
+                self._pending.pop(row['id'], None)
+                self.dropped += 1
+                print(f"Dropping content {row['id']} ({row['topic']}) after {attempts} failed writes")
+
+    # -- reads ---------------------------------------------------------
+
+    @staticmethod
+    def _to_record(row, full=True):
+        record = {
+            'id': row['id'],
+            'topic': row['topic'],
+            'model': row['model'],
+            'is_fallback': bool(row['is_fallback']),
+            'created_at': row['created_at'],
+            'video_name': row['video_name'],
+        }
+        if full:
+            record['content'] = {
+                'script': row['script'],
+                'video_name': row['video_name'],
+                'description': row['description'],
+                'meta_tags': row['meta_tags'],
+                'image_prompts': json.loads(row['image_prompts']),
+            }
+        return record
+
+    def get(self, content_id):
+        """Full record for an id, or None"""
+        with self._pending_lock:
+            row = self._pending.get(content_id)
+        if row is None:
+            row = self._connect().execute(
+                f"SELECT {FULL_COLUMNS} FROM contents WHERE id = ?", (content_id,)
+            ).fetchone()
+        return self._to_record(row) if row is not None else None
+
+    def find_reusable(self, cache_key, max_age):
+        """Newest non-fallback content stored under cache_key within max_age seconds"""
+        row = self._connect().execute(
+            f"SELECT {FULL_COLUMNS} FROM contents"
+            " WHERE cache_key = ? AND is_fallback = 0 AND created_at > ?"
+            " ORDER BY created_at DESC LIMIT 1",
+            (cache_key, time.time() - max_age),
+        ).fetchone()
+        return ContentResult.from_dict(self._to_record(row)['content']) if row is not None else None
+
+    def cached_topics(self, since=0, max_age=None, limit=10000):
+        """(rowid, topic, cache_key) of non-fallback results written after rowid `since`"""
+        clauses, params = ["rowid > ?", "is_fallback = 0", "cache_key IS NOT NULL"], [since]
+        if max_age is not None:
+            clauses.append("created_at > ?")
+            params.append(time.time() - max_age)
+        rows = self._connect().execute(
+            f"SELECT rowid, topic, cache_key FROM contents WHERE {' AND '.join(clauses)} ORDER BY rowid LIMIT ?",
+            params + [limit],
+        ).fetchall()
+        return [(row['rowid'], row['topic'], row['cache_key']) for row in rows]
+
+    def history(self, topic=None, query=None, model=None, is_fallback=None, before=None, limit=20):
+        """Newest-first summaries plus a cursor for the next page
+
+        `before` is the cursor returned with the previous page; it is a row
+        position, so pages stay stable while new rows are added.
+        """
+        clauses, params = [], []
+        if topic:
+            clauses.append("c.topic_key = ?")
+            params.append(normalize_topic(topic))
+        if model:
+            clauses.append("c.model = ?")
+            params.append(model)
+        if is_fallback is not None:
+            clauses.append("c.is_fallback = ?")
+            params.append(int(bool(is_fallback)))
+        if before:
+            clauses.append("c.rowid < ?")
+            params.append(int(before))
+
+        source = "contents c"
+        if query and self.fts:
+            source = "contents c JOIN contents_fts f ON f.rowid = c.rowid"
+            clauses.append("contents_fts MATCH ?")
+            params.append(_fts_query(query))
+        elif query:
+            clauses.append("(c.script LIKE ? OR c.video_name LIKE ? OR c.description LIKE ?)")
+            params.extend([f"%{query}%"] * 3)
+
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+        columns = ', '.join(f"c.{column.strip()}" for column in SUMMARY_COLUMNS.split(','))
+        rows = self._connect().execute(
+            f"SELECT {columns} FROM {source}{where} ORDER BY c.rowid DESC LIMIT ?",
+            params + [limit + 1],
+        ).fetchall()
+
+        items = [self._to_record(row, full=False) for row in rows[:limit]]
+        next_before = rows[limit - 1]['rowid'] if len(rows) > limit else None
+        return {'items': items, 'next_before': next_before}
+
+    def stats(self):
+        return {'written': self.written, 'queued': self._queue.qsize(), 'dropped': self.dropped, 'fts': self.fts}
+
+
+def _fts_query(text):
+    """Quote each word so user input can't inject FTS5 query syntax"""
+    words = re.findall(r'\w+', text)
+    return ' '.join(f'"{word}"' for word in words) or '""'
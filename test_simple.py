@@ -11,69 +11,13 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
+from sections import parse_sections
+
 def parse_ai_response(ai_response, topic):
     """Parse AI response to extract script, title, description, meta tags, and image prompts"""
     try:
-        # Initialize content dictionary
-        content = {
-            'script': '',
-            'video_name': '',
-            'description': '',
-            'meta_tags': '',
-            'image_prompts': []
-        }
-        
-        # Split response into sections
-        sections = ai_response.split('---')
-        
-        for section in sections:
-            if '**1. Video Script' in section:
-                # Extract script
-                script_parts = section.split('**1. Video Script')[1].split('\n')
-                # Remove any empty lines and the "(2-3 minutes max):" line
-                script_parts = [p for p in script_parts if p.strip() and not p.strip().startswith('(')]
-                content['script'] = '\n'.join(script_parts).strip()
-            elif '**3. YouTube Shorts Title' in section:
-                # Extract video name
-                title_parts = section.split('\n')
-                # Find the line that's not empty and doesn't contain "**3."
-                for part in title_parts:
-                    if part.strip() and '**3.' not in part:
-                        content['video_name'] = part.strip()
-                        break
-            elif '**4. Video Description' in section:
-                # Extract description
-                desc_parts = section.split('\n')
-                # Find the line that's not empty and doesn't contain "**4." or "(SEO"
-                for part in desc_parts:
-                    if part.strip() and '**4.' not in part and '(SEO' not in part:
-                        content['description'] = part.strip()
-                        break
-            elif '**5. Meta Tags' in section:
-                # Extract meta tags
-                tags_parts = section.split('\n')
-                # Find the line that's not empty and doesn't contain "**5." or "/"
-                for part in tags_parts:
-                    if part.strip() and '**5.' not in part and '/' not in part:
-                        content['meta_tags'] = part.strip()
-                        break
-            elif '**2. AI Image Generation Prompts' in section:
-                # Extract image prompts
-                prompts = []
-                current_prompt = []
-                lines = section.split('\n')
-                for line in lines:
-                    line = line.strip()
-                    if line:
-                        if any(marker in line for marker in ['[INTRO IMAGE]', '[FACT 1 IMAGE]', '[FACT 2 IMAGE]', '[FACT 3 IMAGE]', '[FACT 4 IMAGE]', '[FACT 5 IMAGE]', '[OUTRO IMAGE]']):
-                            if current_prompt:
-                                prompts.append(' '.join(current_prompt))
-                                current_prompt = []
-                        elif '**2.' not in line and ':' not in line:
-                            current_prompt.append(line)
-                if current_prompt:
-                    prompts.append(' '.join(current_prompt))
-                content['image_prompts'] = prompts[:7]  # Take first 7 prompts
+        # Same single-pass parser the web app uses
+        content = parse_sections(ai_response)
         
         # If any section is empty, use fallback content
         if not all(content.values()):
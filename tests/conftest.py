@@ -0,0 +1,10 @@
+"""Keeps the app's runtime files out of the working tree when tests import it"""
+
+import os
+import tempfile
+
+_runtime_dir = tempfile.mkdtemp(prefix='ai-agent-tests-')
+for name, path in (('STORE_DB_PATH', 'content.sqlite3'), ('JOBS_DB_PATH', 'jobs.sqlite3'),
+                   ('EMAIL_SPOOL_DIR', 'spool')):
+    os.environ.setdefault(name, os.path.join(_runtime_dir, path))
+os.environ.setdefault('LOG_TOKEN_USAGE', 'false')
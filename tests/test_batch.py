@@ -0,0 +1,58 @@
+import json
+import threading
+import time
+
+import pytest
+
+from batch import dedupe_topics, parse_topic_lines, run_batch
+
+
+def test_parse_topic_lines():
+    lines = ['{"topic": "Black Holes"}', '"Ancient Rome"', 'Octopus', '', '   ', '{"other": 1}', '{"topic": " "}', '42']
+    assert parse_topic_lines(lines) == ['Black Holes', 'Ancient Rome', 'Octopus']
+
+
+def test_dedupe_keeps_the_first_spelling():
+    assert dedupe_topics(['Black Holes', 'black  holes', 'Rome', ' BLACK HOLES', '']) == [
+        ('Black Holes', ['black  holes', 'BLACK HOLES']), ('Rome', [])]
+
+
+def test_run_batch_bounds_concurrency_and_reports_errors():
+    running, peak = 0, 0
+    lock = threading.Lock()
+
+    def generate(topic):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+        if topic == 'bad':
+            raise RuntimeError('upstream down')
+        return {'video_name': topic.upper()}
+
+    results = list(run_batch(['a', 'b', 'A', 'bad', 'c', 'd'], generate, concurrency=2))
+    assert peak <= 2
+    by_topic = {result['topic']: result for result in results}
+    assert set(by_topic) == {'a', 'b', 'bad', 'c', 'd'}
+    assert by_topic['a']['content'] == {'video_name': 'A'} and by_topic['a']['duplicates'] == ['A']
+    assert by_topic['bad']['error'] == 'upstream down' and 'content' not in by_topic['bad']
+    assert sorted(result['index'] for result in results) == [0, 1, 2, 3, 4]
+
+
+def test_batch_endpoint_streams_ndjson(monkeypatch):
+    app = pytest.importorskip('app')
+    monkeypatch.setattr(app, 'generate_ai_content', lambda topic, template, **kwargs: app.generate_fallback_content(topic))
+    client = app.app.test_client()
+    response = client.post('/generate/batch', json={'topics': ['Squid', 'squid', 'Owls'], 'email': False})
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line]
+    items = [result for result in results if 'topic' in result]
+    assert sorted(item['topic'] for item in items) == ['Owls', 'Squid']
+    assert all(item['content']['video_name'] for item in items)
+
+    assert client.post('/generate/batch', json={'topics': []}).status_code == 400
+    monkeypatch.setattr(app, 'BATCH_MAX_TOPICS', 2)
+    assert client.post('/generate/batch', json={'topics': ['a', 'b', 'c']}).status_code == 400
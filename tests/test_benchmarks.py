@@ -0,0 +1,88 @@
+import smtplib
+
+import pytest
+import requests
+
+from benchmarks.load_test import percentile
+from benchmarks.mock_upstreams import (
+    MockInferenceServer,
+    MockSMTPServer,
+    _topic_from_prompt,
+    defective_response,
+    sample_response,
+)
+from sections import parse_sections
+
+PROMPT = 'Make a video about "5 Interesting and Unknown Facts About Squid"'
+
+
+@pytest.fixture
+def upstream():
+    server = MockInferenceServer(port=0).start()
+    yield server
+    server.stop()
+
+
+def test_topic_is_taken_from_the_prompt():
+    assert _topic_from_prompt(PROMPT) == 'Squid'
+    assert _topic_from_prompt('**Unknown Facts About Deep Sea Vents**') == 'Deep Sea Vents'
+    assert _topic_from_prompt('no marker here') == 'Topic'
+
+
+def test_generation_echoes_the_prompt(upstream):
+    response = requests.post(f"{upstream.url}gpt2", json={'inputs': PROMPT})
+    text = response.json()[0]['generated_text']
+    assert text == f"{PROMPT}\n\n{sample_response('Squid')}"
+    assert upstream.requests == 1 and upstream.tokens_sent > 0
+
+
+def test_prompt_ending_in_a_header_gets_that_section_alone(upstream):
+    header = sample_response('Squid').split('\n---\n')[2].strip().partition('\n')[0]
+    generation = upstream.generation(f"{PROMPT}\n\n{header}")
+    assert header not in generation
+    assert generation.strip() == sample_response('Squid').split('\n---\n')[2].strip().partition('\n')[2].strip()
+
+
+def test_summarization_models_return_a_summary(upstream):
+    response = requests.post(f"{upstream.url}facebook/bart-large-cnn", json={'inputs': 'one two three'})
+    assert response.json() == [{'summary_text': 'one two three'}]
+
+
+def test_injected_errors_carry_a_retry_hint():
+    server = MockInferenceServer(port=0, error_rate=1.0, retry_after=2).start()
+    try:
+        response = requests.post(f"{server.url}gpt2", json={'inputs': PROMPT})
+    finally:
+        server.stop()
+    assert response.status_code in (429, 503)
+    assert response.headers['Retry-After'] == '2'
+    assert response.json()['estimated_time'] == 2
+    assert server.errors == 1
+
+
+def test_defective_responses_break_the_section_format():
+    complete = parse_sections(sample_response('Squid'))
+    assert all(complete.values())
+    dropped = parse_sections(defective_response('Squid', 'drop'))
+    assert not all(dropped.values())
+    assert defective_response('Squid', 'loop').count('And that is a fact.') == 40
+
+
+def test_smtp_sink_counts_messages_and_recipients():
+    server = MockSMTPServer(port=0).start()
+    try:
+        with smtplib.SMTP('127.0.0.1', server._server.server_address[1], timeout=5) as smtp:
+            smtp.sendmail('a@example.com', ['b@example.com', 'c@example.com'], 'Subject: hi\r\n\r\nbody')
+            smtp.sendmail('a@example.com', ['d@example.com'], 'Subject: again\r\n\r\nbody')
+    finally:
+        server.stop()
+    assert server.messages == 2 and server.recipients == 3
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([7], 95) == 7
+    assert percentile([], 50) == 0.0
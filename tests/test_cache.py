@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+from cache import (GenerationCache, LRUCache, SQLiteCache, decode_entry, encode_entry, make_cache_key,
+                   normalize_topic)
+from content import ContentResult
+
+RESULT = ContentResult('script', 'title', 'description', '#tags', ['one', 'two'])
+
+
+def test_make_cache_key_ignores_case_and_spacing_only():
+    key = make_cache_key('Black Holes', 'gpt2', 'template', {'max_length': 1000})
+    assert make_cache_key('  black   HOLES ', 'gpt2', 'template', {'max_length': 1000}) == key
+    assert make_cache_key('Black Hole', 'gpt2', 'template', {'max_length': 1000}) != key
+    assert make_cache_key('Black Holes', 'distilgpt2', 'template', {'max_length': 1000}) != key
+    assert make_cache_key('Black Holes', 'gpt2', 'template v2', {'max_length': 1000}) != key
+    assert make_cache_key('Black Holes', 'gpt2', 'template', {'max_length': 500}) != key
+    assert len(key) == 64
+    assert normalize_topic(' Black\tHoles ') == 'black holes'
+
+
+def test_entry_encoding_round_trips():
+    assert decode_entry(encode_entry(RESULT)) == RESULT
+    assert decode_entry(encode_entry('a script')) == 'a script'
+    assert decode_entry(encode_entry(['a', 'b'])) == ['a', 'b']
+    # Section dicts written as JSON text by older versions still read as results
+    assert decode_entry('{"script": "script", "video_name": "title", "description": "description",'
+                        ' "meta_tags": "#tags", "image_prompts": ["one", "two"]}') == RESULT
+    with pytest.raises(ValueError):
+        decode_entry(b'{"value": "an untagged stage value"}')
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.set('a', 1, 1)
+    cache.set('b', 2, 1)
+    assert cache.get('a') == 1
+    cache.set('c', 3, 1)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c'), len(cache)) == (1, 3, 2)
+
+
+def test_lru_byte_budget():
+    cache = LRUCache(max_bytes=10)
+    cache.set('a', 'x', 6)
+    cache.set('b', 'y', 6)
+    assert cache.get('a') is None and cache.size_bytes == 6
+    cache.set('huge', 'z', 11)
+    assert cache.get('huge') is None and cache.get('b') == 'y'
+    cache.set('b', 'y2', 4)
+    assert cache.size_bytes == 4
+
+
+def test_lru_ttl():
+    cache = LRUCache(ttl=60)
+    cache.set('short', 1, 1, ttl=0.01)
+    cache.set('long', 2, 1)
+    time.sleep(0.02)
+    assert cache.get('short') is None and cache.get('long') == 2
+    assert cache.size_bytes == 1
+
+
+def test_sqlite_cache(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.db'), ttl=60)
+    cache.set('a', b'value')
+    cache.set('b', b'gone', ttl=0.01)
+    assert cache.get('a') == b'value'
+    value, ttl = cache.get_entry('a')
+    assert value == b'value' and 59 < ttl <= 60
+    time.sleep(0.02)
+    assert cache.get('b') is None and cache.get('missing') is None
+
+
+def test_sqlite_cache_evicts_least_recently_accessed(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.db'), max_entries=10)
+    for i in range(99):
+        cache.set(f'k{i}', b'v')
+    cache.get('k0')
+    cache.set('k99', b'v')  # the 100th write evicts
+    assert cache.get('k0') == b'v' and cache.get('k1') is None
+    conn = cache._connect()
+    assert conn.execute("SELECT COUNT(*) FROM generation_cache").fetchone()[0] == 10
+
+
+def test_sqlite_cache_counts_writes_from_many_threads(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.db'))
+
+    def write(n):
+        for i in range(50):
+            cache.set(f'{n}-{i}', b'v')
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache._writes == 400
+
+
+def test_shared_hit_is_promoted_with_its_remaining_ttl(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    GenerationCache(LRUCache(), SQLiteCache(path)).set('k', RESULT, ttl=0.05)
+    # Another worker: the memory tier's default TTL is an hour
+    worker = GenerationCache(LRUCache(ttl=3600), SQLiteCache(path))
+    assert worker.get('k') == RESULT
+    assert worker.hits_shared == 1
+    time.sleep(0.06)
+    assert worker.get('k') is None
+    assert worker.stats()['misses'] == 1
+
+
+def test_undecodable_shared_entry_is_a_miss(tmp_path):
+    shared = SQLiteCache(str(tmp_path / 'cache.db'))
+    shared.set('k', b'{"value": "old stage entry"}')
+    cache = GenerationCache(LRUCache(), shared)
+    assert cache.get('k') is None and cache.misses == 1
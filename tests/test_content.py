@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+from content import FIELDS, ContentResult, dumps_with_content
+
+SECTIONS = {
+    'script': 'Squid have three hearts. 🦑',
+    'video_name': '5 Facts About Squid',
+    'description': 'Déjà vu under the sea.\nSubscribe!',
+    'meta_tags': '#squid #ocean',
+    'image_prompts': ['A squid, 9:16', '', 'Ink cloud — close up'],
+}
+
+
+def make(**overrides):
+    return ContentResult.from_dict({**SECTIONS, **overrides})
+
+
+@pytest.mark.parametrize('is_fallback', [False, True])
+def test_pack_round_trip(is_fallback):
+    result = ContentResult.from_dict(SECTIONS, is_fallback=is_fallback)
+    restored = ContentResult.unpack(result.pack())
+    assert restored == result
+    assert restored.is_fallback is is_fallback
+    assert restored.to_dict() == SECTIONS
+    # The bytes it came from are reused as its encoding
+    assert restored.pack() == result.pack()
+
+
+def test_pack_round_trip_with_empty_sections():
+    empty = ContentResult()
+    assert ContentResult.unpack(empty.pack()) == empty
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'CR',
+    b'XX1' + bytes(10),
+    ContentResult.from_dict(SECTIONS).pack()[:-1],
+    ContentResult.from_dict(SECTIONS).pack() + b'x',
+    ContentResult.from_dict(SECTIONS).pack()[:12],
+])
+def test_unpack_rejects_anything_else(data):
+    with pytest.raises(ValueError):
+        ContentResult.unpack(data)
+
+
+def test_reads_like_a_dict():
+    result = make()
+    assert result['script'] == SECTIONS['script']
+    assert result.get('missing', 'default') == 'default'
+    assert 'meta_tags' in result and 'topic' not in result
+    assert list(result) == list(FIELDS) and len(result) == 5
+    assert dict(result.items()) == {**SECTIONS, 'image_prompts': tuple(SECTIONS['image_prompts'])}
+    assert result == SECTIONS
+    with pytest.raises(KeyError):
+        result['topic']
+
+
+def test_from_dict_passes_results_and_none_through():
+    result = make()
+    assert ContentResult.from_dict(result) is result
+    assert ContentResult.from_dict(None) is None
+
+
+def test_fallback_flag_is_part_of_equality_and_the_etag():
+    real, fallback = make(), ContentResult.from_dict(SECTIONS, is_fallback=True)
+    assert real != fallback
+    assert real.etag() != fallback.etag()
+    assert real.etag() == make().etag()
+    assert real.etag() != make(script='Different').etag()
+
+
+def test_encodings_are_rendered_once():
+    result = make()
+    assert result.json_text() is result.json_text()
+    assert result.pack() is result.pack()
+    body = result.email_body('Squid')
+    assert result.email_body('Squid') is body
+    assert 'Topic: Squid' in body and 'FACT 1: ' in body
+    assert 'Topic: Octopus' in result.email_body('Octopus')
+
+
+def test_dumps_with_content_splices_the_cached_json():
+    result = make()
+    text = dumps_with_content({'topic': 'Squid', 'is_fallback': False, 'content': result})
+    assert json.loads(text) == {'topic': 'Squid', 'is_fallback': False, 'content': SECTIONS}
+    assert json.loads(dumps_with_content({'content': result})) == {'content': SECTIONS}
+    assert json.loads(dumps_with_content({'content': SECTIONS})) == {'content': SECTIONS}
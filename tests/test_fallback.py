@@ -0,0 +1,24 @@
+from content import FIELDS
+from fallback import IMAGE_PROMPT_TEMPLATES, PLACEHOLDER, TopicTemplate, render_fallback
+
+
+def test_template_splices_the_topic_everywhere():
+    template = TopicTemplate('{topic} at the start, {topic}{topic} in the middle and at the end: {topic}')
+    assert template.render('Squid') == 'Squid at the start, SquidSquid in the middle and at the end: Squid'
+    assert TopicTemplate('no placeholder').render('Squid') == 'no placeholder'
+
+
+def test_fallback_content():
+    content = render_fallback('Black Holes')
+    assert content.is_fallback
+    assert content.video_name == '5 Unknown Facts About Black Holes That Will Shock You! 🤯'
+    assert len(content.image_prompts) == len(IMAGE_PROMPT_TEMPLATES) == 7
+    for name in FIELDS:
+        assert content[name]
+        assert PLACEHOLDER not in str(content[name])
+    assert content.script.count('[FACT') == 5 and 'Black Holes' in content.script
+
+
+def test_equivalent_topics_share_one_render():
+    assert render_fallback('Black  Holes ') is render_fallback('Black Holes')
+    assert render_fallback('black holes') is not render_fallback('Black Holes')
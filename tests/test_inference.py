@@ -0,0 +1,208 @@
+import asyncio
+import os
+import time
+
+import pytest
+import requests
+
+from inference import CircuitBreaker, CircuitOpenError, InferenceClient, UpstreamError
+from ratelimit import AdaptiveRateLimiter, RateLimitedError, request_priority
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._body = body
+        self.closed = False
+
+    def json(self):
+        if isinstance(self._body, Exception):
+            raise self._body
+        return self._body
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    """Answers posts from a script of responses (or exceptions to raise)"""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.posts = 0
+
+    def post(self, url, json=None, timeout=None, stream=False):
+        self.posts += 1
+        outcome = self.script.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+def client_with(*script, **kwargs):
+    kwargs.setdefault('backoff_base', 0.001)
+    kwargs.setdefault('backoff_max', 0.01)
+    client = InferenceClient('http://upstream/', **kwargs)
+    client._session = FakeSession(*script)
+    client._session_pid = os.getpid()
+    return client
+
+
+def ok(text='hello world'):
+    return FakeResponse(200, [{'generated_text': text}])
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    assert breaker.state == 'open'
+
+
+# -- breaker state machine ---------------------------------------------
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'closed' and breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow_request()
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    open_breaker(breaker)
+    time.sleep(0.02)
+    assert breaker.state == 'half-open'
+    assert breaker.admit() == 'probe'
+    assert breaker.admit() is None
+
+
+def test_successful_probe_closes_and_failed_probe_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    open_breaker(breaker)
+    time.sleep(0.02)
+    breaker.admit()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    time.sleep(0.02)
+    assert breaker.admit() == 'probe'
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.admit() == 'closed'
+
+
+def test_released_probe_lets_the_next_call_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    open_breaker(breaker)
+    time.sleep(0.02)
+    assert breaker.admit() == 'probe'
+    breaker.release_probe()
+    assert breaker.state == 'half-open'
+    assert breaker.admit() == 'probe'
+
+
+# -- retries and backoff ------------------------------------------------
+
+def test_retries_retryable_statuses_then_succeeds():
+    busy = FakeResponse(503, {'estimated_time': 0.001})
+    client = client_with(busy, FakeResponse(429, {}), ok())
+    assert client.generate_text('gpt2', 'hi', {}) == 'hello world'
+    assert client._session.posts == 3
+    assert busy.closed
+    assert client.breaker.state == 'closed'
+
+
+def test_exhausted_retries_count_one_breaker_failure():
+    client = client_with(*[FakeResponse(503, {})] * 3, max_retries=2,
+                         breaker=CircuitBreaker(failure_threshold=2))
+    with pytest.raises(UpstreamError) as error:
+        client.generate_text('gpt2', 'hi', {})
+    assert error.value.status_code == 503
+    assert client._session.posts == 3
+    assert client.breaker._failures == 1
+
+
+def test_connection_errors_are_retried():
+    client = client_with(requests.ConnectionError('refused'), ok())
+    assert client.generate_text('gpt2', 'hi', {}) == 'hello world'
+
+
+def test_client_errors_are_not_retried_or_counted_as_outages():
+    client = client_with(FakeResponse(400, {}), breaker=CircuitBreaker(failure_threshold=1))
+    with pytest.raises(UpstreamError):
+        client.generate_text('gpt2', 'hi', {})
+    assert client._session.posts == 1
+    assert client.breaker.state == 'closed'
+
+
+def test_server_errors_are_not_retried_but_count():
+    client = client_with(FakeResponse(500, {}), breaker=CircuitBreaker(failure_threshold=1))
+    with pytest.raises(UpstreamError):
+        client.generate_text('gpt2', 'hi', {})
+    assert client._session.posts == 1
+    assert client.breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        client.generate_text('gpt2', 'hi', {})
+    assert client._session.posts == 1
+
+
+def test_backoff_honours_the_server_hint_up_to_the_cap():
+    client = InferenceClient('http://upstream/', backoff_base=0.5, backoff_max=8.0)
+    assert all(0 <= client._backoff_delay(attempt) <= min(8.0, 0.5 * 2 ** attempt) for attempt in range(6))
+    assert client._backoff_delay(0, hint=3) >= 3
+    assert client._backoff_delay(0, hint=60) == 8.0
+
+
+def test_probe_ending_in_an_unexpected_error_is_released():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    client = client_with(KeyError('odd payload'), ok(), breaker=breaker)
+    open_breaker(breaker)
+    time.sleep(0.02)
+    with pytest.raises(KeyError):
+        client.generate_text('gpt2', 'hi', {})
+    assert client.generate_text('gpt2', 'hi', {}) == 'hello world'
+    assert breaker.state == 'closed'
+
+
+def test_running_out_of_budget_in_backoff_is_not_a_breaker_failure():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    client = client_with(FakeResponse(503, {}), ok(), breaker=breaker, backoff_base=5, backoff_max=5,
+                         limiter=AdaptiveRateLimiter(rate=100, burst=100))
+    client._backoff_delay = lambda attempt, hint=None: 5.0
+    open_breaker(breaker)
+    time.sleep(0.02)
+    with request_priority(0, budget=1.0), pytest.raises(RateLimitedError):
+        client.generate_text('gpt2', 'hi', {})
+    # Neither re-opened for another cool-down nor stuck with its probe taken
+    assert breaker.state == 'half-open'
+    assert client.generate_text('gpt2', 'hi', {}) == 'hello world'
+
+
+def test_cancelled_async_probe_is_released():
+    pytest.importorskip('httpx')
+    from async_inference import AsyncInferenceClient
+
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    client = AsyncInferenceClient('http://upstream/', breaker=breaker)
+
+    async def hang(url, json=None):
+        await asyncio.sleep(10)
+
+    client.client.post = hang
+    open_breaker(breaker)
+    time.sleep(0.02)
+
+    async def main():
+        task = asyncio.ensure_future(client.generate_text('gpt2', 'hi', {}))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await client.aclose()
+
+    asyncio.run(main())
+    assert breaker.admit() == 'probe'
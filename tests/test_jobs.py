@@ -0,0 +1,208 @@
+import json
+import threading
+import time
+
+import pytest
+
+from jobs import JobQueue, JobWorker
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    return JobQueue(str(tmp_path / 'jobs.sqlite3'), lease_seconds=60, max_attempts=3, backoff_base=10)
+
+
+def expire_lease(jobs, job_id):
+    jobs._connect().execute("UPDATE jobs SET lease_until = ? WHERE id = ?", (time.time() - 1, job_id))
+
+
+def make_due(jobs, job_id):
+    jobs._connect().execute("UPDATE jobs SET run_after = ? WHERE id = ?", (time.time() - 1, job_id))
+
+
+def test_enqueue_and_claim_in_order(jobs):
+    first = jobs.enqueue('Squid', {'email': False})
+    second = jobs.enqueue('Comets')
+    assert jobs.get(second)['position'] == 1
+    job = jobs.claim('worker-a')
+    assert job == {'id': first, 'topic': 'Squid', 'options': {'email': False}, 'attempts': 1}
+    record = jobs.get(first)
+    assert record['status'] == 'running' and record['stage'] == 'claimed' and record['started_at']
+    assert jobs.claim('worker-b')['id'] == second
+    assert jobs.claim('worker-c') is None
+    assert jobs.stats() == {'queued': 0, 'running': 2, 'done': 0, 'failed': 0}
+
+
+def test_concurrent_claims_never_share_a_job(jobs):
+    ids = {jobs.enqueue(f'Topic {i}') for i in range(20)}
+    claimed, lock = [], threading.Lock()
+
+    def claim(worker):
+        while True:
+            job = jobs.claim(worker)
+            if job is None:
+                return
+            with lock:
+                claimed.append(job['id'])
+
+    threads = [threading.Thread(target=claim, args=(f'worker-{i}',)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == sorted(ids)
+
+
+def test_complete_records_the_result(jobs):
+    job_id = jobs.enqueue('Squid')
+    jobs.claim('worker-a')
+    assert jobs.progress(job_id, 'worker-a', 'generating')
+    assert jobs.get(job_id)['stage'] == 'generating'
+    assert jobs.complete(job_id, 'worker-a', json.dumps({'success': True}))
+    record = jobs.get(job_id)
+    assert record['status'] == 'done' and record['result'] == {'success': True} and record['finished_at']
+
+
+def test_expired_lease_is_claimed_again_and_the_old_worker_is_locked_out(jobs):
+    job_id = jobs.enqueue('Squid')
+    jobs.claim('worker-a')
+    assert jobs.claim('worker-b') is None
+    expire_lease(jobs, job_id)
+    job = jobs.claim('worker-b')
+    assert job['id'] == job_id and job['attempts'] == 2
+    assert not jobs.progress(job_id, 'worker-a', 'emailing')
+    assert not jobs.complete(job_id, 'worker-a', '{}')
+    assert jobs.complete(job_id, 'worker-b', '{}')
+
+
+def test_a_job_that_keeps_losing_its_worker_fails(jobs):
+    job_id = jobs.enqueue('Squid')
+    for _ in range(3):
+        jobs.claim('worker')
+        expire_lease(jobs, job_id)
+    assert jobs.claim('worker') is None
+    record = jobs.get(job_id)
+    assert record['status'] == 'failed' and record['error'] == 'worker lost'
+
+
+def test_failures_retry_with_backoff_then_fail(jobs):
+    job_id = jobs.enqueue('Squid')
+    job = jobs.claim('worker')
+    before = time.time()
+    assert jobs.fail(job_id, 'worker', 'upstream down', job['attempts'])
+    record = jobs.get(job_id)
+    assert record['status'] == 'queued' and record['stage'] == 'retrying' and record['error'] == 'upstream down'
+    run_after = jobs._connect().execute("SELECT run_after FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+    assert before + 10 <= run_after <= time.time() + 10
+    # Not due until the backoff has passed
+    assert jobs.claim('worker') is None
+
+    make_due(jobs, job_id)
+    job = jobs.claim('worker')
+    jobs.fail(job_id, 'worker', 'upstream down', job['attempts'])
+    run_after = jobs._connect().execute("SELECT run_after FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+    assert run_after >= time.time() + 19
+
+    make_due(jobs, job_id)
+    job = jobs.claim('worker')
+    assert job['attempts'] == 3
+    jobs.fail(job_id, 'worker', 'still down', job['attempts'])
+    record = jobs.get(job_id)
+    assert record['status'] == 'failed' and record['error'] == 'still down'
+
+
+def test_wait_returns_on_change_or_timeout(jobs):
+    job_id = jobs.enqueue('Squid')
+    version = jobs.get(job_id)['version']
+    started = time.monotonic()
+    assert jobs.wait(job_id, version=version, timeout=0.1, poll_interval=0.02)['status'] == 'queued'
+    assert time.monotonic() - started >= 0.1
+
+    timer = threading.Timer(0.05, jobs.claim, args=('worker',))
+    timer.start()
+    record = jobs.wait(job_id, version=version, timeout=5, poll_interval=0.01)
+    timer.join()
+    assert record['status'] == 'running'
+    assert jobs.wait('not-a-job-id') is None
+
+
+def test_prune_drops_only_old_finished_jobs(jobs):
+    old, recent, queued = jobs.enqueue('Old'), jobs.enqueue('Recent'), jobs.enqueue('Queued')
+    for job_id in (old, recent):
+        jobs.claim('worker')
+        jobs.complete(job_id, 'worker', '{}')
+    jobs._connect().execute("UPDATE jobs SET finished_at = ? WHERE id = ?", (time.time() - jobs.retention - 1, old))
+    assert jobs.prune() == 1
+    assert jobs.get(old) is None and jobs.get(recent) and jobs.get(queued)
+
+
+def run_one(jobs, handler):
+    worker = JobWorker(jobs, handler, threads=1)
+    job = jobs.claim('worker')
+    worker._process(job, 'worker')
+    return worker, jobs.get(job['id'])
+
+
+def test_worker_completes_retries_and_discards_lost_jobs(jobs, capsys):
+    jobs.enqueue('Squid')
+    worker, record = run_one(jobs, lambda job, progress: (progress('generating'), '{"ok": true}')[1])
+    assert record['status'] == 'done' and record['result'] == {'ok': True}
+
+    def broken(job, progress):
+        raise RuntimeError('boom')
+
+    jobs.enqueue('Comets')
+    worker, record = run_one(jobs, broken)
+    assert record['status'] == 'queued' and record['error'] == 'boom'
+    assert worker.stats()['failed'] == 1
+
+    def steals_the_lease(job, progress):
+        expire_lease(jobs, job['id'])
+        jobs.claim('someone-else')
+        return '{}'
+
+    jobs.enqueue('Tides')
+    worker, record = run_one(jobs, steals_the_lease)
+    assert record['status'] == 'running' and worker.stats()['lost'] == 1
+    assert 'discarding' in capsys.readouterr().out
+
+
+def test_worker_threads_drain_the_queue(jobs):
+    ids = [jobs.enqueue(f'Topic {i}') for i in range(6)]
+    worker = JobWorker(jobs, lambda job, progress: json.dumps({'topic': job['topic']}), threads=3,
+                       poll_interval=0.01)
+    worker.start()
+    try:
+        deadline = time.monotonic() + 5
+        while worker.completed < 6 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        worker.stop(5)
+    assert [jobs.get(job_id)['result']['topic'] for job_id in ids] == [f'Topic {i}' for i in range(6)]
+
+
+def test_fallback_is_retried_then_finishes_the_job_flagged(jobs, monkeypatch):
+    app = pytest.importorskip('app')
+    from content import ContentResult
+
+    fallback = ContentResult('script', 'Squid', 'description', '#squid', ['prompt'], is_fallback=True)
+    emailed = []
+    monkeypatch.setattr(app, 'job_queue', jobs)
+    monkeypatch.setattr(app, 'generate_ai_content', lambda *args, **kwargs: fallback)
+    monkeypatch.setattr(app, 'send_email', lambda content, topic: emailed.append(topic) or 'delivery-1')
+    worker = JobWorker(jobs, app.run_job, threads=1)
+
+    job_id = jobs.enqueue('Squid')
+    for _ in range(2):
+        worker._process(jobs.claim('worker'), 'worker')
+        record = jobs.get(job_id)
+        assert record['status'] == 'queued' and 'fallback' in record['error']
+        make_due(jobs, job_id)
+    assert emailed == []
+
+    worker._process(jobs.claim('worker'), 'worker')
+    record = jobs.get(job_id)
+    assert record['status'] == 'done' and record['attempts'] == 3
+    assert record['result']['fallback'] is True
+    assert record['result']['content']['video_name'] == 'Squid'
+    assert emailed == ['Squid']
@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+from inference import UpstreamError
+from local_inference import LocalBackend, MicroBatcher
+
+
+class RecordingRunner:
+    def __init__(self):
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def __call__(self, inputs, parameters):
+        with self.lock:
+            self.batches.append((list(inputs), parameters))
+        if 'boom' in inputs:
+            raise RuntimeError('out of memory')
+        return [f"{text}!" for text in inputs]
+
+
+def submit_concurrently(batcher, calls):
+    results = [None] * len(calls)
+    barrier = threading.Barrier(len(calls))
+
+    def call(i, inputs, parameters):
+        barrier.wait()
+        try:
+            results[i] = batcher.submit(inputs, parameters)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i, *args)) for i, args in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_calls_share_a_batch():
+    runner = RecordingRunner()
+    batcher = MicroBatcher(runner, max_batch_size=8, max_wait=0.2)
+    results = submit_concurrently(batcher, [(f"p{i}", {'max_length': 10}) for i in range(4)])
+    assert results == [f"p{i}!" for i in range(4)]
+    assert len(runner.batches) == 1 and sorted(runner.batches[0][0]) == ['p0', 'p1', 'p2', 'p3']
+
+
+def test_batches_are_capped_and_split_by_parameters():
+    runner = RecordingRunner()
+    batcher = MicroBatcher(runner, max_batch_size=2, max_wait=0.2)
+    calls = [('a', {'t': 1}), ('b', {'t': 1}), ('c', {'t': 2}), ('d', {'t': 2})]
+    assert submit_concurrently(batcher, calls) == ['a!', 'b!', 'c!', 'd!']
+    assert all(len(inputs) <= 2 for inputs, _ in runner.batches)
+    for inputs, parameters in runner.batches:
+        assert {dict(calls)[text]['t'] for text in inputs} == {parameters['t']}
+
+
+def test_a_failed_batch_fails_each_of_its_calls():
+    runner = RecordingRunner()
+    batcher = MicroBatcher(runner, max_batch_size=8, max_wait=0.2)
+    results = submit_concurrently(batcher, [('boom', {}), ('fine', {})])
+    assert all(isinstance(result, RuntimeError) for result in results)
+    # The batcher keeps serving afterwards
+    assert batcher.submit('later', {}) == 'later!'
+
+
+def test_backend_wraps_model_errors_as_upstream_errors(monkeypatch):
+    backend = LocalBackend(max_wait=0.01)
+
+    def run_batch(task, model, inputs, parameters):
+        if task == 'summarization':
+            raise RuntimeError('no such model')
+        return [f"{text} and more" for text in inputs]
+
+    monkeypatch.setattr(backend, '_run_batch', run_batch)
+    assert backend.generate_text('gpt2', 'Once', {}) == 'Once and more'
+    with pytest.raises(UpstreamError, match='Local summarization with bart failed'):
+        backend.summarize('bart', 'text')
+
@@ -0,0 +1,105 @@
+import os
+import socket
+import time
+
+import pytest
+
+from benchmarks.mock_upstreams import MockSMTPServer
+from mailer import DeliveryQueue
+
+
+@pytest.fixture
+def smtp():
+    server = MockSMTPServer(port=0).start()
+    yield server
+    server.stop()
+
+
+def make_queue(spool_dir, port, **kwargs):
+    queue = DeliveryQueue(str(spool_dir), '127.0.0.1', port, sender='agent@example.com', use_starttls=False,
+                          smtp_timeout=2, **kwargs)
+    # Deliver on the test's thread (flush) instead of a background one
+    queue.start = lambda: None
+    return queue
+
+
+def closed_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def spooled(queue, state):
+    return sorted(name for name in os.listdir(os.path.join(queue.spool_dir, state)) if name.endswith('.json'))
+
+
+def test_message_moves_from_pending_to_sent(tmp_path, smtp):
+    queue = make_queue(tmp_path, smtp._server.server_address[1])
+    delivery_id = queue.enqueue(['a@example.com', 'b@example.com'], 'Subject', 'Body')
+    assert queue.status(delivery_id)['status'] == 'queued'
+    assert spooled(queue, 'pending') == [f'{delivery_id}.json'] and queue.pending_count() == 1
+
+    queue.flush()
+    status = queue.status(delivery_id)
+    assert status['status'] == 'sent' and status['attempts'] == 1 and status['last_error'] is None
+    assert spooled(queue, 'pending') == spooled(queue, 'sending') == []
+    assert (smtp.messages, smtp.recipients) == (1, 2)
+    queue.stop()
+
+
+def test_batch_shares_one_session(tmp_path, smtp):
+    queue = make_queue(tmp_path, smtp._server.server_address[1])
+    ids = [queue.enqueue('a@example.com', f'Subject {i}', 'Body') for i in range(5)]
+    queue.flush()
+    assert [queue.status(i)['status'] for i in ids] == ['sent'] * 5
+    assert smtp.messages == 5
+    queue.stop()
+
+
+def test_failed_delivery_is_retried_with_backoff_then_fails(tmp_path):
+    queue = make_queue(tmp_path, closed_port(), max_attempts=2, backoff_base=60, backoff_max=60)
+    delivery_id = queue.enqueue('a@example.com', 'Subject', 'Body')
+    queue.flush()
+    status = queue.status(delivery_id)
+    assert status['status'] == 'retrying' and status['attempts'] == 1 and status['last_error']
+    assert spooled(queue, 'pending') == [f'{delivery_id}.json']
+
+    # Not due again for 30-60 seconds
+    queue.flush()
+    assert queue.status(delivery_id)['attempts'] == 1
+
+    queue.backoff_base = queue.backoff_max = 0
+    record = queue._read(queue._path('pending', delivery_id))
+    record['next_attempt_at'] = time.time()
+    queue._write('pending', record)
+    queue.flush()
+    status = queue.status(delivery_id)
+    assert status['status'] == 'failed' and status['attempts'] == 2
+    assert spooled(queue, 'pending') == [] and spooled(queue, 'failed') == [f'{delivery_id}.json']
+
+
+def test_stale_claims_are_requeued(tmp_path):
+    queue = make_queue(tmp_path, closed_port(), stale_after=60)
+    delivery_id = queue.enqueue('a@example.com', 'Subject', 'Body')
+    claimed = queue._claim_due()
+    assert [record['id'] for record in claimed] == [delivery_id]
+    assert queue.status(delivery_id)['status'] == 'sending'
+
+    queue._recover_stale()
+    assert queue.status(delivery_id)['status'] == 'sending'  # still fresh
+    path = queue._path('sending', delivery_id)
+    os.utime(path, (time.time() - 120, time.time() - 120))
+    queue._recover_stale()
+    assert queue.status(delivery_id)['status'] == 'queued'
+
+
+def test_unknown_and_malformed_ids(tmp_path):
+    queue = make_queue(tmp_path, closed_port())
+    assert queue.status('0' * 32) is None
+    assert queue.status('../../etc/passwd') is None
+
+
+def test_fan_out_hides_recipients(tmp_path):
+    queue = make_queue(tmp_path, closed_port())
+    message = queue._build_message({'recipients': ['a@example.com', 'b@example.com'], 'subject': 'S', 'body': 'B'})
+    assert 'To: undisclosed-recipients:;' in message and 'b@example.com' not in message
@@ -0,0 +1,102 @@
+import threading
+
+import pytest
+
+import metrics
+
+
+def test_counter_renders_labelled_series():
+    registry = metrics.Registry()
+    counter = registry.counter('calls_total', 'Calls', ('model', 'status'))
+    counter.inc('gpt2', '200')
+    counter.inc('gpt2', '200', amount=2)
+    counter.inc('gpt2', '503')
+    assert counter.value('gpt2', '200') == 3
+    lines = registry.render().splitlines()
+    assert lines[:2] == ['# HELP calls_total Calls', '# TYPE calls_total counter']
+    assert 'calls_total{model="gpt2",status="200"} 3' in lines
+    assert 'calls_total{model="gpt2",status="503"} 1' in lines
+
+
+def test_label_values_are_escaped():
+    counter = metrics.Counter('c', 'doc', ('topic',))
+    counter.inc('say "hi"\nback\\slash')
+    assert list(counter.render())[-1] == 'c{topic="say \\"hi\\"\\nback\\\\slash"} 1'
+
+
+def test_counter_is_thread_safe():
+    counter = metrics.Counter('c', 'doc')
+
+    def work():
+        for _ in range(1000):
+            counter.inc()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.value() == 8000
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram('h', 'doc', ('stage',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, 'render')
+    lines = list(histogram.render())
+    assert 'h_bucket{stage="render",le="0.1"} 1' in lines
+    assert 'h_bucket{stage="render",le="1.0"} 2' in lines
+    assert 'h_bucket{stage="render",le="+Inf"} 3' in lines
+    assert 'h_count{stage="render"} 3' in lines
+    assert 'h_sum{stage="render"} 5.55' in lines
+
+
+def test_gauge_reads_at_scrape_time_and_skips_failures(capsys):
+    value = {'n': 1}
+    gauge = metrics.Gauge('g', 'doc', lambda: value['n'])
+    value['n'] = 7
+    assert list(gauge.render())[-1] == 'g 7'
+    broken = metrics.Gauge('broken', 'doc', lambda: 1 / 0)
+    assert list(broken.render()) == []
+    assert 'Error reading gauge broken' in capsys.readouterr().out
+
+
+def test_stage_records_into_the_active_trace_only():
+    with metrics.stage('outside'):
+        pass
+    metrics.start_trace()
+    with metrics.stage('generate'):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.stage('parse'):
+            raise ValueError
+    stages = metrics.finish_trace()
+    assert [name for name, _ in stages] == ['generate', 'parse']
+    assert metrics.finish_trace() == []
+
+
+def test_server_timing_format():
+    assert metrics.server_timing([('cache', 0.0012), ('generate', 1.5)]) == 'cache;dur=1.2, generate;dur=1500.0'
+
+
+def test_startup_timer_phases():
+    timer = metrics.StartupTimer(started=0.0)
+    timer._last = 0.0
+    timer.mark('imports')
+    timer.mark('routes')
+    assert [phase for phase, _ in timer.phases] == ['imports', 'routes']
+    assert timer.total == pytest.approx(sum(seconds for _, seconds in timer.phases))
+    assert timer.summary().startswith(f"{timer.total * 1000:.0f}ms (imports ")
+
+
+def test_metrics_endpoint_and_server_timing_header():
+    app = pytest.importorskip('app')
+    client = app.app.test_client()
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert '# TYPE ai_agent_request_seconds histogram' in response.get_data(as_text=True)
+
+    traced = client.get('/health', headers={'X-Trace-Stages': '1'})
+    assert 'Server-Timing' in traced.headers
+    assert 'Server-Timing' not in client.get('/health').headers
@@ -0,0 +1,79 @@
+import pytest
+
+from benchmarks.mock_upstreams import sample_response
+from cache import GenerationCache, LRUCache, SQLiteCache
+from content import ContentResult
+from pipeline import SCRIPT_PROMPT_TEMPLATE, StagedPipeline
+from sections import parse_sections
+
+MODELS = {'text_generation': 'gpt2', 'summarization': 'facebook/bart-large-cnn'}
+SCRIPT = parse_sections(sample_response('Squid'))['script']
+
+
+class StubBackend:
+    def __init__(self, summary='Squid have three hearts and blue blood in their bodies.', fail=()):
+        self.summary = summary
+        self.fail = fail
+        self.calls = []
+
+    def generate_text(self, model, prompt, parameters):
+        self.calls.append('script')
+        return f"{prompt}\n{SCRIPT}\n"
+
+    def summarize(self, model, text, parameters=None):
+        name = 'video_name' if parameters['max_length'] < 50 else 'description'
+        self.calls.append(name)
+        if name in self.fail:
+            raise RuntimeError(f"{name} failed")
+        return self.summary
+
+
+def fallback(topic):
+    return {'script': 'fallback script', 'video_name': f'Facts About {topic}', 'description': 'fallback description',
+            'meta_tags': '#fallback', 'image_prompts': ['fallback prompt']}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return GenerationCache(LRUCache(), SQLiteCache(str(tmp_path / 'cache.db')))
+
+
+def make_pipeline(backend, cache):
+    return StagedPipeline(backend, cache, MODELS, {'max_length': 1000}, script_prompt=SCRIPT_PROMPT_TEMPLATE,
+                          fallback=fallback)
+
+
+def test_complete_run(cache):
+    content, complete = make_pipeline(StubBackend(), cache).run('Squid')
+    assert complete and not content.is_fallback
+    assert content.script == SCRIPT
+    assert content.video_name == 'Squid have three hearts and blue blood in their bodies'
+    assert content.description.endswith('Follow for more amazing facts! 🔔')
+    assert content.meta_tags.startswith('#shorts #squid #squidfacts')
+    assert len(content.image_prompts) == 7
+
+
+def test_failed_stage_is_filled_from_fallback_and_flagged(cache):
+    content, complete = make_pipeline(StubBackend(fail=('description',)), cache).run('Squid')
+    assert not complete
+    assert content.is_fallback
+    assert content.description == 'fallback description'
+    assert content.script == SCRIPT
+
+
+def test_stages_are_served_from_the_shared_tier(cache, tmp_path):
+    make_pipeline(StubBackend(), cache).run('Squid')
+    # A fresh worker: empty memory tier, same shared tier
+    fresh = GenerationCache(LRUCache(), SQLiteCache(str(tmp_path / 'cache.db')))
+    backend = StubBackend()
+    content, complete = make_pipeline(backend, fresh).run('Squid')
+    assert complete and backend.calls == []
+    assert content.script == SCRIPT and len(content.image_prompts) == 7
+    assert isinstance(content, ContentResult)
+
+
+def test_only_the_failed_stage_reruns(cache):
+    make_pipeline(StubBackend(fail=('video_name',)), cache).run('Squid')
+    backend = StubBackend()
+    _, complete = make_pipeline(backend, cache).run('Squid')
+    assert complete and backend.calls == ['video_name']
@@ -0,0 +1,139 @@
+import datetime
+import json
+
+import pytest
+
+import prewarm
+from prewarm import Prewarmer, in_window, load_topic_feed, parse_window
+
+
+def at(hour, minute=0):
+    return datetime.datetime(2024, 1, 1, hour, minute)
+
+
+@pytest.mark.parametrize('text', [
+    'Squid\n\nOctopus\n',
+    '{"topic": "Squid"}\n"Octopus"\n',
+    '["Squid", "Octopus"]',
+])
+def test_feed_formats(tmp_path, text):
+    feed = tmp_path / 'topics'
+    feed.write_text(text, encoding='utf-8')
+    assert load_topic_feed(str(feed)) == ['Squid', 'Octopus']
+
+
+def test_window_wraps_past_midnight():
+    window = parse_window('22:30-02:00')
+    assert window == (22 * 60 + 30, 120)
+    assert in_window(window, at(23))
+    assert in_window(window, at(1, 59))
+    assert not in_window(window, at(2))
+    assert not in_window(window, at(22, 29))
+    assert in_window(parse_window('09:00-17:00'), at(9))
+    assert not in_window(parse_window('09:00-17:00'), at(17))
+    assert in_window(None)
+
+
+class FakeCache:
+    def __init__(self, cached=(), fail=()):
+        self.cached = set(cached)
+        self.fail = set(fail)
+        self.calls = []
+
+    def generate(self, topic):
+        self.calls.append(topic)
+        if topic not in self.fail:
+            self.cached.add(topic)
+
+    def is_cached(self, topic):
+        return topic in self.cached
+
+
+def make_prewarmer(tmp_path, topics, cache, **kwargs):
+    feed = tmp_path / 'topics.txt'
+    feed.write_text('\n'.join(topics), encoding='utf-8')
+    kwargs.setdefault('rate', 0)
+    return Prewarmer(str(feed), cache.generate, cache.is_cached, **kwargs)
+
+
+def test_run_once_skips_cached_and_counts_fallbacks_as_failed(tmp_path):
+    cache = FakeCache(cached={'Squid'}, fail={'Comets'})
+    prewarmer = make_prewarmer(tmp_path, ['Squid', 'squid ', 'Octopus', 'Comets'], cache)
+    summary = prewarmer.run_once()
+    assert summary == {'topics': 3, 'generated': 1, 'skipped': 1, 'failed': 1}
+    assert cache.calls == ['Octopus', 'Comets']
+    stats = prewarmer.stats()
+    assert (stats['runs'], stats['generated'], stats['skipped'], stats['failed']) == (1, 1, 1, 1)
+
+
+def test_warms_the_model_before_the_feed(tmp_path):
+    events = []
+    cache = FakeCache()
+    prewarmer = make_prewarmer(tmp_path, ['Squid'], cache, warm=lambda: events.append('warm'))
+    prewarmer.generate = lambda topic: (events.append(topic), cache.generate(topic))
+    prewarmer.run_once()
+    assert events == ['warm', 'Squid']
+    assert prewarmer.warmups == 1
+
+
+def test_failed_warmup_is_recorded_not_raised(tmp_path):
+    def warm():
+        raise RuntimeError('model still loading')
+
+    prewarmer = make_prewarmer(tmp_path, ['Squid'], FakeCache(), warm=warm)
+    assert prewarmer.run_once()['generated'] == 1
+    assert prewarmer.last_error == 'model still loading' and prewarmer.warmups == 0
+
+
+def test_closed_window_stops_the_run(tmp_path, monkeypatch):
+    cache = FakeCache()
+    prewarmer = make_prewarmer(tmp_path, ['Squid', 'Octopus'], cache, window='01:00-02:00')
+    monkeypatch.setattr(prewarm, 'in_window', lambda window, now=None: False)
+    assert prewarmer.run_once()['generated'] == 0
+    assert prewarmer.run_once(ignore_window=True)['generated'] == 2
+    prewarmer._last_run = None
+    prewarmer.tick()
+    assert prewarmer.runs == 2
+
+
+def test_tick_respects_the_feed_interval(tmp_path):
+    prewarmer = make_prewarmer(tmp_path, ['Squid'], FakeCache(), feed_interval=3600)
+    prewarmer.tick()
+    prewarmer.tick()
+    assert prewarmer.runs == 1
+
+
+def test_calls_are_spaced_by_rate(tmp_path, monkeypatch):
+    waits = []
+    prewarmer = make_prewarmer(tmp_path, ['Squid', 'Octopus', 'Comets'], FakeCache(), rate=60)
+    monkeypatch.setattr(prewarmer._stopping, 'wait', lambda seconds: waits.append(seconds))
+    prewarmer.run_once()
+    assert len(waits) == 2
+    assert all(0.9 < wait <= 1.0 for wait in waits)
+
+
+@pytest.mark.skipif(prewarm.fcntl is None, reason='no flock on this platform')
+def test_only_one_worker_holds_the_lock(tmp_path):
+    lock_path = str(tmp_path / 'locks' / 'prewarm.lock')
+    first = make_prewarmer(tmp_path, [], FakeCache(), lock_path=lock_path)
+    second = make_prewarmer(tmp_path, [], FakeCache(), lock_path=lock_path)
+    assert first._holds_lock()
+    assert not second._holds_lock()
+    assert first.stats()['active'] and not second.stats()['active']
+    first._lock_file.close()
+    assert second._holds_lock()
+
+
+def test_cli_runs_the_feed_now(tmp_path, monkeypatch, capsys):
+    app = pytest.importorskip('app')
+    cache = FakeCache(fail={'Comets'})
+    feed = tmp_path / 'topics.txt'
+    feed.write_text('Squid\nComets\n', encoding='utf-8')
+
+    def build_prewarmer(source, rate=None, ttl=None, warm=True):
+        assert warm is False
+        return Prewarmer(source, cache.generate, cache.is_cached, rate=0, window='00:00-00:01')
+
+    monkeypatch.setattr(app, 'build_prewarmer', build_prewarmer)
+    assert prewarm.main([str(feed), '--no-warm']) == 1
+    assert json.loads(capsys.readouterr().out) == {'topics': 2, 'generated': 1, 'skipped': 0, 'failed': 1}
@@ -0,0 +1,155 @@
+import pytest
+
+from prompts import PromptRegistry, PromptTemplate, TokenCounter, continuation, estimate_tokens
+from sections import HEADER_RE, SEPARATOR_RE
+
+TEMPLATE = """You are a creative writer for short science videos.
+Write in a friendly, energetic tone for a general audience.
+
+Create content for a YouTube Short titled "5 Interesting and Unknown Facts About {topic}":
+
+---
+🧠 **1. Video Script (2-3 minutes max):**
+    - Hook the viewer in the first 10 seconds
+    - Five facts about {topic}, one short paragraph each
+---
+🖼️ **2. AI Image Generation Prompts:**
+    - 7 prompts, vertical 9:16, one per line
+---
+🎬 **3. YouTube Shorts Title:**
+    - At most 80 characters
+---
+📄 **4. Video Description (SEO Optimized):**
+    - 2-4 lines mentioning {topic}
+---
+🏷️ **5. Meta Tags / Hashtags:**
+    - 10-15 tags
+---
+Notes: never use markdown tables.
+Double-check every fact before writing it.
+"""
+
+
+@pytest.fixture
+def counter():
+    return TokenCounter('gpt2', use_tokenizer=False)
+
+
+def required_lines(text):
+    return [line for line in text.splitlines() if SEPARATOR_RE.fullmatch(line) or HEADER_RE.match(line)]
+
+
+def test_no_budget_sends_the_template_unchanged(counter):
+    prompt = PromptTemplate(TEMPLATE, counter).build('Squid')
+    assert prompt.text == TEMPLATE.format(topic='Squid')
+    assert prompt.trimmed == 0
+    assert prompt.tokens == pytest.approx(estimate_tokens(prompt.text), abs=2)
+
+
+def test_no_budget_never_tokenizes_the_whole_prompt(counter, monkeypatch):
+    template = PromptTemplate(TEMPLATE, counter)
+    counted = []
+    monkeypatch.setattr(counter, 'count', lambda text: counted.append(text) or estimate_tokens(text))
+    first = template.build('Squid')
+    template.build('Squid')
+    template.build('Squid')
+    # Topics go through the memoized count_line; the prompt itself is never counted
+    assert counted == []
+    assert template.build('Octopus').tokens - first.tokens == (
+        counter.count_line(' Octopus') - counter.count_line(' Squid')) * 3
+
+
+def test_usage_is_only_logged_when_asked(counter, capsys):
+    prompt = PromptTemplate(TEMPLATE, counter).build('Squid')
+    assert PromptRegistry(counter).record(prompt, 'Three hearts.', 'Squid') == estimate_tokens('Three hearts.')
+    assert capsys.readouterr().out == ''
+    PromptRegistry(counter, log_usage=True).record(prompt, 'Three hearts.', 'Squid')
+    assert capsys.readouterr().out.startswith('Tokens for Squid: prompt ')
+
+
+def test_a_template_that_fits_is_sent_as_written(counter):
+    prompt = PromptTemplate(TEMPLATE, counter, budget=10_000).build('Squid')
+    assert prompt.text == TEMPLATE.format(topic='Squid') and prompt.trimmed == 0
+
+
+def test_compacting_comes_before_trimming(counter):
+    compact_tokens = PromptTemplate(TEMPLATE, counter, budget=1).build('Squid').tokens
+    full_tokens = estimate_tokens(TEMPLATE.format(topic='Squid'))
+    template = PromptTemplate(TEMPLATE, counter, budget=(full_tokens - 1))
+    prompt = template.build('Squid')
+    assert prompt.tokens <= template.budget
+    assert '**' not in prompt.text and '    ' not in prompt.text
+    assert compact_tokens < prompt.tokens
+
+
+@pytest.mark.parametrize('budget', [150, 120, 100])
+def test_trimming_fits_the_budget_and_keeps_the_structure(counter, budget):
+    template = PromptTemplate(TEMPLATE, counter, budget=budget)
+    prompt = template.build('Squid')
+    assert prompt.trimmed > 0
+    assert prompt.tokens <= budget
+    assert prompt.tokens == estimate_tokens(prompt.text)
+    lines = prompt.text.splitlines()
+    assert len(required_lines(prompt.text)) == len(required_lines(TEMPLATE))
+    assert 'Create content for a YouTube Short titled "5 Interesting and Unknown Facts About Squid":' in lines
+
+
+def test_least_important_lines_go_first(counter):
+    full = PromptTemplate(TEMPLATE, counter, budget=10_000)
+    compact_cost = sum(full._costs) + full.counter.count_line(' Squid') * sum(full._topics)
+    prompt = PromptTemplate(TEMPLATE, counter, budget=compact_cost - 1).build('Squid')
+    # Trailing notes go before any section instructions or the preamble
+    assert prompt.trimmed == 1
+    assert 'Double-check every fact before writing it.' not in prompt.text
+    assert 'Notes: never use markdown tables.' in prompt.text
+
+    # Then section instructions, from the last section to the first
+    prompt = PromptTemplate(TEMPLATE, counter, budget=150).build('Squid')
+    assert '- 10-15 tags' not in prompt.text and '- At most 80 characters' not in prompt.text
+    assert '- Hook the viewer in the first 10 seconds' in prompt.text
+    prompt = PromptTemplate(TEMPLATE, counter, budget=130).build('Squid')
+    assert '- Hook the viewer in the first 10 seconds' in prompt.text
+    assert '- Five facts about Squid, one short paragraph each' not in prompt.text
+
+    # The preamble goes last, from its end
+    prompt = PromptTemplate(TEMPLATE, counter, budget=110).build('Squid')
+    assert '- Hook' not in prompt.text
+    assert prompt.text.startswith('You are a creative writer for short science videos.\nCreate content')
+
+
+def test_an_impossible_budget_keeps_only_required_lines(counter):
+    prompt = PromptTemplate(TEMPLATE, counter, budget=1).build('Squid')
+    assert prompt.tokens > 1
+    assert len(prompt.text.splitlines()) == len(required_lines(TEMPLATE)) + 1
+
+
+def test_longer_topics_trim_more(counter):
+    template = PromptTemplate(TEMPLATE, counter, budget=140)
+    short = template.build('Squid')
+    long = template.build('The Bioluminescent Deep Sea Creatures Of The Mariana Trench')
+    assert long.tokens <= 140 or long.trimmed == len(template._drop_order)
+    assert long.trimmed >= short.trimmed
+
+
+def test_fingerprint_changes_with_text_and_budget(counter):
+    assert PromptTemplate(TEMPLATE, counter).fingerprint == PromptTemplate(TEMPLATE, counter).fingerprint
+    assert PromptTemplate(TEMPLATE, counter).fingerprint != PromptTemplate(TEMPLATE, counter, 100).fingerprint
+    assert PromptTemplate(TEMPLATE, counter).fingerprint != PromptTemplate(TEMPLATE + '.', counter).fingerprint
+
+
+def test_registry_compiles_each_template_once(counter):
+    registry = PromptRegistry(counter, budget=120, log_usage=False)
+    assert registry.get(TEMPLATE) is registry.get(TEMPLATE)
+    assert registry.build(TEMPLATE, 'Squid').tokens <= 120
+    assert registry.fingerprint(TEMPLATE) == registry.get(TEMPLATE).fingerprint
+
+
+def test_continuation_strips_the_echoed_prompt(counter):
+    prompt = PromptTemplate(TEMPLATE, counter).build('Squid')
+    assert continuation(prompt, prompt.text + '\n\nScript...') == '\n\nScript...'
+    assert continuation(prompt, 'Script only') == 'Script only'
+
+
+def test_estimate_counts_symbols_as_more_tokens():
+    assert estimate_tokens('hello world') == 2
+    assert estimate_tokens('🧠') >= 2
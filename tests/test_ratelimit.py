@@ -0,0 +1,178 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ratelimit import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_PREWARM,
+    AdaptiveRateLimiter,
+    RateLimitedError,
+    current_request,
+    request_priority,
+)
+
+
+def queue_callers(limiter, priorities):
+    """Start one waiting caller per priority, in order; returns (threads, grant order)"""
+    granted = []
+    threads = []
+
+    def call(priority):
+        with request_priority(priority):
+            limiter.acquire()
+        granted.append(priority)
+
+    for priority in priorities:
+        thread = threading.Thread(target=call, args=(priority,))
+        thread.start()
+        threads.append(thread)
+        # Wait until it is queued, so arrival order is fixed
+        while limiter.stats()['waiting'] < len(threads):
+            time.sleep(0.001)
+    return threads, granted
+
+
+def test_request_priority_is_scoped():
+    assert current_request() == (PRIORITY_INTERACTIVE, None)
+    with request_priority(PRIORITY_BATCH, budget=5):
+        priority, deadline = current_request()
+        assert priority == PRIORITY_BATCH
+        assert deadline == pytest.approx(time.monotonic() + 5, abs=0.1)
+    assert current_request() == (PRIORITY_INTERACTIVE, None)
+
+
+def test_burst_is_granted_immediately():
+    limiter = AdaptiveRateLimiter(rate=1, burst=3)
+    started = time.monotonic()
+    for _ in range(3):
+        limiter.acquire()
+    assert time.monotonic() - started < 0.05
+
+
+def test_waiters_are_granted_by_priority_then_arrival():
+    limiter = AdaptiveRateLimiter(rate=100, burst=1)
+    limiter.on_throttled(retry_after=0.2)
+    order = [PRIORITY_PREWARM, PRIORITY_BATCH, PRIORITY_INTERACTIVE, PRIORITY_BATCH, PRIORITY_INTERACTIVE]
+    threads, granted = queue_callers(limiter, order)
+    for thread in threads:
+        thread.join(5)
+    assert granted == sorted(order)
+
+
+def test_request_over_its_budget_is_rejected_without_waiting():
+    limiter = AdaptiveRateLimiter(rate=1, burst=1)
+    limiter.acquire()
+    started = time.monotonic()
+    with request_priority(PRIORITY_INTERACTIVE, budget=0.2):
+        with pytest.raises(RateLimitedError, match='latency budget'):
+            limiter.acquire()
+    assert time.monotonic() - started < 0.1
+    stats = limiter.stats()
+    assert stats['rejected'] == 1 and stats['waiting'] == 0
+
+
+def test_retry_after_turns_queued_requests_away():
+    limiter = AdaptiveRateLimiter(rate=10, burst=1)
+    limiter.acquire()
+    errors = []
+
+    def call():
+        with request_priority(PRIORITY_INTERACTIVE, budget=1.0):
+            try:
+                limiter.acquire()
+            except RateLimitedError as e:
+                errors.append(e)
+
+    thread = threading.Thread(target=call)
+    thread.start()
+    while limiter.stats()['waiting'] < 1:
+        time.sleep(0.001)
+    limiter.on_throttled(retry_after=30)
+    thread.join(2)
+    assert len(errors) == 1
+
+
+def test_full_queue_sheds_lower_priority_waiters():
+    limiter = AdaptiveRateLimiter(rate=100, burst=1, max_waiting=2)
+    limiter.on_throttled(retry_after=0.2)
+    errors = []
+
+    def prewarm():
+        with request_priority(PRIORITY_PREWARM):
+            try:
+                limiter.acquire()
+            except RateLimitedError as e:
+                errors.append(e)
+
+    threads = []
+    for _ in range(2):
+        threads.append(threading.Thread(target=prewarm))
+        threads[-1].start()
+        while limiter.stats()['waiting'] < len(threads):
+            time.sleep(0.001)
+
+    with request_priority(PRIORITY_INTERACTIVE):
+        limiter.acquire()
+    for thread in threads:
+        thread.join(5)
+    assert len(errors) == 1 and 'Shed' in str(errors[0])
+    assert limiter.stats()['shed'] == 1
+
+    # A full queue of equal or higher priority turns the newcomer away
+    limiter.on_throttled(retry_after=0.2)
+    threads, _ = queue_callers(limiter, [PRIORITY_INTERACTIVE, PRIORITY_INTERACTIVE])
+    with request_priority(PRIORITY_BATCH), pytest.raises(RateLimitedError, match='full'):
+        limiter.acquire()
+    for thread in threads:
+        thread.join(5)
+
+
+def test_ensure_budget():
+    limiter = AdaptiveRateLimiter()
+    limiter.ensure_budget(60)
+    with request_priority(PRIORITY_INTERACTIVE, budget=1.0):
+        limiter.ensure_budget(0.5)
+        with pytest.raises(RateLimitedError, match='backoff'):
+            limiter.ensure_budget(2.0)
+    assert limiter.stats()['rejected'] == 1
+
+
+def test_throttling_halves_the_rate_and_success_restores_it():
+    limiter = AdaptiveRateLimiter(rate=4, min_rate=1, increase=0.25, decrease=0.5)
+    limiter.on_throttled()
+    assert limiter.rate == 2
+    limiter.on_throttled()
+    limiter.on_throttled()
+    assert limiter.rate == 1
+    for _ in range(2):
+        limiter.on_success()
+    assert limiter.rate == 3
+    for _ in range(5):
+        limiter.on_success()
+    assert limiter.rate == 4
+    assert limiter.stats()['throttled'] == 3
+
+
+def test_retry_after_pauses_grants():
+    limiter = AdaptiveRateLimiter(rate=100, burst=5)
+    limiter.on_throttled(retry_after=0.15)
+    assert limiter.stats()['paused_for'] > 0
+    started = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - started >= 0.14
+
+
+def test_async_acquire_honours_the_budget():
+    limiter = AdaptiveRateLimiter(rate=1, burst=1)
+
+    async def scenario():
+        await limiter.acquire_async()
+        with request_priority(PRIORITY_INTERACTIVE, budget=0.2):
+            with pytest.raises(RateLimitedError):
+                await limiter.acquire_async()
+
+    asyncio.run(scenario())
+    assert limiter.stats()['waiting'] == 0
@@ -0,0 +1,165 @@
+import json
+import os
+import time
+
+import pytest
+
+import recipients
+from recipients import DigestSpool, Recipient, RecipientRegistry, group_items, render_digest
+
+
+def test_filters_match_substrings_and_whole_topic_globs():
+    recipient = Recipient('space@example.com', ['Space', 'black hole*'])
+    assert recipient.wants('deep space probes')
+    assert recipient.wants('black holes')
+    assert not recipient.wants('squid')
+    assert Recipient('all@example.com').wants('anything at all')
+
+
+def test_glob_filters_are_anchored():
+    recipient = Recipient('space@example.com', ['black hole*'])
+    assert recipient.wants('black holes')
+    assert not recipient.wants('the black hole of debt')
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        Recipient('a@example.com', mode='weekly')
+
+
+def write_subscribers(path, entries):
+    path.write_text(json.dumps(entries), encoding='utf-8')
+
+
+def test_registry_reloads_when_the_file_changes(tmp_path):
+    path = tmp_path / 'recipients.json'
+    write_subscribers(path, [{'email': 'a@example.com'}])
+    registry = RecipientRegistry(path=str(path), check_interval=0)
+    assert [r.email for r in registry.recipients()] == ['a@example.com']
+
+    write_subscribers(path, [{'email': 'a@example.com'}, {'email': 'b@example.com', 'mode': 'digest'}])
+    os.utime(path, (time.time() + 5, time.time() + 5))
+    assert len(registry) == 2
+    assert registry.stats() == {'recipients': 2, 'digest': 1, 'source': str(path)}
+
+
+def test_registry_keeps_the_last_good_list(tmp_path, capsys):
+    path = tmp_path / 'recipients.json'
+    write_subscribers(path, [{'email': 'a@example.com'}])
+    registry = RecipientRegistry(path=str(path), check_interval=0)
+    path.write_text('[{"email": ', encoding='utf-8')
+    os.utime(path, (time.time() + 5, time.time() + 5))
+    assert [r.email for r in registry.recipients()] == ['a@example.com']
+    assert 'Error loading recipients' in capsys.readouterr().out
+
+
+def test_match_by_topic_and_mode():
+    registry = RecipientRegistry([
+        Recipient('all@example.com'),
+        Recipient('space@example.com', ['space']),
+        Recipient('digest@example.com', mode='digest'),
+    ])
+    assert [r.email for r in registry.match('Space Probes')] == ['all@example.com', 'space@example.com',
+                                                                 'digest@example.com']
+    assert [r.email for r in registry.match('Squid', mode='immediate')] == ['all@example.com']
+    assert [r.email for r in registry.match('Squid', mode='digest')] == ['digest@example.com']
+
+
+def test_from_config_falls_back_to_the_email_list():
+    registry = RecipientRegistry.from_config(emails='a@example.com, b@example.com,')
+    assert [r.email for r in registry.recipients()] == ['a@example.com', 'b@example.com']
+    assert registry.stats()['source'] == 'RECIPIENT_EMAIL'
+
+
+def test_group_items_shares_messages_between_identical_subscriptions():
+    items = [{'topic': 'Squid', 'to': ['a', 'b']}, {'topic': 'Comets', 'to': ['a', 'b', 'c']}]
+    groups = group_items(items, lambda item: item['to'])
+    assert sorted((tuple(item['topic'] for item in group), tuple(emails)) for group, emails in groups) == [
+        (('Comets',), ('c',)),
+        (('Squid', 'Comets'), ('a', 'b')),
+    ]
+
+
+def test_render_digest_lists_the_topics():
+    body = render_digest([{'topic': 'Squid', 'body': 'one'}, {'topic': 'Comets', 'body': 'two'}])
+    assert 'Batch of 2 topics: Squid, Comets' in body
+    assert body.index('one') < body.index('two')
+
+
+class FakeQueue:
+    def __init__(self):
+        self.sent = []
+
+    def enqueue(self, recipients, subject, body):
+        self.sent.append((sorted(recipients), subject, body))
+        return f"delivery-{len(self.sent)}"
+
+
+def test_digest_groups_items_and_empties_the_spool(tmp_path):
+    queue = FakeQueue()
+    spool = DigestSpool(str(tmp_path), queue)
+    spool.add('Squid', 'squid body', ['a@example.com', 'b@example.com'])
+    spool.add('Comets', 'comet body', ['a@example.com'])
+    assert spool.pending_count() == 2
+
+    assert spool.flush() == ['delivery-1', 'delivery-2']
+    by_recipients = {tuple(to): (subject, body) for to, subject, body in queue.sent}
+    subject, body = by_recipients[('a@example.com',)]
+    assert subject.endswith(': 2 topics') and body.index('squid body') < body.index('comet body')
+    assert 'comet body' not in by_recipients[('b@example.com',)][1]
+    assert spool.pending_count() == 0
+    assert spool.stats()['digests'] == 1 and spool.stats()['messages'] == 2
+    assert spool.flush() == []
+
+
+def test_items_are_synced_before_they_appear(tmp_path, monkeypatch):
+    spool = DigestSpool(str(tmp_path), FakeQueue())
+    items_dir = tmp_path / 'items'
+    synced = []
+
+    def fsync(fd):
+        # Still only the temporary file at this point
+        synced.append(sorted(name.endswith('.tmp') for name in os.listdir(items_dir)))
+
+    monkeypatch.setattr(recipients.os, 'fsync', fsync)
+    spool.add('Squid', 'body', ['a@example.com'])
+    assert synced == [[True]]
+    assert [name.endswith('.json') for name in os.listdir(items_dir)] == [True]
+
+
+def test_unreadable_items_are_quarantined(tmp_path, capsys):
+    queue = FakeQueue()
+    spool = DigestSpool(str(tmp_path), queue)
+    spool.add('Squid', 'squid body', ['a@example.com'])
+    (tmp_path / 'items' / '0-broken.json').write_text('{"topic": ', encoding='utf-8')
+    (tmp_path / 'items' / '1-wrong.json').write_text('{"topic": 1, "body": "x", "recipients": []}',
+                                                     encoding='utf-8')
+    assert len(spool.flush()) == 1
+    assert spool.quarantined_count() == 2 and spool.pending_count() == 0
+    assert 'moving it to' in capsys.readouterr().out
+
+
+def test_digest_is_due_after_the_interval(tmp_path):
+    spool = DigestSpool(str(tmp_path), FakeQueue(), interval=60)
+    # The first check starts the clock
+    assert not spool.due()
+    assert not spool.due()
+    marker = os.path.join(str(tmp_path), 'last_sent')
+    os.utime(marker, (time.time() - 61, time.time() - 61))
+    assert spool.due()
+    spool.add('Squid', 'body', ['a@example.com'])
+    assert len(spool.flush(if_due=True)) == 1
+    assert not spool.due()
+    spool.add('Comets', 'body', ['a@example.com'])
+    assert spool.flush(if_due=True) == []
+
+
+@pytest.mark.skipif(recipients.fcntl is None, reason='no flock on this platform')
+def test_only_one_worker_sends_a_digest(tmp_path):
+    queue = FakeQueue()
+    spool = DigestSpool(str(tmp_path), queue)
+    spool.add('Squid', 'body', ['a@example.com'])
+    with open(os.path.join(str(tmp_path), 'digest.lock'), 'a') as held:
+        recipients.fcntl.flock(held, recipients.fcntl.LOCK_EX)
+        assert spool.flush() == []
+    assert len(spool.flush()) == 1
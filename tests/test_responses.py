@@ -0,0 +1,142 @@
+import gzip
+
+import pytest
+
+import responses
+from responses import (
+    StaticPage,
+    accepted_encodings,
+    choose_encoding,
+    encode_body,
+    etag_matches,
+    minify_html,
+)
+
+PAGE = """<!DOCTYPE html>
+<html>
+    <head>
+        <!-- page styles -->
+        <style>
+            /* layout */
+            body {
+                margin: 0;
+                color: #333;
+            }
+            .card > h1 , .card > h2 { font-weight: bold; }
+        </style>
+        <!--[if IE]><p>Old browser</p><![endif]-->
+    </head>
+    <body>
+
+        <h1>Facts</h1>
+        <script>
+            // submit the form
+            const url = 'https://example.com/generate'
+            let total = 1
+            total += 2
+        </script>
+    </body>
+</html>
+"""
+
+BODY = b'{"content": "' + b'squid facts ' * 200 + b'"}'
+
+
+def test_minify_collapses_css_and_drops_comments():
+    html = minify_html(PAGE)
+    assert '<style>body{margin:0;color:#333}.card>h1,.card>h2{font-weight:bold}</style>' in html
+    assert 'page styles' not in html and 'submit the form' not in html
+    assert '<!--[if IE]>' in html
+    assert '\n\n' not in html and '    ' not in html
+
+
+def test_minify_keeps_script_lines_apart():
+    html = minify_html(PAGE)
+    # No semicolons in the script, so the statements must stay on their own lines
+    assert "const url = 'https://example.com/generate'\nlet total = 1\ntotal += 2" in html
+
+
+def test_accept_encoding_parsing():
+    assert accepted_encodings('gzip, br;q=0.8, identity; q=0') == {'gzip': 1.0, 'br': 0.8, 'identity': 0.0}
+    assert accepted_encodings(None) == {}
+    assert accepted_encodings('gzip;q=abc') == {'gzip': 1.0}
+    assert accepted_encodings('gzip;q=1.2.3') == {'gzip': 0.0}
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, None),
+    ('', None),
+    ('identity', None),
+    ('gzip', 'gzip'),
+    ('gzip;q=0, deflate', None),
+    ('br;q=0.5, gzip', 'gzip'),
+    ('*;q=0.1, gzip;q=0', 'br'),
+])
+def test_negotiation(header, expected):
+    pytest.importorskip('brotli')
+    assert choose_encoding(header) == expected
+
+
+def test_negotiation_prefers_brotli_on_a_tie():
+    pytest.importorskip('brotli')
+    assert choose_encoding('gzip, deflate, br') == 'br'
+    assert choose_encoding('*') == 'br'
+
+
+def test_without_brotli_only_gzip_is_offered(monkeypatch):
+    monkeypatch.setattr(responses, 'brotli', None)
+    assert choose_encoding('br') is None
+    assert choose_encoding('br, gzip;q=0.5') == 'gzip'
+    page = StaticPage('<p>hello</p>')
+    assert set(page.variants) == {None, 'gzip'}
+
+
+def test_encode_body_round_trips():
+    body, encoding = encode_body(BODY, 'gzip')
+    assert encoding == 'gzip' and gzip.decompress(body) == BODY
+    # Stable bytes, so derived validators are stable too
+    assert encode_body(BODY, 'gzip')[0] == body
+
+
+def test_encode_body_brotli():
+    brotli = pytest.importorskip('brotli')
+    body, encoding = encode_body(BODY, 'br, gzip')
+    assert encoding == 'br' and brotli.decompress(body) == BODY
+    assert len(body) < len(BODY)
+
+
+def test_small_bodies_and_identity_stay_uncompressed():
+    assert encode_body(b'{}', 'gzip') == (b'{}', None)
+    assert encode_body(BODY, 'identity') == (BODY, None)
+
+
+def test_static_page_variants():
+    page = StaticPage(PAGE)
+    assert page.encoded(None) == (None, PAGE.encode('utf-8'))
+    encoding, body = page.encoded('gzip')
+    assert encoding == 'gzip' and gzip.decompress(body) == PAGE.encode('utf-8')
+
+
+@pytest.mark.parametrize('header, matches', [
+    (None, False),
+    ('*', True),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"xyz", W/"abc"', True),
+    ('"abcd"', False),
+])
+def test_etag_matching(header, matches):
+    assert etag_matches(header, 'abc') is matches
+
+
+def test_index_is_compressed_and_conditional():
+    app = pytest.importorskip('app')
+    client = app.app.test_client()
+    response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    html = gzip.decompress(response.get_data())
+    assert html == app.INDEX_PAGE.body
+
+    etag = response.headers['ETag']
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 304
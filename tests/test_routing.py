@@ -0,0 +1,101 @@
+import time
+
+import pytest
+
+from inference import UpstreamError
+from routing import Route, Router, parse_routes
+
+
+class StubBackend:
+    def __init__(self, delay=0.0, fail=False, chunks=('a', 'b', 'c')):
+        self.delay = delay
+        self.fail = fail
+        self.chunks = chunks
+        self.calls = 0
+        self.closed = 0
+
+    def generate_text(self, model, prompt, parameters):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise UpstreamError(f"{model} is down")
+        return f"{model}: {prompt}"
+
+    def stream_text(self, model, prompt, parameters):
+        self.calls += 1
+        try:
+            if self.fail:
+                raise UpstreamError(f"{model} is down")
+            yield from self.chunks
+        finally:
+            self.closed += 1
+
+
+def router(*routes, **kwargs):
+    kwargs.setdefault('explore', 0.0)
+    return Router(routes, **kwargs)
+
+
+def test_parse_routes():
+    made = []
+    routes = parse_routes('gpt2*3, distilgpt2@http://other/, local:tiny', lambda url: made.append(url) or url,
+                          lambda: 'local', 'http://default/')
+    assert [(r.name, r.model, r.weight) for r in routes] == [
+        ('gpt2', 'gpt2', 3.0), ('distilgpt2@http://other/', 'distilgpt2', 1.0), ('local:tiny', 'tiny', 1.0)]
+    assert made == ['http://default/', 'http://other/'] and routes[2].backend == 'local'
+    with pytest.raises(ValueError):
+        parse_routes('gpt2*x', str, str, '')
+
+
+def test_prefers_the_faster_route_and_fails_over():
+    slow, fast = Route('slow', StubBackend(), 'slow'), Route('fast', StubBackend(), 'fast')
+    for _ in range(5):
+        slow.record(2.0, True)
+        fast.record(0.5, True)
+    r = router(slow, fast, hedge=False)
+    assert r.generate_text('gpt2', 'hi', {}) == 'fast: hi'
+    fast.backend.fail = True
+    assert r.generate_text('gpt2', 'hi', {}) == 'slow: hi'
+    assert list(fast.outcomes)[-1] is False
+
+
+def test_stream_records_time_to_first_chunk_apart_from_generations():
+    route = Route('a', StubBackend(), 'a')
+    for _ in range(10):
+        route.record(3.0, True)
+    r = router(route)
+    assert ''.join(r.stream_text('gpt2', 'hi', {})) == 'abc'
+    assert len(route.ttfb) == 1 and route.ttfb[0] < 1.0
+    assert list(route.latencies) == [3.0] * 10
+    # Streams don't pull the hedge delay or the score down to TTFB scale
+    assert r.hedge_delay(route) == 3.0
+    assert route.score()[0] == 3.0
+
+
+def test_stream_closed_early_still_records_and_closes_upstream():
+    route = Route('a', StubBackend(), 'a')
+    r = router(route)
+    stream = r.stream_text('gpt2', 'hi', {})
+    assert next(stream) == 'a'
+    stream.close()
+    assert route.backend.closed == 1
+    assert route.inflight == 0
+    assert len(route.ttfb) == 1 and list(route.outcomes) == [True]
+
+
+def test_failed_stream_counts_as_an_error():
+    route = Route('a', StubBackend(fail=True), 'a')
+    with pytest.raises(UpstreamError):
+        list(router(route).stream_text('gpt2', 'hi', {}))
+    assert list(route.outcomes) == [False] and not route.ttfb
+
+
+def test_hedges_to_the_runner_up_when_the_primary_is_slow():
+    slow = Route('slow', StubBackend(delay=0.5), 'slow')
+    fast = Route('fast', StubBackend(), 'fast')
+    for _ in range(10):
+        slow.record(0.05, True)
+        fast.record(0.1, True)
+    r = router(slow, fast, hedge_max_ratio=1.0, hedge_min_samples=5)
+    assert r.generate_text('gpt2', 'hi', {}) == 'fast: hi'
+    assert (r.hedges, r.hedge_wins) == (1, 1)
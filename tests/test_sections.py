@@ -0,0 +1,105 @@
+import pytest
+
+from benchmarks.mock_upstreams import sample_response
+from sections import HEADER_RE, SECTION_NAMES, SectionStreamParser, parse_sections
+
+SAMPLE = sample_response('Squid')
+
+PROMPT_ECHO = """Create content for a YouTube Short about Squid. Use exactly this format:
+
+🧠 **1. Video Script (2-3 minutes max):**
+- Hook in the first 10 seconds
+
+🖼️ **2. AI Image Generation Prompts:**
+- 7 prompts, 9:16
+
+🎬 **3. YouTube Shorts Title:**
+- Max 80 characters
+
+📄 **4. Video Description (SEO Optimized):**
+- 2-4 lines
+
+🏷️ **5. Meta Tags / Hashtags:**
+- 10-15 tags
+
+"""
+
+
+@pytest.mark.parametrize('line, name', [
+    ('🧠 **1. Video Script (2-3 minutes max):**', 'script'),
+    ('**2. AI Image Generation Prompts:**', 'image_prompts'),
+    ('3. Title:', 'video_name'),
+    ('## Video Description', 'description'),
+    ('**Meta Tags:**', 'meta_tags'),
+    ('🏷️ Meta Tags / Hashtags:', 'meta_tags'),
+    ('5) Hashtags', 'meta_tags'),
+])
+def test_header_forms(line, name):
+    match = HEADER_RE.match(line)
+    assert match is not None and match.lastgroup == name
+
+
+@pytest.mark.parametrize('line', [
+    'Video script ideas: start with a hook',
+    'Meta tags help people find the video.',
+    '- Description of the first fact',
+    'Title: keep it short',
+    'Scripts are hard to write.',
+])
+def test_body_lines_are_not_headers(line):
+    assert HEADER_RE.match(line) is None
+
+
+@pytest.mark.parametrize('text', [
+    SAMPLE,
+    SAMPLE.replace('\n---\n', '\n'),
+    PROMPT_ECHO + SAMPLE,
+], ids=['separators', 'no_separators', 'prompt_echoed'])
+def test_parse_sections(text):
+    content = parse_sections(text)
+    assert content['script'].startswith('[HOOK - First 10 seconds]')
+    assert content['script'].rstrip().endswith('Thanks for watching!')
+    assert len(content['image_prompts']) == 7
+    assert content['image_prompts'][0].startswith('Epic cinematic 9:16')
+    assert content['video_name'] == '5 Unknown Facts About Squid That Will Shock You! 🤯'
+    assert content['description'].endswith('Follow for more amazing facts! 🔔')
+    assert content['meta_tags'].startswith('#shorts #Squidfacts')
+
+
+def test_header_like_body_lines_stay_in_the_section():
+    text = SAMPLE.replace(
+        '[FACT 2]\n',
+        '[FACT 2]\nVideo script writers love this one.\nMeta tags: none needed here.\n',
+    )
+    content = parse_sections(text)
+    assert 'Video script writers love this one.' in content['script']
+    assert 'Meta tags: none needed here.' in content['script']
+    assert content['meta_tags'].startswith('#shorts')
+
+
+def test_missing_section_is_left_empty():
+    text = SAMPLE.split('🎬 **3.', 1)[0]
+    content = parse_sections(text)
+    assert content['video_name'] == '' and content['description'] == '' and content['meta_tags'] == ''
+    assert content['script'] and len(content['image_prompts']) == 7
+
+
+@pytest.mark.parametrize('text', [SAMPLE, SAMPLE.replace('\n---\n', '\n'), PROMPT_ECHO + SAMPLE],
+                         ids=['separators', 'no_separators', 'prompt_echoed'])
+@pytest.mark.parametrize('size', [1, 7, 64])
+def test_stream_parser_matches_parse_sections(text, size):
+    parser = SectionStreamParser()
+    completed = []
+    for i in range(0, len(text), size):
+        completed += parser.feed(text[i:i + size])
+    completed += parser.close()
+    assert parser.content == parse_sections(text)
+    assert [name for name, _ in completed if name in SECTION_NAMES][-5:] == list(SECTION_NAMES)
+
+
+def test_stream_parser_completes_sections_at_separators():
+    parser = SectionStreamParser()
+    head, rest = SAMPLE.split('\n---\n', 1)
+    assert parser.feed(head + '\n') == []
+    completed = parser.feed('---\n')
+    assert [name for name, _ in completed] == ['script']
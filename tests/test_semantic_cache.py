@@ -0,0 +1,70 @@
+import pytest
+
+pytest.importorskip('numpy')
+
+from semantic_cache import SemanticCache, canonical_topic, same_topic
+
+SAME = [
+    ('Black Hole', 'black holes'),
+    ('blackholes', 'Black Hole'),
+    ('volcanoes', 'Volcano'),
+    ('exploding volcanoes', 'volcano explodes'),
+    ('octopuses', 'octopus'),
+    ('butterflies', 'butterfly'),
+    ('Deep-sea creatures', 'deep sea creature'),
+]
+
+# Close enough in n-gram space to pass the threshold, but about something else
+NEAR_MISSES = [
+    ('interesting and unknown facts about the history and culture of ancient rome',
+     'interesting and unknown facts about the history and culture of ancient greece'),
+    ('interesting and unknown facts about the royal house of windsor',
+     'interesting and unknown facts about the royal house of tudor'),
+    ('World War 1', 'World War 2'),
+    ('the planets of the solar system', 'the moons of the solar system'),
+    ('history of the roman empire', 'history of the ottoman empire'),
+]
+
+
+def test_canonical_topic():
+    assert canonical_topic('Black  Holes!') == canonical_topic('blackhole') == 'blackhol'
+
+
+@pytest.mark.parametrize('a, b', SAME)
+def test_same_topic(a, b):
+    assert same_topic(a, b)
+
+
+@pytest.mark.parametrize('a, b', [pair for pair in SAME if pair[0] != 'exploding volcanoes'])
+def test_lookup_finds_variants(a, b):
+    cache = SemanticCache()
+    cache.add(a, 'key-a')
+    assert [key for _, key, _ in cache.lookup(b)] == ['key-a']
+
+
+@pytest.mark.parametrize('a, b', NEAR_MISSES)
+def test_near_misses_do_not_match(a, b):
+    cache = SemanticCache(threshold=0.5)
+    cache.add(a, 'key-a')
+    assert not same_topic(a, b)
+    assert cache.lookup(b) == []
+    assert cache.misses == 1
+
+
+def test_long_near_miss_scores_over_the_threshold():
+    # What the word check is for: similarity alone would serve Rome for Greece
+    a, b = NEAR_MISSES[0]
+    cache = SemanticCache()
+    score = float(cache.vectorizer(a) @ cache.vectorizer(b))
+    assert score >= cache.threshold
+
+
+def test_discard_and_eviction():
+    cache = SemanticCache(capacity=2)
+    cache.add('cats', 'k1')
+    cache.add('dogs', 'k2')
+    cache.add('owls', 'k3')
+    assert cache.lookup('cat') == [] and cache.evictions == 1
+    cache.discard('k2')
+    assert cache.lookup('dog') == []
+    assert [key for _, key, _ in cache.lookup('owl')] == ['k3']
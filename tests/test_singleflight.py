@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+from singleflight import CoalesceTimeout, SingleFlight
+
+
+def run_concurrently(count, target):
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def call(i):
+        barrier.wait()
+        try:
+            results[i] = target()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def slow_call(calls, result='content', delay=0.1, error=None):
+    def fn():
+        calls.append(1)
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return result
+    return fn
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    calls = []
+    fn = slow_call(calls)
+    results = run_concurrently(8, lambda: flight.do('key', fn))
+    assert results == ['content'] * 8
+    assert len(calls) == 1 and flight.coalesced == 7
+    assert flight.in_flight() == 0
+
+
+def test_different_keys_do_not_coalesce():
+    flight = SingleFlight()
+    calls = []
+    fn = slow_call(calls, delay=0.02)
+    keys = iter(range(4))
+    lock = threading.Lock()
+
+    def call():
+        with lock:
+            key = next(keys)
+        return flight.do(f'key-{key}', fn)
+
+    run_concurrently(4, call)
+    assert len(calls) == 4 and flight.coalesced == 0
+
+
+def test_leader_failure_reaches_every_waiter_and_the_next_call_retries():
+    flight = SingleFlight()
+    calls = []
+    error = RuntimeError('upstream down')
+    results = run_concurrently(4, lambda: flight.do('key', slow_call(calls, error=error)))
+    assert all(result is error for result in results)
+    assert len(calls) == 1
+    assert flight.do('key', lambda: 'recovered') == 'recovered'
+
+
+def test_follower_gives_up_after_its_timeout():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def leader():
+        started.set()
+        time.sleep(0.3)
+        return 'late'
+
+    thread = threading.Thread(target=flight.do, args=('key', leader))
+    thread.start()
+    started.wait()
+    began = time.monotonic()
+    with pytest.raises(CoalesceTimeout):
+        flight.do('key', lambda: 'unused', timeout=0.05)
+    assert time.monotonic() - began < 0.2
+    thread.join()
+    assert flight.in_flight() == 0
+
+
+def test_in_flight_and_record_coalesced():
+    flight = SingleFlight()
+    seen = []
+    flight.do('key', lambda: seen.append(flight.in_flight()))
+    assert seen == [1] and flight.in_flight() == 0
+    flight.record_coalesced()
+    assert flight.coalesced == 1
+
+
+def test_cross_worker_leader_rechecks_the_shared_result(tmp_path):
+    flight = SingleFlight(lock_dir=str(tmp_path))
+    if flight.lock_dir is None:
+        pytest.skip('no flock on this platform')
+    assert flight.do('key', lambda: 'fresh', recheck=lambda: 'from another worker') == 'from another worker'
+    assert flight.do('key', lambda: 'fresh', recheck=lambda: None) == 'fresh'
+
+
+def test_cross_worker_lock_serializes_leaders(tmp_path):
+    # Two instances stand in for two worker processes sharing the lock directory
+    first, second = SingleFlight(lock_dir=str(tmp_path)), SingleFlight(lock_dir=str(tmp_path))
+    if first.lock_dir is None:
+        pytest.skip('no flock on this platform')
+    stored = []
+    calls = []
+
+    def generate():
+        calls.append(1)
+        time.sleep(0.1)
+        stored.append('content')
+        return 'content'
+
+    def recheck():
+        return stored[0] if stored else None
+
+    flights = iter([first, second])
+    lock = threading.Lock()
+
+    def call():
+        with lock:
+            flight = next(flights)
+        return flight.do('key', generate, recheck=recheck)
+
+    assert run_concurrently(2, call) == ['content', 'content']
+    assert len(calls) == 1
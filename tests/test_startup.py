@@ -0,0 +1,100 @@
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import types
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+pytest.importorskip('flask')
+
+
+def run_python(code):
+    result = subprocess.run([sys.executable, '-c', code], cwd=REPO_ROOT, capture_output=True, text=True,
+                            timeout=60, env={**os.environ, 'PREWARM_FEED': '', 'JOB_WORKERS': '0'})
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def test_import_defers_heavy_modules_until_preload():
+    out = run_python(
+        "import json, sys\n"
+        "import app\n"
+        "before = [name for name in app.DEFERRED_IMPORTS if name in sys.modules]\n"
+        "app.preload()\n"
+        "after = [name for name in app.DEFERRED_IMPORTS if name in sys.modules]\n"
+        "print(json.dumps([before, after, app.inference_client._session is None]))\n"
+    )
+    before, after, no_session = json.loads(out.splitlines()[-1])
+    assert before == []
+    assert after == ['requests', 'smtplib', 'email.mime.multipart', 'email.mime.text']
+    assert no_session
+
+
+def test_create_app_logs_the_startup_breakdown(capsys):
+    app = pytest.importorskip('app')
+    assert app.create_app() is app.app
+    line = capsys.readouterr().out.strip().splitlines()[-1]
+    assert line.startswith('Startup: ')
+    for phase, _ in app.startup.phases:
+        assert phase in line
+
+
+class Recorder:
+    def __init__(self, calls, name):
+        self.calls = calls
+        self.name = name
+
+    def start(self):
+        self.calls.append(self.name)
+
+
+def test_background_threads_start_once_per_process(monkeypatch):
+    app = pytest.importorskip('app')
+    calls = []
+    monkeypatch.setattr(app, 'delivery_queue', Recorder(calls, 'delivery'))
+    monkeypatch.setattr(app, 'digest_spool', Recorder(calls, 'digest'))
+    monkeypatch.setattr(app, 'prewarmer', Recorder(calls, 'prewarm'))
+    monkeypatch.setattr(app, 'JOB_WORKERS', 0)
+    monkeypatch.setattr(app, '_background_pid', None)
+
+    app.start_background()
+    app.start_background()
+    assert calls == ['delivery', 'digest', 'prewarm']
+
+    # A forked worker has a new pid and starts its own
+    monkeypatch.setattr(app, '_background_pid', -1)
+    app.start_background(deliver=False)
+    assert calls == ['delivery', 'digest', 'prewarm', 'digest', 'prewarm']
+
+
+def load_gunicorn_conf():
+    spec = importlib.util.spec_from_file_location('gunicorn_conf', os.path.join(REPO_ROOT, 'gunicorn.conf.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def fake_server(worker_class, preload=True):
+    cfg = types.SimpleNamespace(worker_class_str=worker_class, preload_app=preload)
+    return types.SimpleNamespace(cfg=cfg)
+
+
+def test_gunicorn_hooks(monkeypatch):
+    app = pytest.importorskip('app')
+    conf = load_gunicorn_conf()
+    calls = []
+    monkeypatch.setattr(app, 'preload', lambda: calls.append('preload'))
+    monkeypatch.setattr(app, 'start_background', lambda: calls.append('background'))
+
+    conf.pre_fork(fake_server('sync'), None)
+    conf.pre_fork(fake_server('sync', preload=False), None)
+    assert calls == ['preload']
+
+    conf.post_fork(fake_server('sync'), None)
+    # uvicorn workers start theirs from the ASGI lifespan
+    conf.post_fork(fake_server('uvicorn.workers.UvicornWorker'), None)
+    assert calls == ['preload', 'background']
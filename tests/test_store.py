@@ -0,0 +1,93 @@
+import sqlite3
+
+import pytest
+
+from benchmarks.mock_upstreams import sample_response
+from content import ContentResult
+from sections import parse_sections
+from store import ContentStore
+
+CONTENT = parse_sections(sample_response('Squid'))
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ContentStore(str(tmp_path / 'store.db'), flush_interval=0.01, max_attempts=3)
+    # Write on the test's thread only
+    store.start = lambda: None
+    return store
+
+
+def test_pending_rows_are_readable_before_they_are_written(store):
+    content_id = store.record('Squid', CONTENT, 'gpt2', cache_key='k1')
+    assert store.get(content_id)['content'] == CONTENT
+    store.flush()
+    assert store.stats()['written'] == 1 and not store._pending
+    assert store.get(content_id)['content'] == CONTENT
+    assert store.find_reusable('k1', 60) == ContentResult.from_dict(CONTENT)
+
+
+def test_fallback_results_are_not_reused(store):
+    store.record('Squid', CONTENT, 'gpt2', is_fallback=True, cache_key='k1')
+    store.flush()
+    assert store.find_reusable('k1', 60) is None
+    assert store.cached_topics() == []
+
+
+def test_history_pages_and_searches(store):
+    ids = [store.record(f'Topic {i}', CONTENT, 'gpt2') for i in range(5)]
+    store.flush()
+    page = store.history(limit=3)
+    assert [item['id'] for item in page['items']] == ids[:1:-1]
+    rest = store.history(limit=3, before=page['next_before'])
+    assert [item['id'] for item in rest['items']] == ids[1::-1] and rest['next_before'] is None
+    assert len(store.history(query='squid')['items']) == 5
+    assert store.history(topic='topic 2')['items'][0]['id'] == ids[2]
+
+
+class FlakyConnection:
+    """Wraps a connection so its next `failures` inserts fail like a locked database"""
+
+    def __init__(self, conn, failures):
+        self.conn = conn
+        self.failures = failures
+
+    def executemany(self, sql, rows):
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError('database is locked')
+        return self.conn.executemany(sql, rows)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def __enter__(self):
+        return self.conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self.conn.__exit__(*exc)
+
+
+def test_failed_batch_is_requeued_and_written_later(store, monkeypatch):
+    connect = store._connect
+    flaky = FlakyConnection(connect(), failures=3)
+    monkeypatch.setattr(store, '_connect', lambda: flaky)
+    ids = [store.record(f'Topic {i}', CONTENT, 'gpt2') for i in range(2)]
+    with pytest.raises(sqlite3.OperationalError):
+        store._write_batch(block=False)
+    # Both rows failed and are still pending and queued
+    assert set(store._pending) == set(ids) and store._queue.qsize() == 2
+    store.flush()
+    assert store.written == 2 and not store._pending and store.dropped == 0
+    assert all(store.get(content_id) is not None for content_id in ids)
+
+
+def test_bad_row_is_dropped_without_holding_back_the_batch(store):
+    good = store.record('Good', CONTENT, 'gpt2')
+    bad = store.record('Bad', dict(CONTENT, script=object()), 'gpt2')
+    for _ in range(store.max_attempts):
+        store.flush()
+    assert store.written == 1 and store.dropped == 1
+    assert store.get(good) is not None
+    assert store.get(bad) is None
+    assert not store._pending and not store._failures and store._queue.empty()
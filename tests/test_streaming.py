@@ -0,0 +1,103 @@
+import json
+import time
+
+import pytest
+
+from benchmarks.mock_upstreams import MockInferenceServer, _TOKEN_RE, sample_response
+from inference import InferenceClient, UpstreamError
+
+
+@pytest.fixture
+def upstream():
+    server = MockInferenceServer(port=0).start()
+    yield server
+    server.stop()
+
+
+def test_stream_yields_only_the_continuation(upstream):
+    client = InferenceClient(upstream.url)
+    prompt = 'Make a video about "5 Interesting and Unknown Facts About Squid"'
+    chunks = list(client.stream_text('gpt2', prompt, {}))
+    assert len(chunks) > 100
+    assert ''.join(chunks) == f"\n\n{sample_response('Squid')}"
+    assert upstream.tokens_sent == len(chunks)
+
+
+def test_closing_the_stream_stops_the_upstream(upstream):
+    upstream.token_latency = 0.005
+    client = InferenceClient(upstream.url)
+    stream = client.stream_text('gpt2', 'Unknown Facts About Squid"', {})
+    for _ in range(5):
+        next(stream)
+    stream.close()
+    time.sleep(0.2)
+    total = len(_TOKEN_RE.findall(f"\n\n{sample_response('Squid')}"))
+    assert upstream.tokens_sent < total / 2
+
+
+def test_plain_json_answer_is_one_chunk(monkeypatch):
+    class Response:
+        status_code = 200
+        headers = {'Content-Type': 'application/json'}
+
+        def json(self):
+            return [{'generated_text': 'prompt and the rest'}]
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            pass
+
+    client = InferenceClient('http://upstream/')
+    monkeypatch.setattr(client, '_send', lambda model, payload, stream=False: Response())
+    assert list(client.stream_text('gpt2', 'prompt', {})) == [' and the rest']
+
+
+def test_error_event_raises(monkeypatch):
+    class Response:
+        status_code = 200
+        headers = {'Content-Type': 'text/event-stream'}
+
+        def iter_lines(self, decode_unicode=False):
+            yield 'data: ' + json.dumps({'token': {'text': 'Hi'}})
+            yield ''
+            yield 'data: ' + json.dumps({'token': {'text': '</s>', 'special': True}})
+            yield 'data: ' + json.dumps({'error': 'overloaded'})
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            pass
+
+    client = InferenceClient('http://upstream/')
+    monkeypatch.setattr(client, '_send', lambda model, payload, stream=False: Response())
+    stream = client.stream_text('gpt2', 'prompt', {})
+    assert next(stream) == 'Hi'
+    with pytest.raises(UpstreamError, match='overloaded'):
+        next(stream)
+
+
+def sse_events(text):
+    events = []
+    for block in text.split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if 'event' in lines:
+            events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def test_generate_stream_route(upstream, monkeypatch):
+    app = pytest.importorskip('app')
+    monkeypatch.setattr(app, 'inference_backend', InferenceClient(upstream.url))
+    response = app.app.test_client().get('/generate/stream?topic=Streaming%20Squid')
+    assert response.mimetype == 'text/event-stream'
+    events = sse_events(response.get_data(as_text=True))
+    kinds = [kind for kind, _ in events]
+    assert kinds[0] == 'token' and kinds[-1] == 'done'
+    assert kinds.index('section') > kinds.index('token')
+    sections = {data['name']: data['value'] for kind, data in events if kind == 'section'}
+    assert sections['video_name'] and len(sections['image_prompts']) == 7
+    assert events[-1][1]['success'] and not events[-1][1]['fallback']
+    assert ''.join(data['text'] for kind, data in events if kind == 'token').startswith('\n\n🧠')
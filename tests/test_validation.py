@@ -0,0 +1,205 @@
+import re
+
+import pytest
+
+from benchmarks.mock_upstreams import sample_response
+from prompts import PromptRegistry, TokenCounter
+from sections import SECTION_NAMES, parse_sections
+from validation import SECTION_END_RES, SECTION_HEADERS, SectionRepairer, StreamValidator, validated_stream
+
+TOKEN_RE = re.compile(r'\s*\S+|\s+')
+
+SAMPLE = sample_response('Squid')
+PARTS = SAMPLE.split('\n---\n')
+WITHOUT_TITLE = '\n---\n'.join(PARTS[:2] + PARTS[3:])
+
+
+class TokenStream:
+    """A model's token stream that remembers how far it was read and whether it was closed"""
+
+    def __init__(self, text):
+        self.tokens = TOKEN_RE.findall(text)
+        self.read = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.closed or self.read == len(self.tokens):
+            raise StopIteration
+        self.read += 1
+        return self.tokens[self.read - 1]
+
+    def close(self):
+        self.closed = True
+
+
+def validate(text, **kwargs):
+    validator = StreamValidator(**kwargs)
+    stream = TokenStream(text)
+    events = list(validated_stream(stream, validator))
+    return validator, stream, events
+
+
+def test_sample_response_streamed_as_tokens():
+    validator, stream, events = validate(SAMPLE)
+    assert validator.verdict == 'complete'
+    assert validator.missing() == []
+    assert validator.content == parse_sections(SAMPLE)
+    assert [value for kind, value in events if kind == 'section'] == [
+        (name, validator.content[name]) for name in SECTION_NAMES]
+    assert ''.join(value for kind, value in events if kind == 'token') == SAMPLE
+    assert stream.closed
+
+
+def test_stops_reading_once_complete():
+    validator, stream, _ = validate(SAMPLE + '\n\n' + SAMPLE)
+    assert validator.verdict == 'complete'
+    assert validator.content == parse_sections(SAMPLE)
+    assert stream.read < len(stream.tokens) // 2 + 10
+    assert stream.closed
+
+
+def test_dropped_section_is_truncated():
+    validator, stream, _ = validate(WITHOUT_TITLE)
+    assert validator.verdict == 'truncated'
+    assert validator.missing() == ['video_name']
+    assert validator.content['meta_tags'].startswith('#shorts')
+    assert stream.read == len(stream.tokens)
+
+
+def test_dropped_section_then_starting_over_is_repeated():
+    validator, stream, _ = validate(WITHOUT_TITLE + '\n\n' + SAMPLE)
+    assert validator.verdict == 'repeated'
+    assert validator.missing() == ['video_name']
+    # The script from the second pass is not kept
+    assert validator.content['script'] == parse_sections(SAMPLE)['script']
+    assert stream.read < len(stream.tokens)
+
+
+def test_looping_tail():
+    text = '\n---\n'.join(PARTS[:2]) + '\n\n' + 'And that is a fact.\n' * 40
+    validator, stream, _ = validate(text)
+    assert validator.verdict == 'looping'
+    # The image prompts were still open when the loop began, so they are dropped
+    assert validator.missing() == ['image_prompts', 'video_name', 'description', 'meta_tags']
+    assert validator.content['script'] == parse_sections(SAMPLE)['script']
+    assert stream.read < len(stream.tokens)
+
+
+@pytest.mark.parametrize('text', [
+    'Squid are fascinating animals. ' * 100,
+    ''.join(f'Squid fact number {i} is that they are fascinating.\n' for i in range(100)),
+], ids=['one_line', 'many_lines'])
+def test_headerless_ramble(text):
+    validator, stream, _ = validate(text, max_preamble_chars=800)
+    assert validator.verdict == 'no_sections'
+    assert validator.missing() == list(SECTION_NAMES)
+    assert stream.read < len(stream.tokens)
+
+
+def test_opened_header_is_not_part_of_the_text():
+    header = SECTION_HEADERS['video_name']
+    validator, stream, _ = validate('\n\n5 Facts About Squid!\n\nMore text the model added\n',
+                                    expected=('video_name',), opened=header)
+    assert validator.verdict == 'complete'
+    assert validator.content['video_name'] == '5 Facts About Squid!'
+    assert header not in validator.text
+    assert validator.text.startswith('\n\n5 Facts About Squid!')
+
+
+@pytest.mark.parametrize('name, body, end', [
+    ('script', '[HOOK]\nHi!\n\n[OUTRO]\nLike and follow!\n\nSurplus', 'Like and follow!\n\n'),
+    ('script', '[HOOK]\nHi!\n\n[OUTRO] Like and follow!\nThanks!\n\nSurplus', 'Thanks!\n\n'),
+    ('image_prompts', '[INTRO IMAGE]\nA squid.\n\n[OUTRO IMAGE]\nA wave.\n\nSurplus', 'A wave.\n\n'),
+    ('video_name', '\nSquid Facts!\n\nSurplus', 'Squid Facts!\n\n'),
+    ('meta_tags', '#shorts #squid\n\nSurplus', '#squid\n\n'),
+])
+def test_section_end(name, body, end):
+    match = SECTION_END_RES[name].search(body)
+    assert match is not None
+    assert body[:match.end()].endswith(end)
+
+
+def test_script_does_not_end_before_its_outro():
+    assert SECTION_END_RES['script'].search('[HOOK]\nHi!\n\n[FACT 1]\nSquid have three hearts.\n\n') is None
+
+
+class StubBackend:
+    """Answers a targeted prompt with the reply for the section header it ends with"""
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.prompts = []
+
+    def _reply(self, prompt):
+        self.prompts.append(prompt)
+        for name, header in SECTION_HEADERS.items():
+            if prompt.rstrip().endswith(header):
+                return self.replies.get(name, '')
+        return ''
+
+    def stream_text(self, model, prompt, parameters):
+        yield from TOKEN_RE.findall(self._reply(prompt))
+
+    def generate_text(self, model, prompt, parameters):
+        return prompt + self._reply(prompt)
+
+
+def make_repairer(replies, stream=True):
+    prompts = PromptRegistry(TokenCounter('gpt2', use_tokenizer=False), log_usage=False)
+    return SectionRepairer(StubBackend(replies), 'gpt2', {'max_length': 1000, 'temperature': 0.7},
+                           prompts, stream=stream, max_workers=2)
+
+
+@pytest.mark.parametrize('stream', [True, False], ids=['streamed', 'whole'])
+def test_single_section_repair(stream):
+    repairer = make_repairer({'video_name': '\n\nSquid Secrets Revealed!\n\nSquid Secrets Revealed!\n'}, stream)
+    assert repairer.repair('Squid', ['video_name']) == {'video_name': 'Squid Secrets Revealed!'}
+    prompt, = repairer.backend.prompts
+    assert 'Squid' in prompt and prompt.rstrip().endswith(SECTION_HEADERS['video_name'])
+
+
+def test_repair_leaves_out_sections_that_did_not_come_out():
+    repairer = make_repairer({'description': 'Squid are smart. Follow for more amazing facts!\n\n'})
+    assert repairer.repair('Squid', ['video_name', 'description']) == {
+        'description': 'Squid are smart. Follow for more amazing facts!'}
+
+
+@pytest.fixture
+def app_module(monkeypatch):
+    app = pytest.importorskip('app')
+    monkeypatch.setattr(app, 'REPAIR_MAX_SECTIONS', 3)
+    return app
+
+
+def truncated_validator(text):
+    validator, _, _ = validate(text)
+    assert validator.verdict == 'truncated'
+    return validator
+
+
+def test_complete_sections_merges_the_repaired_section(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'section_repairer', make_repairer({'video_name': '\n\nSquid Secrets!\n\n'}))
+    content, complete = app_module.complete_sections('Squid', truncated_validator(WITHOUT_TITLE))
+    assert complete and not content.is_fallback
+    assert content.video_name == 'Squid Secrets!'
+    assert content.script == parse_sections(SAMPLE)['script']
+    assert content.meta_tags == parse_sections(SAMPLE)['meta_tags']
+
+
+def test_complete_sections_marks_fallback_filled_results(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'section_repairer', make_repairer({}))
+    content, complete = app_module.complete_sections('Squid', truncated_validator(WITHOUT_TITLE))
+    assert not complete and content.is_fallback
+    assert content.video_name == app_module.generate_fallback_content('Squid').video_name
+    assert content.script == parse_sections(SAMPLE)['script']
+
+
+def test_complete_sections_gives_up_on_mostly_missing_output(app_module, monkeypatch):
+    repairer = make_repairer({})
+    monkeypatch.setattr(app_module, 'section_repairer', repairer)
+    content, complete = app_module.complete_sections('Squid', truncated_validator(PARTS[0]))
+    assert (content, complete) == (None, False)
+    assert repairer.backend.prompts == []
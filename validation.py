@@ -0,0 +1,253 @@
+"""Checks model output while it streams in, and regenerates only the sections it lacks
+
+A StreamValidator reads the generated text line by line and decides when
+reading further is pointless: once every section is in, or as soon as the
+output is clearly malformed. The stream is then closed, so the upstream
+stops generating tokens nobody will use. Sections that are still missing
+are regenerated one at a time with short prompts that ask for that section
+alone, instead of throwing the rest of the output away.
+"""
+
+import contextvars
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import REPAIRS, stage
+from prompts import continuation
+from sections import HEADER_RE, SECTION_NAMES, SEPARATOR_RE, SectionStreamParser
+
+_LINE_RE = re.compile(r'[^\n]*\n|[^\n]+')
+
+# Where the last outstanding section may be taken as finished without waiting
+# for a separator or another header: the end of its first paragraph, or of
+# the paragraph after its OUTRO label
+_PARAGRAPH_END_RE = re.compile(r'\S[^\n]*\n[ \t]*\n')
+_OUTRO_END_RE = re.compile(
+    r'^[^\w\n]*\[?OUTRO\b[^\]\n]*\]?:?[ \t]*(?:\S[^\n]*\n|\n(?:[ \t]*\S[^\n]*\n)+)'
+    r'(?:[ \t]*\S[^\n]*\n)*[ \t]*\n',
+    re.MULTILINE | re.IGNORECASE,
+)
+SECTION_END_RES = {
+    'script': _OUTRO_END_RE,
+    'image_prompts': _OUTRO_END_RE,
+    'video_name': _PARAGRAPH_END_RE,
+    'description': _PARAGRAPH_END_RE,
+    'meta_tags': _PARAGRAPH_END_RE,
+}
+
+# The content prompt's section headers, which targeted prompts end with
+SECTION_HEADERS = {
+    'script': '🧠 **1. Video Script (2-3 minutes max):**',
+    'image_prompts': '🖼️ **2. AI Image Generation Prompts:**',
+    'video_name': '🎬 **3. YouTube Shorts Title:**',
+    'description': '📄 **4. Video Description (SEO Optimized):**',
+    'meta_tags': '🏷️ **5. Meta Tags / Hashtags:**',
+}
+
+_CONTEXT = 'You are a creative content producer making a YouTube Short titled "5 Interesting and Unknown Facts About {topic}".'
+
+SECTION_PROMPTS = {
+    'script': _CONTEXT + (
+        "\n\nWrite the script: a hook in the first 10 seconds, five surprising facts of 3-5 sentences each"
+        " and an outro asking viewers to like and follow. Label the parts [HOOK], [FACT 1] to [FACT 5] and [OUTRO]."),
+    'image_prompts': _CONTEXT + (
+        "\n\nWrite 7 detailed, vivid image prompts with a 9:16 vertical aspect ratio, labelled"
+        " [INTRO IMAGE], [FACT 1 IMAGE] to [FACT 5 IMAGE] and [OUTRO IMAGE]."),
+    'video_name': _CONTEXT + (
+        "\n\nWrite one click-worthy, SEO-friendly title of at most 80 characters."),
+    'description': _CONTEXT + (
+        '\n\nWrite a 2-4 line SEO description of the video ending with "Follow for more amazing facts!"'),
+    'meta_tags': _CONTEXT + (
+        "\n\nList 10-15 relevant tags and hashtags on one line, including #shorts and #didyouknow."),
+}
+
+# Generated tokens allowed per targeted prompt
+SECTION_MAX_NEW_TOKENS = {
+    'script': 600,
+    'image_prompts': 450,
+    'video_name': 32,
+    'description': 120,
+    'meta_tags': 80,
+}
+
+
+class StreamValidator:
+    """Sectioned model output, checked line by line as it arrives
+
+    feed() returns the sections completed by the new text (like
+    SectionStreamParser.feed) and sets `verdict` once reading further is
+    pointless:
+
+    - 'complete': every expected section is in. The last one is taken as
+      finished at the end of its paragraph (after the outro, for the script
+      and image prompts), since models rarely close it with a separator.
+    - 'repeated': a section that was already complete starts over, i.e. the
+      model has looped back to the beginning.
+    - 'looping': the same line has come out max_repeats times.
+    - 'no_sections': max_preamble_chars of output without a section header.
+
+    close() sets 'complete' or 'truncated' if the stream ran out first.
+    A section cut short by a malformed verdict is dropped, not kept.
+    """
+
+    def __init__(self, expected=SECTION_NAMES, max_preamble_chars=800, max_repeats=3, opened=None):
+        self.expected = tuple(expected)
+        self.max_preamble_chars = max_preamble_chars
+        self.max_repeats = max_repeats
+        self.parser = SectionStreamParser()
+        if opened:
+            # The prompt ended with this header: the output starts inside its section
+            self.parser.feed(opened + '\n')
+        self._offset = len(self.parser.text)
+        self._line_start = self._offset
+        self._lines = Counter()
+        self.done = set()
+        self.verdict = None
+
+    @property
+    def text(self):
+        """The generated text read so far"""
+        return self.parser.text[self._offset:]
+
+    @property
+    def content(self):
+        return self.parser.content
+
+    def missing(self):
+        return [name for name in self.expected if not self.parser.content[name]]
+
+    def feed(self, chunk):
+        completed = []
+        # Most tokens hold no line break and go to the parser as they are
+        for piece in _LINE_RE.findall(chunk) if '\n' in chunk else (chunk,):
+            if self.verdict is not None:
+                break
+            sections = self.parser.feed(piece)
+            if sections:
+                completed += self._completed(sections)
+            if piece.endswith('\n'):
+                completed += self._check_line()
+            elif self._headerless():
+                # A model that never breaks the line is caught here
+                self.verdict = 'no_sections'
+        return completed
+
+    def close(self):
+        completed = self._completed(self.parser.close())
+        if self.verdict is None:
+            self.verdict = 'truncated' if self.missing() else 'complete'
+        return completed
+
+    def _completed(self, sections):
+        self.done.update(name for name, _ in sections)
+        return sections
+
+    def _headerless(self):
+        return (not self.done and len(self.parser.text) - self._offset > self.max_preamble_chars
+                and self.parser.open_section() is None)
+
+    def _check_line(self):
+        line = self.parser.text[self._line_start:]
+        self._line_start = len(self.parser.text)
+        current = self.parser.open_section()
+
+        if all(name in self.done for name in self.expected):
+            # Whatever has started since is surplus
+            self.parser.discard()
+            self.verdict = 'complete'
+            return []
+        if current is not None and current[0] in self.done:
+            self.parser.discard()
+            self.verdict = 'repeated'
+            return []
+        if self._headerless():
+            self.verdict = 'no_sections'
+            return []
+
+        key = ' '.join(line.split()).lower()
+        if key and not SEPARATOR_RE.fullmatch(line.strip()) and not HEADER_RE.match(line):
+            self._lines[key] += 1
+            if self._lines[key] >= self.max_repeats:
+                self.parser.discard()
+                self.verdict = 'looping'
+                return []
+
+        remaining = [name for name in self.expected if name not in self.done]
+        if len(remaining) == 1 and current is not None and current[0] == remaining[0]:
+            end = SECTION_END_RES[current[0]].search(self.parser.text, current[1])
+            if end is not None:
+                completed = self._completed(self.parser.close(end.end()))
+                if not self.missing():
+                    self.verdict = 'complete'
+                return completed
+        return []
+
+
+def validated_stream(chunks, validator):
+    """Yield ('token', text) and ('section', (name, value)) until the validator has a verdict
+
+    Reading stops there and the stream is closed, which drops the upstream
+    HTTP stream (or stops local generation) instead of letting the model
+    run on to its token limit. A plain list of chunks works too.
+    """
+    try:
+        for chunk in chunks:
+            yield 'token', chunk
+            for section in validator.feed(chunk):
+                yield 'section', section
+            if validator.verdict is not None:
+                break
+        for section in validator.close():
+            yield 'section', section
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+class SectionRepairer:
+    """Regenerates individual sections with short prompts that ask for one section each"""
+
+    def __init__(self, backend, model, parameters, prompts, stream=True, max_workers=4):
+        self.backend = backend
+        self.model = model
+        # Targeted prompts cap the new tokens themselves; drop the overall length
+        self.parameters = {k: v for k, v in parameters.items() if k not in ('max_length', 'max_new_tokens')}
+        self.prompts = prompts
+        self.stream = stream
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='repair')
+
+    def section(self, topic, name):
+        """One section generated on its own, or '' / [] if the model didn't produce it"""
+        header = SECTION_HEADERS[name]
+        prompt = self.prompts.build(f"{SECTION_PROMPTS[name]}\n\n{header}\n", topic)
+        parameters = dict(self.parameters, max_new_tokens=SECTION_MAX_NEW_TOKENS[name])
+        validator = StreamValidator(expected=(name,), opened=header)
+        with stage(f'repair_{name}'):
+            if self.stream:
+                chunks = self.backend.stream_text(self.model, prompt.text, parameters)
+            else:
+                chunks = [continuation(prompt, self.backend.generate_text(self.model, prompt.text, parameters))]
+            for _ in validated_stream(chunks, validator):
+                pass
+        self.prompts.record(prompt, validator.text, f"{topic} ({name})")
+        return validator.content[name]
+
+    def repair(self, topic, names):
+        """Regenerate the named sections concurrently; returns {name: value} for those that came out"""
+        # Copy the context so the upstream priority and deadline carry over
+        futures = {name: self._executor.submit(contextvars.copy_context().run, self.section, topic, name)
+                   for name in names}
+        repaired = {}
+        for name, future in futures.items():
+            try:
+                value = future.result()
+            except Exception as e:
+                print(f"Error regenerating {name}: {e}")
+                REPAIRS.inc(name, 'error')
+                continue
+            REPAIRS.inc(name, 'ok' if value else 'empty')
+            if value:
+                repaired[name] = value
+        return repaired